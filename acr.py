@@ -12,6 +12,14 @@
 # Start the script running using:
 #    python3 acr.py
 #
+# or, without a Raspberry Pi, with simulated GPIO, FM radio, mpd,
+# mixer and crontab (see hal.py):
+#    ACR_BACKEND=sim python3 acr.py
+#
+# ACR_RECORD=trace.txt records every button pressed, and with
+# ACR_BACKEND=sim, ACR_REPLAY=trace.txt presses them again (see
+# replay.py)
+#
 # acr.py was tested on a Raspberry Pi 3 model B+ running raspbian
 #
 # raspbian stretch comes with smbus, wiringPi and i2cdetect installed
@@ -54,6 +62,10 @@
 #    m3u files
 #       $ scp * pi@<your-hostname>:Stations/.
 #
+#    stationcheck.py tries every stream in all_stations.m3u and marks the
+#    ones that do not work, back and next skip them
+#       $ python3 stationcheck.py
+#
 #    FM radio needs an LM386 FM breakout board and its own analog amplifier.
 #
 #       Icstation LM386 Mini Mono Audio Amplifier Power Amp Module 5V-12V
@@ -71,7 +83,8 @@
 #
 #       Logs are stored here:
 #          /var/log/mpd/mpd.log
-#          /home/pi/radio/acr.log
+#          /home/pi/radio/acr.log (older ones are acr.log.1 ...)
+#          /home/pi/radio/acr.crash (the last messages before a crash)
 #
 #       mpd song playlists are different than streaming radio station
 #       playlists. Playlists are stored here:
@@ -91,9 +104,15 @@
 #          man mpd
 #          man mpc
 #
+#       acr.py does not run mpc. It keeps one connection open to mpd
+#       using mpdclient.py. fakempd.py is a stand-in for mpd that
+#       can be used to try things out without a Raspberry Pi
+#
 #       MPD playlists won't work for streaming radio:
 #          created a data structure to store a streaming playlist
 #          mpd only keeps the stream. Want to search on the description
+#          stationcatalog.py loads the stations and searches the
+#          station, brief and long descriptions
 #
 # Use only one tkinter layout manager. Pick one of: grid, place or pack
 # This script uses tkinter's grid manager. Do not mix the layout managers
@@ -114,6 +133,12 @@
 #   Use comma to specify multiples 0 5 * * 1,2,3,4,5 to run alarm
 #   every business day
 #
+#   The alarms are saved in /home/pi/radio/alarms.json. Each one has a
+#   crontab job with the comment acr-alarm-<id>, see alarmstore.py
+#   While acr.py is running it sounds the alarms itself in the mode
+#   the alarm was set in (alarmscheduler.py), the crontab job only
+#   plays when acr.py is not running
+#
 # More about the FM Radio:
 #   An Si4703 breakout board is connected to a Raspberry Pi 3
 #   as follows:
@@ -125,9 +150,14 @@
 #      3   SDA/SDIO   3   I2C SDA (GPIO2)
 #      4   SCLK       5   I2C SCL (GPIO3)
 #      6   RST        34  GPIO16
+#      7   GPIO2      optional, any free GPIO, set fmStcPin to its BCM
+#                     number to use the tune complete interrupt
 #
 #      Note: there are multiple Si4703 breakout boards and pin outs differ
 #
+#   In FM mode the song row shows the station name and RadioText the
+#   station sends over RDS, see rds.py
+#
 #   The original FM radio script is from:
 #      Author: KansasCoder
 #      Source: https://www.raspberrypi.org/forums/viewtopic.php?t=28920
@@ -163,14 +193,38 @@
 
 #########################
 import time
-import datetime
 import os
 import sys
-import subprocess
+import traceback
 import tkinter as tk
-from crontab import CronTab
-import RPi.GPIO as GPIO
-import smbus
+import hal
+from mpdclient import MPDClient, MPDError
+from musiclibrary import syncPlaylist
+from nowplaying import NowPlayingWatcher
+from executor import CommandExecutor, cancelled
+from coalesce import Coalescer
+from clock import MinuteClock
+from viewmodel import ViewModel
+from assets import Assets
+from fmscan import FmScanner, frequency, channelOf
+from rds import RdsPoller
+from stationcatalog import StationCatalog
+from alarmstore import AlarmStore
+from alarmscheduler import AlarmScheduler, untilText
+from mixer import Ramper, EASE_IN
+from si4703 import Si4703, POWERCFG, SYSCONFIG1, SYSCONFIG2, SYSCONFIG3, OSCILLATOR, READCHAN, RDS, RDSM, BAND_BOTTOM, LAST_CHANNEL
+from startup import Startup
+from replay import Inputs, Replayer, readTrace, RECORD, REPLAY, REPLAY_SPEED
+from acrlog import LogWriter, DEBUG, INFO, WARNING, ERROR
+from metrics import Metrics, LoopLag, MetricsServer
+from watchdog import Watchdog
+
+# RPi.GPIO, or a simulation with ACR_BACKEND=sim, see hal.py
+GPIO = hal.openGpio()
+hal.prepareHome()
+
+# times each stage of starting up, see startStages
+startup = Startup()
 
 #########################
 # Global Constants
@@ -180,29 +234,13 @@ import smbus
 RST = 16
 SDA = 2
 
-#   Register Descriptions
-DEVICEID = 0x00
-CHIPID = 0x01
-POWERCFG = 0x02
-CHANNEL = 0x03
-SYSCONFIG1 = 0x04
-SYSCONFIG2 = 0x05
-SYSCONFIG3 = 0x06
-OSCILLATOR = 0x07
-STATUSRSSI = 0x0A
-READCHAN = 0x0B
-RDSA = 0x0C
-RDSB = 0x0D
-RDSC = 0x0E
-RDSD = 0x0F
-
-#   Si4703 Address
-#     Need to find the address of the Si4703
-#     This is a bit complicated, because the output won't show
-#     correctly until it works. The command to run is:
-#
-#       $ i2cdetect -y 1
-SI4703_Address = 0x10
+#   BCM pin wired to GPIO2 on the Si4703, None polls for tune complete
+fmStcPin = None
+
+#   give up on a tune after this many seconds
+fmTuneTimeout = 1.0
+
+#   Register descriptions and the Si4703 address are in si4703.py
 
 # FM stations are specified without the dot, so 94.7 is 947
 DefaultRadioStation = 947
@@ -210,13 +248,23 @@ DefaultRadioStation = 947
 
 #########################
 # Global Variables
-fileLog = open('/home/pi/radio/acr.log', 'w+')
-currentStationConfig = '/home/pi/radio/streamPlayer.conf'
-tempStationFile = '/home/pi/radio/streamPlayer.tmp'
-allStationsFile = '/home/pi/Stations/playlists/all_stations.m3u'
-
-directoryStations = "/home/pi/Stations"
-directoryStationsPlaylist = "/home/pi/Stations/playlists"
+# acr.log is written by its own thread, see acrlog.py
+acrLog = LogWriter(hal.path('radio', 'acr.log'))
+# the last log messages are saved here when acr.py crashes
+crashFile = hal.path('radio', 'acr.crash')
+
+# call counts and latencies are served on http://127.0.0.1:metricsPort/
+# and summarized in the log every metricsInterval seconds
+metricsPort = 8077
+metricsInterval = 600
+metricsServer = None
+currentStationConfig = hal.path('radio', 'streamPlayer.conf')
+allStationsFile = hal.path('Stations', 'playlists', 'all_stations.m3u')
+# parsed and indexed allStationsFile, rebuilt when allStationsFile changes
+stationCacheFile = hal.path('radio', 'stations.cache')
+
+directoryStations = hal.path('Stations')
+directoryStationsPlaylist = hal.path('Stations', 'playlists')
 
 defaultVolume = 60
 currentVolume = defaultVolume
@@ -224,8 +272,40 @@ fmVolume = 0
 
 muteVolume = False
 
-my_cron = CronTab(user='pi')
-alarms = []
+# crontab is read by startAlarms, after the clock is showing
+my_cron = None
+# each alarm starts its source muted a little before the alarm time
+# (see LEAD_TIMES in alarmstore.py) and unmutes it on time
+#   the alarm that has been started muted
+prewarmedAlarm = None
+#   the alarm being prewarmed and the after() job that undoes the
+#   prewarm if the alarm has not gone off prewarmMarginSeconds after
+#   its time, it may have been removed or skipped
+prewarmingAlarm = None
+prewarmJob = None
+prewarmMarginSeconds = 60
+#   the mode before the prewarm changed to the alarm's source, an
+#   undone prewarm changes back to it
+prewarmModeBefore = None
+#   True while the Digital volume is 0, a prewarm the alarm did not
+#   unmute leaves it muted
+digitalMuted = False
+#   seconds to wait for mpd to start playing at the alarm time
+alarmAudioTimeout = 30
+#   seconds the alarm takes to fade in to its volume
+alarmFadeSeconds = 30
+
+# sleep timer, hold the stop button for sleepHoldSeconds while playing
+# and the radio fades out and stops after sleepTimerMinutes
+sleepHoldSeconds = 1.0
+sleepTimerMinutes = 30
+sleepFadeSeconds = 60
+#   time the sleep timer was started, tkinter after id of the fade
+playPressedAt = None
+sleepAt = None
+sleepTimerJob = None
+# the alarms, see alarmstore.py
+alarmsFile = hal.path('radio', 'alarms.json')
 
 # Buttons on 2.8 capacitive touch PiTFT
 channel_list = [17, 22, 23, 27]
@@ -242,11 +322,17 @@ GPIO.setup(12, GPIO.OUT)
 backlight = GPIO.PWM(12, 1000)
 backlight.start(100)
 
+# every touchscreen and PiTFT button goes through inputs, so they can
+# be recorded and replayed, see replay.py
+inputs = Inputs(GPIO)
+
 # Global song variables
-currentSongConfig = '/home/pi/radio/acr.conf'
-tempSongFile = '/home/pi/radio/acr.tmp'
+currentSongConfig = hal.path('radio', 'acr.conf')
+
+directoryMusic = hal.path('Music')
 
-directoryMusic = "/home/pi/Music"
+# remembers when the songs playlist was last synced with directoryMusic
+musicStampFile = hal.path('radio', 'music.stamp')
 
 # mpd doesn't remember the current playlist
 # so, mpc has no way to retrieve it
@@ -264,6 +350,7 @@ currentSong = ""
 
 # data structure to store radio stations: station, brief, long and stream
 # mpd doesn't store enough meaningful information in the playlist
+# stationList is stationCatalog.stations
 stationList = list()
 
 # Instead of starting with the first station every time, remember last station
@@ -272,40 +359,51 @@ stationList = list()
 currentStation = ""
 cStation = 0
 
-# On mpc commands like play, prev and next, mpc outputs a line
-# similar to:
-#
-#    volume: n/a repeat: off random: off single: off consume: off
-#
-# adding the following to any mpc command suppresses that output
-limitMPCoutput = " | grep \"[-,'[']\""
-
-# FM Radio global variables
-#   what is this used for ???
-z = "000000000000000"
+# songs next and back presses not yet sent to mpd, + is forward
+songSkip = 0
 
-#   create #create 16 registers for SI4703
-reg = [int(0)] * 16
+# one connection to mpd is kept open for the life of the script
+# instead of running mpc through a shell for every command
+# the connection is opened on first use and reopened if mpd restarts
+hal.startMpd()
+mpd = MPDClient()
 
-#   create list to write registers
-#   only need to write registers 2-7 and since first byte is in the write
-#   command then only need 11 bytes to write
-writereg = [int(0)] * 11
+# title of the song mpd is playing, kept up to date by nowPlaying
+nowPlayingTitle = ""
 
-#   read 32 bytes
-readreg = [int(0)] * 32
+# FM Radio global variables
+#   radio is an Si4703 object, it keeps a copy of the 16 registers
+#   and only writes or reads the ones that are needed
+#   it is created when the I2C bus is opened
+radio = None
 
 #   My favorite stations in Austin, TX
+#   used until a band scan has found the stations that can be received
 FavoriteFmStations=[937, 947, 955, 1023, 1035]
 #   start with FM station 947
 fmIndex = 1
 maxFmIndex = 4
 
+#   the band scan saves the stations it finds, strongest first, here
+#   next and back in FM mode step through them
+fmStationsFile = hal.path('radio', 'fm_stations.json')
+#   channels tuned by each scan command on the executor
+fmScanStep = 8
+#   fmScanner is created when the I2C bus is opened
+fmScanner = None
+
+#   station name and RadioText the FM station is sending over RDS
+#   rdsPoller reads them while FM mode is on
+fmStationName = ""
+fmRadioText = ""
+rdsPoller = None
+
 #########################
 # Global tkinter GUI variables
 
 # radioGUI is the main tkinter window
 # radioGUI has 6 columns and 6 rows, numbered 0..5
+hal.startDisplay()
 radioGUI = tk.Tk()
 # radioGUI.pack_propagate(0)
 
@@ -319,11 +417,20 @@ radioGUI.configure(background='black')
 radioGUI.overrideredirect(True)
 radioGUI.geometry("{0}x{1}+0+0".format(radioGUI.winfo_screenwidth(), radioGUI.winfo_screenheight()))
 
+# what the screen shows, widgets bind to a name in view and are only
+# redrawn when its value changes, at most once a frame
+view = ViewModel(radioGUI)
+
+# button images are loaded when first used, once each, and scaled to
+# the screen, see assets.py
+assets = Assets(radioGUI, hal.imagesDir(), hal.path('radio', 'cache'))
+
 # Global tkinter widget variables
 dateRow = 0
 dateText = tk.StringVar()
 dateLabel = tk.Label(radioGUI, font=('arial', 30, 'bold'), fg='red', bg='black', textvariable=dateText)
 dateLabel.grid(row=dateRow, columnspan=6)
+view.bind("date", dateText.set)
 
 timeRow = dateRow + 1
 timeText = tk.StringVar()
@@ -338,28 +445,33 @@ timeLabel = tk.Label(radioGUI, font=('digital-7', 120), fg='red', bg='black', te
 timeLabel.grid(row=timeRow, columnspan=6)
 # pady can work with no \n but uses space above time
 timeLabel.configure(pady=30)
+view.bind("time", timeText.set)
 
 songRow = timeRow + 1
 songText = tk.StringVar()
 songLabel = tk.Label(radioGUI, font=('arial', 20), fg='red', bg='black', textvariable=songText, anchor='s')
 songLabel.grid(row=songRow, columnspan=6)
-songText.set(" ")
+view.bind("song", songText.set)
+view.set("song", " ")
 
 alarmRow = songRow + 1
 alarmHour = 6
 alarmHourText = tk.StringVar()
-alarmHourText.set(str(alarmHour).zfill(2))
+view.bind("alarmHour", lambda hour: alarmHourText.set(str(hour).zfill(2)))
+view.set("alarmHour", alarmHour)
 
 alarmMinute = 0
 alarmMinuteText = tk.StringVar()
-alarmMinuteText.set(str(alarmMinute).zfill(2))
+view.bind("alarmMinute", lambda minute: alarmMinuteText.set(str(minute).zfill(2)))
+view.set("alarmMinute", alarmMinute)
 
 alarmText = tk.StringVar()
 alarmLabel = tk.Label(radioGUI, font=('arial', 30), fg='red', bg='black', textvariable=alarmText, anchor='n')
 alarmLabel.grid(row=alarmRow, columnspan=6)
+view.bind("alarmText", alarmText.set)
 
 alarmState = "off"
-alarmText.set("no alarm")
+view.set("alarmText", "no alarm")
 
 # event handler to toggle the TFT backlight
 def toggleBacklight(channel):
@@ -373,7 +485,7 @@ def toggleBacklight(channel):
         backlight.start(100)
 
 # PiTFT Button 17 toggles backlight on and off
-GPIO.add_event_detect(17, GPIO.FALLING, callback=toggleBacklight, bouncetime=200)
+GPIO.add_event_detect(17, GPIO.FALLING, callback=inputs.edge(toggleBacklight), bouncetime=200)
 
 # event handler to reboot the Raspberry Pi
 def reboot(channel):
@@ -382,10 +494,10 @@ def reboot(channel):
         time.sleep(0.02)
     if (time.time() - startTime) > 2:
         cmd = "sudo reboot"
-        subprocess.call(cmd, shell=True)
+        hal.runCommand(cmd, printMsg)
 
 # PiTFT Button 23 reboots the Raspberry Pi
-GPIO.add_event_detect(23, GPIO.FALLING, callback=reboot, bouncetime=200)
+GPIO.add_event_detect(23, GPIO.FALLING, callback=inputs.edge(reboot), bouncetime=200)
 
 # event handler to shutdown the Raspberry Pi
 def shutdown(channel):
@@ -394,10 +506,10 @@ def shutdown(channel):
         time.sleep(0.02)
     if (time.time() - startTime) > 2:
         cmd = "sudo shutdown -h 0"
-        subprocess.call(cmd, shell=True)
+        hal.runCommand(cmd, printMsg)
 
 # PiTFT Button 27 shuts down the Raspberry Pi
-GPIO.add_event_detect(27, GPIO.FALLING, callback=shutdown, bouncetime=200)
+GPIO.add_event_detect(27, GPIO.FALLING, callback=inputs.edge(shutdown), bouncetime=200)
 
 # event handler to exit the script
 def exitButtonPress(channel):
@@ -410,149 +522,125 @@ def exitButtonPress(channel):
     radioGUI.quit()
 
 # PiTFT Button 22 exits this script
-GPIO.add_event_detect(22, GPIO.FALLING, callback=exitButtonPress, bouncetime=200)
+GPIO.add_event_detect(22, GPIO.FALLING, callback=inputs.edge(exitButtonPress), bouncetime=200)
+
+# mpc current shows "artist - title", only the title is wanted
+def songTitle(current):
+    if 'title' in current:
+        return current['title']
+    f = current.get('file', '')
+    return os.path.splitext(os.path.basename(f))[0]
 
 def songPlaying():
     song = " "
     if mode == "songs":
-        f = tempSongFile
-        cmd = "mpc current > " + f
-        subprocess.call(cmd, shell=True)
-        try:
-            fileSong = open(f, 'r')
-            songAndTitle = fileSong.readline()
-            i = songAndTitle.find("-") + 2
-            songAndNewline = songAndTitle[i:]
-            song = songAndNewline.rstrip()
-            fileSong.close()
-        except Exception as ex:
-            song = ""
+        song = nowPlayingTitle
 
-    if mode == "iradio":
+    # the stations are loaded on the executor after the mode changes
+    if mode == "iradio" and cStation < len(stationList):
         song = stationList[cStation][1]
 
     if mode == "fm":
         s = FavoriteFmStations[fmIndex] / 10.0
         song = str(s)
+        if fmRadioText != "":
+            song = fmRadioText
+        elif fmStationName != "":
+            song = str(s) + " " + fmStationName
 
     return song
 
-# GUI code
-def updateDate():
-    global dateText
-    global timeText
+def updateSongText():
+    view.set("song", songPlaying())
+
+# tkinter is not thread safe, other threads use guiCall to run
+# a function in the tkinter main loop
+def guiCall(fn, *args):
+    try:
+        radioGUI.after(0, fn, *args)
+    except RuntimeError:
+        # the main loop has already exited
+        pass
 
-    dt = datetime.datetime.now()
+def showNowPlaying(song):
+    global nowPlayingTitle
 
+    nowPlayingTitle = ""
+    if song:
+        nowPlayingTitle = songTitle(song)
+    updateSongText()
+
+# called on the nowPlaying thread whenever mpd reports a change
+def nowPlayingChanged(song, status):
+    guiCall(showNowPlaying, song)
+
+def showRds(ps, radioText):
+    global fmStationName
+    global fmRadioText
+
+    fmStationName = ps
+    fmRadioText = radioText
+    updateSongText()
+
+# called on the rdsPoller thread when the station name or RadioText changes
+def rdsChanged(ps, radioText):
+    guiCall(showRds, ps, radioText)
+
+# GUI code
+# minuteClock calls showTime when the minute changes and showDate when
+# the day changes, songText is updated by nowPlaying and the buttons
+def showDate(dt):
     dts = dt.strftime('%A %B %d, %Y')
-    dateText.set(dts)
+    view.set("date", dts)
 
+def showTime(dt):
     # without the '\n' the bottom part of the time
     # gets cropped ???
     tts = dt.strftime('%H:%M')
     # timeText.set(tts+'\n')
-    timeText.set(tts)
-
-    # update every 2 seconds, should be accurate enough
-    radioGUI.after(2000, updateDate)
+    view.set("time", tts)
 
-    # add songText.set to currently playing song
-    s = songPlaying()
-    songText.set(s)
+    # counts down to the next alarm
+    showAlarms()
 
 # Set Alarm Row
 # skip first column
 setAlarmRow = alarmRow + 1
 
-def readAlarms():
-    global alarms
-
-    # clear out the data structure
-    alarms = []
-
-    # read alarms from crontab and build data structure
-    i = 0
-    for job in my_cron:
-        c = str(job.comment)
-        if c.startswith('alarm'):
-            j = str(job)
-            alarms.append(j)
-            i += 1
-    return
+# alarms are kept in alarmStore, which writes crontab once per change
+# and sounded by alarmScheduler while acr.py is running
+# these run on the executor, crontab is written to the SD card
+def removeAlarm(id):
+    alarmStore.remove(id)
+    alarmScheduler.remove(id)
+    guiCall(alarmRemoved, id)
 
 def removeAllAlarms():
-    global alarms
-
-    # next remove all alarms
-    for a in alarms:
-        s = a.find('# alarm')
-        if s > 0:
-            s += 2 # skip the # and space
-            c = a[s:]
-            my_cron.remove_all(comment=c)
-            my_cron.write()
-    return
-
-def removeAlarm(n):
-    global alarms
-
-    # if an alarm is removed from the middle of crontab, then the alarm numbering is messed up
-    # all alarms must be removed and re-read
-
-    # first remove requested alarm
-    c = 'alarm' + str(n)
-    my_cron.remove_all(comment=c)
-    my_cron.write()
-
-    readAlarms()
-
-    # next remove all alarms from crontab keeping the data structure
-    removeAllAlarms()
-
-    # then put all alarms back into crontab with new numbers
-    i = 0
-    for a in alarms:
-        s = a.find('# alarm')
-        if s > 0:
-            j = a[:s]
-            c = 'alarm' + str(i)
-            job = my_cron.new(command='/usr/bin/mpc play', comment=c)
-            i += 1
-            # get crontab times
-            t = a.find('/')
-            t1 = a[:t]
-            l1 = t1.split(" ")
-            t2 = []
-            j = 0
-            for l in l1:
-                if l != '':
-                    if l.find("-") > 0:
-                        t2.append(l)
-                    else:
-                        t2.append(l)
-                    j += 1
-            job.setall(t2[0], t2[1], t2[2], t2[3], t2[4])
-            my_cron.write()
-
-    readAlarms()
+    alarmStore.removeAll()
+    alarmScheduler.setAlarms([])
+    guiCall(alarmRemoved, None)
 
 def setAlarm(h, m, dow):
-    global alarms
-    global currentVolume
+    # dow is a list of crontab days of the week, empty for every day
+    alarm = alarmStore.add(h, m, dow, mode, currentVolume)
+    alarmScheduler.add(alarm)
+    return alarm
 
-    c = 'alarm' + str(len(alarms))
-    cmd = '/usr/bin/mpc play; '
-    # need to escape % because it is a special character in crontab
-    cmd += "/usr/bin/amixer set Digital " + str(currentVolume) + "\%"
-    job = my_cron.new(command=cmd, comment=c)
-    if int(m) == 0:
-        m = '*'
-    job.setall(m, h, '*', '*', dow)
-    my_cron.write()
-
-    alarms = []
-    readAlarms()
-    return
+# show the next alarm and how long until it goes off in the alarm row
+def showAlarms():
+    global alarmState
+
+    alarm, when = alarmScheduler.next()
+    if alarm is not None:
+        alarmState = "on"
+        text = alarm.timeText() + "  in " + untilText(when - time.time())
+    else:
+        alarmState = "off"
+        text = "no alarm"
+    if sleepAt is not None:
+        text += "  sleep " + untilText(sleepAt - time.time())
+    view.set("alarm", alarmState)
+    view.set("alarmText", text)
 
 
 alarmHourLabel = tk.Label(radioGUI, textvariable=alarmHourText, font=('arial', 30, 'bold'), fg='red', bg='black')
@@ -560,17 +648,15 @@ alarmHourLabel.grid(row=setAlarmRow, column=1)
 
 def alarmHourPress():
     global alarmHour
-    global alarmHourText
 
     alarmHour += 1
     if alarmHour >= 12:
         alarmHour = 0
 
-    alarmHourText.set(str(alarmHour).zfill(2))
+    view.set("alarmHour", alarmHour)
 
 
-alarmHourImage = tk.PhotoImage(file='/home/pi/radio/images/up.gif')
-alarmHourButton = tk.Button(radioGUI, image=alarmHourImage, command=alarmHourPress, bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0)
+alarmHourButton = tk.Button(radioGUI, image=assets.get('up'), command=inputs.button('alarmHourPress', alarmHourPress), bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0)
 alarmHourButton.grid(row=setAlarmRow, column=2)
 
 alarmMinuteLabel = tk.Label(radioGUI, textvariable=alarmMinuteText, font=('arial', 30, 'bold'), fg='red', bg='black')
@@ -578,50 +664,42 @@ alarmMinuteLabel.grid(row=setAlarmRow, column=3)
 
 def alarmMinutePress():
     global alarmMinute
-    global alarmMinuteText
 
     alarmMinute += 5
     if alarmMinute >= 60:
         alarmMinute = 0
 
-    alarmMinuteText.set(str(alarmMinute).zfill(2))
+    view.set("alarmMinute", alarmMinute)
 
-alarmMinuteImage = tk.PhotoImage(file='/home/pi/radio/images/up.gif')
-alarmMinuteButton = tk.Button(radioGUI, image=alarmMinuteImage, command=alarmMinutePress, bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0)
+alarmMinuteButton = tk.Button(radioGUI, image=assets.get('up'), command=inputs.button('alarmMinutePress', alarmMinutePress), bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0)
 alarmMinuteButton.grid(row=setAlarmRow, column=4)
 
-alarmOnImage = tk.PhotoImage(file='/home/pi/radio/images/on.gif')
-alarmOffImage = tk.PhotoImage(file='/home/pi/radio/images/off.gif')
-
 def alarmOnOffPress():
     global alarmState
-    global alarmButton
-    global alarmText
     global currentVolume
 
     if alarmState == "on":
         # change from on to off
         alarmState = "off"
-        alarmButton.configure(image=alarmOnImage)
-        alarmText.set("no alarm")
+        view.set("alarm", alarmState)
+        view.set("alarmText", "no alarm")
 
         # clear alarm (clears all alarms)
         # for now only one alarm is supported
-        removeAllAlarms()
+        executor.submit("alarm", removeAllAlarms, onDone=lambda result: showAlarms(), onError=lambda ex: showAlarms())
     else:
         # change from off to on
         alarmState = "on"
-        alarmButton.configure(image=alarmOffImage)
-        alarmText.set(str(alarmHour).zfill(2) + ":" + str(alarmMinute).zfill(2))
+        view.set("alarm", alarmState)
+        view.set("alarmText", str(alarmHour).zfill(2) + ":" + str(alarmMinute).zfill(2))
 
-        dow ='*'
-        setAlarm(alarmHour, alarmMinute, dow)
+        dow = []
+        executor.submit("alarm", setAlarm, (alarmHour, alarmMinute, dow), onDone=lambda result: showAlarms(), onError=lambda ex: showAlarms())
 
-alarmButton = tk.Button(radioGUI, command=alarmOnOffPress, bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0)
-if alarmState == "on":
-    alarmButton.configure(image=alarmOffImage)
-else:
-    alarmButton.configure(image=alarmOnImage)
+alarmButton = tk.Button(radioGUI, command=inputs.button('alarmOnOffPress', alarmOnOffPress), bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0)
+# the button shows what pressing it does
+view.bind("alarm", lambda state: alarmButton.configure(image=assets.get('off' if state == "on" else 'on')))
+view.set("alarm", alarmState)
 alarmButton.grid(row=setAlarmRow, column=5)
 
 
@@ -629,155 +707,502 @@ alarmButton.grid(row=setAlarmRow, column=5)
 controlRow = setAlarmRow + 1
 # mode sets: FM, iRadio or Songs
 mode = "songs"
-songsImage = tk.PhotoImage(file='/home/pi/radio/images/songs.gif')
-fmImage = tk.PhotoImage(file='/home/pi/radio/images/fm.gif')
-iRadioImage = tk.PhotoImage(file='/home/pi/radio/images/iradio.gif')
-
-def modePress():
-    global mode
-    global modeButton
-    global playState
-    global fmVolume
-    global fmIndex
 
-    # when changing mode, stop and change states accordingly
-    playState = "off"
-    cmd = 'mpc stop'
-    subprocess.call(cmd, shell=True)
+# runs on the executor, the hardware side of modePress
+def changeMode(old_mode, new_mode):
+    mpd.stop()
     # ??? don't know if this is required
-    # cmd = 'mpc clear'
-    # subprocess.call(cmd, shell=True)
-    playStopButton.configure(image=playImage)
-
-    old_mode = mode
-    if old_mode == "songs":
-        # change from songs to FM
-        mode = "fm"
-        modeButton.configure(image=fmImage)
+    # mpd.clear()
 
-        cmd = "mpc stop " + limitMPCoutput
-        subprocess.call(cmd, shell=True)
+    if old_mode == "fm":
+        rdsPoller.pause()
+        guiCall(showRds, "", "")
+        setFmVolume(0)
 
+    if new_mode == "fm":
         initFM()
 
+        # the scan itself runs in steps after the mode change
+        if fmScanner.needsScan() and not fmScanner.scanning():
+            fmScanner.startRescan()
+
         s = FavoriteFmStations[fmIndex]
         printMsg("station = " + str(s))
         changeFmChannel(s)
-        fmVolume = 0
-        setFmVolume(fmVolume)
+        setFmVolume(0)
 
-    if old_mode == "fm":
-        # change from FM to iRadio
-        fmVolume = 0
-        setFmVolume(fmVolume)
-
-        # change from FM to iRadio
-        mode = "iradio"
-        modeButton.configure(image=iRadioImage)
+    if new_mode == "iradio":
         initStation()
 
-    if old_mode == "iradio":
-        # change from iRadio to songs
-        mode = "songs"
-        modeButton.configure(image=songsImage)
-
+    if new_mode == "songs":
         initPlaylist(defaultPlaylist)
         # initSong()
 
-modeButton = tk.Button(radioGUI, command=modePress, bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0)
-modeButton.configure(image=songsImage)
+def modeChanged(result):
+    updateSongText()
+    if mode == "fm" and fmScanner.scanning():
+        submitFmScan()
+
+# use the stations found by the last band scan
+def useScannedStations():
+    global FavoriteFmStations
+    global fmIndex
+    global maxFmIndex
+
+    stations = fmScanner.stations()
+    if not stations:
+        return
+
+    s = FavoriteFmStations[fmIndex]
+    FavoriteFmStations = stations
+    maxFmIndex = len(stations) - 1
+    if s in stations:
+        fmIndex = stations.index(s)
+    else:
+        fmIndex = 0
+
+def submitFmScan():
+    executor.submit("fm scan", scanFmBand, key="fm scan", onDone=fmScanStepped)
+
+# the scan stops tuning as soon as a press cancels its step or leaves
+# the FM radio
+def fmScanCancelled():
+    return cancelled() or mode != "fm" or playState == "on"
+
+# a press on FM must not wait behind the band scan: the scan step is
+# cancelled, and queued again behind the press's own command
+def submitBeforeFmScan(name, fn, args, key):
+    scanning = executor.cancel("fm scan")
+    executor.submit(name, fn, args, key=key)
+    if scanning:
+        submitFmScan()
+
+# runs on the executor, scans a few channels at a time so button
+# presses do not wait for the whole band
+def scanFmBand():
+    if mode != "fm" or playState == "on":
+        # scanning tunes away from the station, finish it next time
+        printMsg("FM scan paused")
+        return False
+    # RDS from the channels being scanned is not wanted
+    rdsPoller.pause()
+    return fmScanner.step(fmScanStep)
+
+def fmScanStepped(finished):
+    if finished:
+        useScannedStations()
+        updateSongText()
+        s = FavoriteFmStations[fmIndex]
+        executor.submit("tune", changeFmChannel, (s,), key="tune")
+    elif mode == "fm" and playState == "off":
+        submitFmScan()
+
+def setMode(new_mode):
+    global mode
+    global playState
+    global fmVolume
+
+    # presses still in the coalescer are sent for the mode they were
+    # made in
+    coalescer.flush()
+
+    # when changing mode, stop and change states accordingly
+    forgetPrewarm()
+    cancelSleepTimer()
+    restoreDigitalVolume()
+    playState = "off"
+    view.set("play", playState)
+
+    old_mode = mode
+    mode = new_mode
+    fmVolume = 0
+    view.set("mode", mode)
+
+    updateSongText()
+
+    # mode changes are never superseded, each one undoes the last
+    executor.submit("mode " + mode, changeMode, (old_mode, mode), onDone=modeChanged)
+
+# songs -> FM -> iRadio -> songs
+def modePress():
+    if mode == "songs":
+        setMode("fm")
+    elif mode == "fm":
+        setMode("iradio")
+    else:
+        setMode("songs")
+
+modeButton = tk.Button(radioGUI, command=inputs.button('modePress', modePress), bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0)
+# songs.gif, fm.gif and iradio.gif, each read the first time its mode is shown
+view.bind("mode", lambda mode: modeButton.configure(image=assets.get(mode)))
+view.set("mode", mode)
 modeButton.grid(row=controlRow, column=0)
 
 
 # play and stop toggle states
-stopImage = tk.PhotoImage(file='/home/pi/radio/images/stop.gif')
-playImage = tk.PhotoImage(file='/home/pi/radio/images/play.gif')
 playState = "off"
 
+# runs on the executor
+def startFm(volume, s):
+    setFmVolume(volume)
+    changeFmChannel(s)
+
 def playStopPress():
     global mode
     global playState
-    global playStopButton
     global fmVolume
+    global playPressedAt
+
+    held = playPressedAt is not None and time.monotonic() - playPressedAt >= sleepHoldSeconds
+    playPressedAt = None
+    if playState == "on" and held:
+        startSleepTimer()
+        return
 
+    forgetPrewarm()
+    cancelSleepTimer()
     # songs and iRadio use same buttons
     if playState == "on":
         # change from on to off
         playState = "off"
-        playStopButton.configure(image=playImage)
+        view.set("play", playState)
         if mode == "fm":
             fmVolume = 0
-            setFmVolume(fmVolume)
+            executor.submit("fm stop", setFmVolume, (fmVolume,), key="play")
         else:
-            cmd = "mpc stop " + limitMPCoutput
-            subprocess.call(cmd, shell=True)
+            executor.submit("stop", mpd.stop, key="play")
+            restoreDigitalVolume()
     else:
         # change from off to on
         playState = "on"
-        playStopButton.configure(image=stopImage)
+        view.set("play", playState)
         if mode == "fm":
             fmVolume = 7
-            setFmVolume(fmVolume)
-
             s = FavoriteFmStations[fmIndex]
-            changeFmChannel(s)
+            executor.submit("fm play", startFm, (fmVolume, s), key="play")
         else:
-            cmd = "mpc play" + limitMPCoutput
-            subprocess.call(cmd, shell=True)
-
-playStopButton = tk.Button(radioGUI, command=playStopPress, bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0)
-playStopButton.configure(image=playImage)
+            if digitalMuted:
+                executor.submit("volume", setDigitalVolume, (currentVolume,), key="volume")
+            executor.submit("play", mpd.play, key="play")
+
+playStopButton = tk.Button(radioGUI, command=inputs.button('playStopPress', playStopPress), bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0)
+# the button shows what pressing it does
+view.bind("play", lambda state: playStopButton.configure(image=assets.get('stop' if state == "on" else 'play')))
+view.set("play", playState)
 playStopButton.grid(row=controlRow, column=1)
 
 
+# runs on the executor, waits until mpd is really playing, a stream
+# has to connect and buffer first
+def waitForAudio(timeout):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end and not cancelled():
+        status = mpd.status()
+        if status.get('state') == 'play' and status.get('elapsed', 0) > 0:
+            return True
+        time.sleep(.05)
+    return False
+
+def logAlarmLatency(alarm, when, how, playing):
+    ms = int((time.time() - when) * 1000)
+    if playing:
+        printMsg("alarm " + str(alarm.id) + ": sound started " + str(ms) + " ms after " + alarm.timeText() + " (" + how + ")")
+    else:
+        printMsg("alarm " + str(alarm.id) + ": no sound " + str(ms) + " ms after " + alarm.timeText() + " (" + how + ")")
+
+# runs on the executor alarm.leadTime() seconds before the alarm, starts
+# the source muted
+def prewarmSource(alarm):
+    started = time.monotonic()
+    if alarm.source == "fm":
+        # changeMode already powered up and tuned the radio, muted
+        playing = True
+    else:
+        setDigitalVolume(0)
+        mpd.play()
+        playing = waitForAudio(alarm.leadTime())
+    ms = int((time.monotonic() - started) * 1000)
+    printMsg("alarm " + str(alarm.id) + ": prewarmed " + alarm.source + " in " + str(ms) + " ms")
+    return playing
+
+# runs on the executor at the alarm time after prewarmSource
+def unmuteAlarm(alarm, when, volume):
+    fadeIn(alarm.source, volume)
+    playing = True
+    if alarm.source != "fm":
+        playing = waitForAudio(alarmAudioTimeout)
+    logAlarmLatency(alarm, when, "prewarmed", playing)
+
+# runs on the executor at the alarm time when there was no prewarm
+def playAlarm(alarm, when, volume):
+    if alarm.source == "fm":
+        startFm(0, FavoriteFmStations[fmIndex])
+        fadeIn("fm", volume)
+        playing = True
+    else:
+        setDigitalVolume(0)
+        fadeIn("songs", volume)
+        mpd.play()
+        playing = waitForAudio(alarmAudioTimeout)
+    logAlarmLatency(alarm, when, "cold", playing)
+
+# the alarm fades in from silence, starting slowly
+def fadeIn(source, volume):
+    global digitalMuted
+
+    if source == "fm":
+        ramper.ramp("fm", writeFmVolume, 0, volume, alarmFadeSeconds, EASE_IN)
+    else:
+        digitalMuted = False
+        ramper.ramp("digital", mixer.set, 0, volume, alarmFadeSeconds, EASE_IN)
+
+# after a stop a fade may have left the Digital volume anywhere, put
+# it back for the next play
+def restoreDigitalVolume():
+    ramper.cancel("digital")
+    if mixer.volume is not None and mixer.volume != currentVolume:
+        executor.submit("volume", setDigitalVolume, (currentVolume,), key="volume")
+
+# tkinter calls this when the play/stop button goes down, holding it
+# starts the sleep timer
+def playStopDown(event=None):
+    global playPressedAt
+
+    playPressedAt = time.monotonic()
+
+playStopButton.bind('<ButtonPress-1>', inputs.button('playStopDown', playStopDown), add='+')
+
+def startSleepTimer():
+    global sleepAt
+    global sleepTimerJob
+
+    cancelSleepTimer()
+    sleepAt = time.time() + sleepTimerMinutes * 60
+    delay = max(sleepTimerMinutes * 60 - sleepFadeSeconds, 0)
+    sleepTimerJob = radioGUI.after(int(delay * 1000), sleepFade)
+    printMsg("sleep timer set for " + str(sleepTimerMinutes) + " minutes")
+    showAlarms()
+
+def cancelSleepTimer():
+    global sleepAt
+    global sleepTimerJob
+
+    if sleepTimerJob is not None:
+        radioGUI.after_cancel(sleepTimerJob)
+    sleepTimerJob = None
+    sleepAt = None
+
+# fade out over sleepFadeSeconds, then stop
+def sleepFade():
+    global sleepTimerJob
+
+    sleepTimerJob = None
+    if playState != "on":
+        cancelSleepTimer()
+        return
+    done = lambda completed: guiCall(sleepFaded, completed)
+    if mode == "fm":
+        ramper.ramp("fm", writeFmVolume, fmVolume, 0, sleepFadeSeconds, onDone=done)
+    else:
+        ramper.ramp("digital", mixer.set, currentVolume, 0, sleepFadeSeconds, onDone=done)
+
+def sleepFaded(completed):
+    cancelSleepTimer()
+    if completed and playState == "on":
+        printMsg("sleep timer stopped playing")
+        playStopPress()
+    showAlarms()
+
+# runs in the tkinter main loop alarm.leadTime() seconds before an alarm
+def prewarmAlarm(alarm, when):
+    global prewarmingAlarm
+    global prewarmJob
+    global prewarmModeBefore
+
+    if playState == "on":
+        printMsg("alarm " + str(alarm.id) + ": already playing, no prewarm")
+        return
+    before = None
+    if alarm.source != mode and alarm.source in ("songs", "iradio", "fm"):
+        before = mode
+        setMode(alarm.source)
+    forgetPrewarm()
+
+    def prewarmed(playing):
+        global prewarmedAlarm
+        if playing and prewarmingAlarm == alarm.id and mode == alarm.source and playState == "off":
+            prewarmedAlarm = alarm.id
+
+    # queued after the mode change, a play or stop press supersedes it
+    executor.submit("alarm prewarm", prewarmSource, (alarm,), key="play", onDone=prewarmed)
+    prewarmingAlarm = alarm.id
+    prewarmModeBefore = before
+    delay = max(when - time.time(), 0) + prewarmMarginSeconds
+    prewarmJob = radioGUI.after(int(delay * 1000), lambda: cancelPrewarm("it did not go off"))
+
+# the alarm went off, or play, stop or mode was pressed, the prewarm
+# is theirs now
+def forgetPrewarm():
+    global prewarmedAlarm
+    global prewarmingAlarm
+    global prewarmJob
+    global prewarmModeBefore
+
+    if prewarmJob is not None:
+        radioGUI.after_cancel(prewarmJob)
+    prewarmJob = None
+    prewarmingAlarm = None
+    prewarmedAlarm = None
+    prewarmModeBefore = None
+
+# stop the muted source a prewarm started, put the volume back and
+# change back to the mode the radio was in
+def cancelPrewarm(reason):
+    id = prewarmingAlarm
+    before = prewarmModeBefore
+    # the after() job is done or cancelled now
+    forgetPrewarm()
+    if id is None or playState == "on":
+        return
+    printMsg("alarm " + str(id) + ": prewarm undone, " + reason)
+    if before is not None and before != mode:
+        # the prewarm may still be waiting for the audio, setMode stops
+        # the source and puts the volume back
+        executor.cancel("play")
+        setMode(before)
+    elif mode != "fm":
+        # FM was tuned at volume 0 by the mode change and stays muted
+        executor.submit("alarm prewarm undo", mpd.stop, key="play")
+        restoreDigitalVolume()
+
+# runs in the tkinter main loop after removeAlarm or removeAllAlarms,
+# id is None for all of them
+def alarmRemoved(id):
+    if prewarmingAlarm is not None and (id is None or id == prewarmingAlarm):
+        cancelPrewarm("the alarm was removed")
+
+# runs in the tkinter main loop when alarmScheduler sounds an alarm
+def soundAlarm(alarm, when):
+    global currentVolume
+    global fmVolume
+    global playState
+
+    if playState == "on":
+        printMsg("alarm " + str(alarm.id) + ": already playing")
+        return
+    warm = prewarmedAlarm == alarm.id and mode == alarm.source
+    forgetPrewarm()
+    if alarm.source != mode and alarm.source in ("songs", "iradio", "fm"):
+        setMode(alarm.source)
+
+    playState = "on"
+    view.set("play", playState)
+    if mode == "fm":
+        fmVolume = 7
+        volume = fmVolume
+    else:
+        currentVolume = alarm.volume
+        volume = currentVolume
+
+    if warm:
+        executor.submit("alarm unmute", unmuteAlarm, (alarm, when, volume), key="play")
+    else:
+        executor.submit("alarm play", playAlarm, (alarm, when, volume), key="play")
+    showAlarms()
+
+# called on the alarmScheduler thread
+def alarmPrepare(alarm, when):
+    guiCall(prewarmAlarm, alarm, when)
+
+def alarmFired(alarm, when):
+    guiCall(soundAlarm, alarm, when)
+
+# next and back change the screen right away, the command is sent by
+# coalescer once the presses stop, so five quick presses of next on FM
+# tune once, to the fifth station
+def skipSongs(n):
+    if n == 1:
+        mpd.next()
+        return
+    if n == -1:
+        mpd.previous()
+        return
+    status = mpd.status()
+    length = status.get('playlistlength', 0)
+    if n == 0 or length == 0:
+        return
+    mpd.play((status.get('song', 0) + n) % length)
+
+def sendSkip():
+    global songSkip
+
+    n = songSkip
+    songSkip = 0
+    executor.submit("skip", skipSongs, (n,), key="skip")
+
+def sendStation():
+    executor.submit("station", switchStation, (int(cStation),), key="station")
+
+def sendTune():
+    submitBeforeFmScan("tune", changeFmChannel, (FavoriteFmStations[fmIndex],), "tune")
+
 def backPress():
     global mode
     global fmIndex
+    global songSkip
 
     if mode == "songs":
-        cmd = "mpc prev " + limitMPCoutput
-        subprocess.call(cmd, shell=True)
+        songSkip -= 1
+        coalescer.press("skip", sendSkip)
 
     if mode == "iradio":
         incrementCurrentStation(-1)
-        switchStation(int(cStation))
+        coalescer.press("station", sendStation)
 
     if mode == "fm":
         fmIndex -= 1
         if fmIndex < 0:
             fmIndex = maxFmIndex
-        s = FavoriteFmStations[fmIndex]
-        changeFmChannel(s)
+        coalescer.press("tune", sendTune)
 
-backImage = tk.PhotoImage(file='/home/pi/radio/images/back.gif')
-backButton = tk.Button(radioGUI, image=backImage, command=backPress, bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0)
+    updateSongText()
+
+backButton = tk.Button(radioGUI, image=assets.get('back'), command=inputs.button('backPress', backPress), bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0)
 backButton.grid(row=controlRow, column=2)
 
 def nextPress():
     global mode
     global fmIndex
+    global songSkip
 
     printMsg("nextPress with mode = [" + mode + "]")
     if mode == "songs":
-        cmd = "mpc next " + limitMPCoutput
-        subprocess.call(cmd, shell=True)
+        songSkip += 1
+        coalescer.press("skip", sendSkip)
 
     if mode == "iradio":
         incrementCurrentStation(1)
-        switchStation(int(cStation))
+        coalescer.press("station", sendStation)
 
     if mode == "fm":
         fmIndex += 1
         if fmIndex > maxFmIndex:
             fmIndex = 0
-        s = FavoriteFmStations[fmIndex]
-        changeFmChannel(s)
+        coalescer.press("tune", sendTune)
 
-nextImage = tk.PhotoImage(file='/home/pi/radio/images/next.gif')
-nextButton = tk.Button(radioGUI, image=nextImage, command=nextPress, bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0)
+    updateSongText()
+
+nextButton = tk.Button(radioGUI, image=assets.get('next'), command=inputs.button('nextPress', nextPress), bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0)
 nextButton.grid(row=controlRow, column=3)
 
 
+# the volume is sent once the presses stop, see coalesce.py
+def sendVolume():
+    if mode == "fm":
+        submitBeforeFmScan("fm volume", setFmVolume, (fmVolume,), "volume")
+    else:
+        executor.submit("volume", setDigitalVolume, (currentVolume,), key="volume")
+
 def volumeUpPress():
     global currentVolume
     global fmVolume
@@ -785,16 +1210,15 @@ def volumeUpPress():
     # volume up
     if mode == "fm":
         fmVolume += 1
-        setFmVolume(fmVolume)
+        if fmVolume > 15:
+            fmVolume = 15
     else:
         currentVolume +=5
         if currentVolume > 100:
             currentVolume = 100
-        cmd = "amixer set Digital " + str(currentVolume) + "%"
-        subprocess.call(cmd, shell=True)
+    coalescer.press("volume", sendVolume)
 
-volumeUpImage = tk.PhotoImage(file='/home/pi/radio/images/volumeup.gif')
-volumeUpButton = tk.Button(radioGUI, image=volumeUpImage, command=volumeUpPress, bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0).grid(row=controlRow, column=4)
+volumeUpButton = tk.Button(radioGUI, image=assets.get('volumeup'), command=inputs.button('volumeUpPress', volumeUpPress), bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0).grid(row=controlRow, column=4)
 
 
 def volumeDownPress():
@@ -804,132 +1228,134 @@ def volumeDownPress():
     # volume down
     if mode == "fm":
         fmVolume -= 1
-        setFmVolume(fmVolume)
+        if fmVolume < 0:
+            fmVolume = 0
     else:
         currentVolume -=5
         if currentVolume < 0:
             currentVolume = 0
-        cmd = "amixer set Digital " + str(currentVolume) + "%"
-        subprocess.call(cmd, shell=True)
+    coalescer.press("volume", sendVolume)
 
-volumeDownImage = tk.PhotoImage(file='/home/pi/radio/images/volumedown.gif')
-volumeDownButton = tk.Button(radioGUI, image=volumeDownImage, command=volumeDownPress, bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0)
+volumeDownButton = tk.Button(radioGUI, image=assets.get('volumedown'), command=inputs.button('volumeDownPress', volumeDownPress), bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0)
 volumeDownButton.grid(row=controlRow, column=5)
 
 
 #########################
-# Log messages should be time stamped
-def timeStamp():
-    t = time.time()
-    s = datetime.datetime.fromtimestamp(t).strftime('%Y/%m/%d %H:%M:%S - ')
-    return s
-
-# Write messages in a standard format
-def printMsg(s):
-    fileLog.write(timeStamp() + s + "\n")
-
-def lastStation(): 
-    f = tempStationFile
-    cmd = "mpc current > " + f
-    subprocess.call(cmd, shell=True)
+# Write messages in a standard format, time stamped by acrLog
+# printMsg never waits for the SD card, it is safe from any thread
+def printMsg(s, level=INFO):
+    acrLog.write(s, level)
+
+startup.log = printMsg
+
+# ACR_RECORD=trace.txt writes every button press to trace.txt
+inputs.log = printMsg
+if RECORD is not None:
+    inputs.record(RECORD)
+
+# every mpd command, I2C transfer, amixer call and crontab write is
+# timed, see metrics.py
+metrics = Metrics()
+mpd.command = metrics.wrapCommand("mpd", mpd.command)
+mpd.commandList = metrics.wrap("mpd command list", mpd.commandList)
+
+# how late after jobs run, a busy main loop makes every button slow
+loopLag = LoopLag(radioGUI, metrics)
+
+# logs the callback that blocked the main loop, see watchdog.py
+watchdog = Watchdog(radioGUI, log=printMsg)
+
+def logMetrics():
+    printMsg("metrics: " + metrics.summary())
+    radioGUI.after(metricsInterval * 1000, logMetrics)
+
+# mpd tells nowPlaying when the song changes, no polling required
+nowPlaying = NowPlayingWatcher(nowPlayingChanged, log=printMsg)
+
+# I2C, mpd and amixer commands run on the executor so button presses
+# never stall the GUI, results come back through guiCall
+executor = CommandExecutor(post=guiCall, log=printMsg)
+
+# bursts of volume, next and back presses become one command
+coalescer = Coalescer(radioGUI, log=printMsg)
+
+# redraws the clock once a minute, see showTime
+minuteClock = MinuteClock(guiCall, showTime, showDate, log=printMsg)
+
+# the Digital volume control and the volume fades
+mixer = hal.openMixer('Digital', log=printMsg)
+metrics.instrument(mixer, 'set', "amixer set")
+ramper = Ramper(log=printMsg)
+
+# the internet radio stations, see initStation
+stationCatalog = StationCatalog(allStationsFile, stationCacheFile, log=printMsg)
+
+# alarmStore is created by startAlarms
+alarmStore = None
+alarmScheduler = AlarmScheduler(alarmFired, alarmPrepare, log=printMsg)
+
+# mixer keeps amixer (or an ALSA mixer handle) open, nothing is started
+# for a volume change
+def setDigitalVolume(volume):
+    global digitalMuted
+
+    ramper.cancel("digital")
+    mixer.set(volume)
+    digitalMuted = volume == 0
+
+def lastStation():
     try:
-        fileStation = open(f, 'r')
-        stream = fileStation.readline()
-        stream = stream.rstrip()
-        fileStation.close()
-    except Exception as ex:
-        printMsg("Exception in lastStation = [" + ex + "]")
+        stream = mpd.currentSong().get('file', '')
+    except MPDError as ex:
+        printMsg("Exception in lastStation = [" + str(ex) + "]", WARNING)
         stream = ""
 
     return stream
 
-def writeFmRegisters():
-    # starts writing at register 2
-    # but first byte is in the i2c write command
-    global writereg
-    global reg
-    global readreg
-
-    cmd, writereg[0] = divmod(reg[2], 1<<8)
-    writereg[1], writereg[2] = divmod(reg[3], 1<<8)
-    writereg[3], writereg[4] = divmod(reg[4], 1<<8)
-    writereg[5], writereg[6] = divmod(reg[5], 1<<8)
-    writereg[7], writereg[8] = divmod(reg[6], 1<<8)
-    writereg[9], writereg[10] = divmod(reg[7], 1<<8)
-    w6 = i2c.write_i2c_block_data(SI4703_Address, cmd, writereg)
-    readreg[16] = cmd #readreg
-    readFmRegisters()
-    return
-
-def readFmRegisters():
-    global readreg
-    global reg
-
-    readreg = i2c.read_i2c_block_data(SI4703_Address, readreg[16], 32)
-    reg[10] = int(readreg[0] * 256 + readreg[1])
-    reg[11] = int(readreg[2] * 256 + readreg[3])
-    reg[12] = int(readreg[4] * 256 + readreg[5])
-    reg[13] = int(readreg[6] * 256 + readreg[7])
-    reg[14] = int(readreg[8] * 256 + readreg[9])
-    reg[15] = int(readreg[10] * 256 + readreg[11])
-    reg[0] = int(readreg[12] * 256 + readreg[13])
-    reg[1] = int(readreg[14] * 256 + readreg[15])
-    reg[2] = int(readreg[16] * 256 + readreg[17])
-    reg[3] = int(readreg[18] * 256 + readreg[19])
-    reg[4] = int(readreg[20] * 256 + readreg[21])
-    reg[5] = int(readreg[22] * 256 + readreg[23])
-    reg[6] = int(readreg[24] * 256 + readreg[25])
-    reg[7] = int(readreg[26] * 256 + readreg[27])
-    reg[8] = int(readreg[28] * 256 + readreg[29])
-    reg[9] = int(readreg[30] * 256 + readreg[31])
-    return
-
 def getFmChannel():
-    readFmRegisters()
-    channel = reg[READCHAN] & 0x03FF
-    channel *= 2
-    channel += 875
-    return channel
+    radio.readStatus()
+    return frequency(radio.get(READCHAN) & 0x03FF)
 
 def changeFmChannel(newchannel):
     c = str(float(newchannel) / 10.0)
-    if newchannel < 878 or newchannel > 1080:
+    if newchannel < BAND_BOTTOM or newchannel > frequency(LAST_CHANNEL):
         printMsg("  invalid FM channel " + c)
         return
-    global reg
-    newchannel *= 10
-    newchannel -= 8750
-    newchannel = int(newchannel / 20)
-    readFmRegisters()
-    reg[CHANNEL] &= 0xFE00;     # Clear out the channel bits
-    reg[CHANNEL] |= newchannel; # Mask in the new channel
-    reg[CHANNEL] |= (1<<15);    # Set the TUNE bit to start
-    writeFmRegisters()
-    time.sleep(1)
-    # Try ten times and then fail
-    for i in range(0, 9):
-        readFmRegisters()
-        time.sleep(1)
-        if ((reg[STATUSRSSI] & (1<<14)) != 0):
-            reg[CHANNEL] &= ~(1<<15)
-            writeFmRegisters()
-            return
-
-    printMsg("  no signal detected for FM channel " + c)
+    newchannel = channelOf(newchannel)
+
+    # the old station's name must not show on the new one, holding the
+    # radio lock from the reset to the tune so no RDS is read between
+    with radio.lock:
+        rdsPoller.reset()
+        guiCall(showRds, "", "")
+
+        # a newer tune request cancels this one
+        tuned = radio.tune(newchannel, fmTuneTimeout, cancelled)
+    if tuned:
+        ms = int(radio.lastTuneTime() * 1000)
+        printMsg("  tuned FM channel " + c + " in " + str(ms) + " ms")
+        rdsPoller.resume()
+        return
+
+    if not cancelled():
+        printMsg("  no signal detected for FM channel " + c)
     return
 
 def setFmVolume(volume):
-    global reg
     if volume > 15:
         volume = 15
     if volume < 0:
         volume = 0
-    readFmRegisters()
-    reg[SYSCONFIG2] &= 0xFFF0   # Clear volume bits
-    reg[SYSCONFIG2] = int(volume) # Set volume to lowest
-    writeFmRegisters()
+    ramper.cancel("fm")
+    writeFmVolume(volume)
     return
 
+# fades call this directly, setFmVolume stops a fade
+def writeFmVolume(volume):
+    # only the volume bits change, registers 2-5 are written
+    radio.update(SYSCONFIG2, 0x000F, int(volume))
+    radio.flush()
+
 
 def readStreamPlayerConfig():
     global currentStation
@@ -939,77 +1365,67 @@ def readStreamPlayerConfig():
     stream = lastStation()
 
     try:
-        f = open(currentStationConfig, 'r')
-        stream2 = f.readline()
-        if stream2 == "":
-            currentStation = stream
-        else:
-            currentStation = stream2.rstrip()
-
-        l = f.readline()
-        v = l.rstrip()
-        currentVolume = int(v)
-        l = f.readline()
-        currentStationPlaylist = l.rstrip()
-        f.close()
+        with open(currentStationConfig, 'r') as f:
+            stream2 = f.readline()
+            if stream2 == "":
+                currentStation = stream
+            else:
+                currentStation = stream2.rstrip()
+
+            l = f.readline()
+            v = l.rstrip()
+            currentVolume = int(v)
+            l = f.readline()
+            currentStationPlaylist = l.rstrip()
     except Exception as ex:
-        printMsg("Exception in readStreamPlayerConfig [" + ex + "]")
+        printMsg("Exception in readStreamPlayerConfig [" + str(ex) + "]", WARNING)
         currentStation = ""
         currentVolume = defaultVolume
         currentStationPlaylist = defaultStationPlaylist
-        f.close()
 
     printMsg("read streamPlayer config")
     printMsg(" stream = [" + currentStation + "]")
     printMsg(" volume = [" + str(currentVolume) + "]")
     printMsg(" playlist = [" + currentStationPlaylist + "]")
-
-    cmd = "rm " + tempStationFile
-    subprocess.call(cmd, shell=True)
     return
 
+# stations stationcheck.py found dead are skipped
 def incrementCurrentStation(i):
     global stationList
     global cStation
 
     last = len(stationList)
-    cStation = cStation + i
+    s = cStation + i
+    while 0 <= s < last and not stationCatalog.alive(s):
+        s = s + i
 
-    if cStation < 0:
-        cStation = 0
-    if cStation >= last:
-        cStation = last-1
+    # stay on the current station if there are no live ones left
+    if 0 <= s < last:
+        cStation = s
 
 def switchStation(station):
     global stationList
 
     last = len(stationList)
+    if last == 0:
+        printMsg("no stations loaded")
+        return
     if station < 0:
         station = 0
     if station >= last:
         station = last-1
 
-    cmd = 'mpc clear'
-    subprocess.call(cmd, shell=True)
-
     stream = stationList[station][3]
     printMsg("Station = " + stationList[station][0] + ", " + stationList[station][1])
-    cmd = 'mpc insert "' + stream + '"' + limitMPCoutput
-    subprocess.call(cmd, shell=True)
 
-    cmd = "mpc play "  + limitMPCoutput
-    subprocess.call(cmd, shell=True)
+    # clear, insert and play in one round trip
+    mpd.commandList([('clear',), ('add', stream), ('play',)])
 
 def writeStationPlayerTxt():
     global currentStation
 
     # current stream can be null
-    o = subprocess.check_output("mpc current", shell=True)
-    stream = o.decode("utf-8")
-    if stream != "":
-        stream = stream.rstrip()
-
-    currentStation = stream
+    currentStation = mpd.currentSong().get('file', '')
 
     f = open(currentStationConfig, 'w')
     f.write(currentStation + "\n")
@@ -1018,18 +1434,13 @@ def writeStationPlayerTxt():
     f.close()
 
 def lastSong():
-    f = tempSongFile
-    cmd = "mpc current > " + f
-    subprocess.call(cmd, shell=True)
     try:
-        fileSong = open(f, 'r')
-        songAndTitle = fileSong.readline()
-        i = songAndTitle.find("-") + 2
-        songAndNewline = songAndTitle[i:]
-        song = songAndNewline.rstrip()
-        fileSong.close()
-    except Exception as ex:
-        printMsg("Exception in lastSong = [" + ex + "]")
+        current = mpd.currentSong()
+        song = ""
+        if current:
+            song = songTitle(current)
+    except MPDError as ex:
+        printMsg("Exception in lastSong = [" + str(ex) + "]", WARNING)
         song = ""
 
     return song
@@ -1042,47 +1453,46 @@ def readACRConfig():
     song = lastSong()
 
     try:
-        f = open(currentSongConfig, 'r')
-        songAndTitle = f.readline()
-        if song == "":
-            st = songAndTitle.rstrip()
-            i = st.find("-") + 2
-            song = st[i:]
-
-        currentSong = song
-        l = f.readline()
-        v = l.rstrip()
-        currentVolume = int(v)
-        l = f.readline()
-        currentPlaylist = l.rstrip()
-        f.close()
+        with open(currentSongConfig, 'r') as f:
+            songAndTitle = f.readline()
+            if song == "":
+                st = songAndTitle.rstrip()
+                i = st.find("-") + 2
+                song = st[i:]
+
+            currentSong = song
+            l = f.readline()
+            v = l.rstrip()
+            currentVolume = int(v)
+            l = f.readline()
+            currentPlaylist = l.rstrip()
     except Exception as ex:
-        printMsg("Exception in readACRConfig [" + ex + "]")
+        printMsg("Exception in readACRConfig [" + str(ex) + "]", WARNING)
         currentSong = ""
         currentVolume = defaultVolume
         currentPlaylist = defaultPlaylist
-        f.close()
 
     printMsg("read songPlayer config")
     printMsg(" song = [" + currentSong + "]")
     printMsg(" volume = [" + str(currentVolume) + "]")
     printMsg(" playlist = [" + currentPlaylist + "]")
-
-    cmd = "rm " + tempSongFile
-    subprocess.call(cmd, shell=True)
     return
 
+# on exit, mpd may already be gone
+def stopMpd():
+    try:
+        mpd.stop()
+    except MPDError as ex:
+        printMsg("could not stop mpd: " + str(ex), WARNING)
+
 def writeSongPlayerTxt():
     global currentSong
 
     # current song can be null
-    o = subprocess.check_output("mpc current", shell=True)
-    songAndTitle = o.decode("utf-8")
-    if songAndTitle != "":
-        songAndTitle = songAndTitle.rstrip()
-
-    i = songAndTitle.find("-") + 2
-    currentSong = songAndTitle[i:]
+    current = mpd.currentSong()
+    currentSong = ""
+    if current:
+        currentSong = songTitle(current)
 
     f = open(currentSongConfig, 'w')
     f.write(currentSong + "\n")
@@ -1119,60 +1529,52 @@ def initFM():
     #   '-g' causes pin numbers to be BCM
     #   'mode' is the option used to select the mode of the pin
     #   'alt0' is the alternate pin mode code for i2c
-    subprocess.check_output(['gpio', '-g', 'mode', str(SDA), 'alt0'])
-
-    readFmRegisters()
-    reg[OSCILLATOR] = int(0x8100)
-    writeFmRegisters()
+    hal.runCommand(['gpio', '-g', 'mode', str(SDA), 'alt0'], printMsg, check=True)
+
+    # the only full read, the shadow registers are kept after this
+    radio.readAll()
+    if fmStcPin is not None:
+        radio.enableStcInterrupt(GPIO, fmStcPin)
+    radio.set(OSCILLATOR, 0x8100)
+    radio.flush()
     time.sleep(1)
 
-    readFmRegisters()
-    reg[POWERCFG] = int(0x4001) #Enable the Radio IC and turn off muted
-    writeFmRegisters()
+    radio.set(POWERCFG, 0x4001 | RDSM) #Enable the Radio IC and turn off muted, RDS block error counts
+    radio.flush()
     time.sleep(.1)
 
-    readFmRegisters()
-    reg[SYSCONFIG1] |= (1<<12) # Enable RDS
-    reg[SYSCONFIG2] &= 0xFFF0; # Clear volume bits 
-    reg[SYSCONFIG2] = 0x0000;  # Set volume to lowest
-    reg[SYSCONFIG3] = 0x0100;  # Set extended volume range (too loud for me wit$    write_registers()
+    radio.update(SYSCONFIG1, RDS, RDS) # Enable RDS
+    radio.set(SYSCONFIG2, 0x0000)  # Set volume to lowest
+    radio.set(SYSCONFIG3, 0x0100)  # Set extended volume range (too loud for me without)
+    radio.flush()
     return
 
 def initStation():
     global stationList
+    global cStation
     global currentPlaylist
 
 
     currentPlaylist = "all_stations"
 
-    cmd = "mpc clear" + limitMPCoutput
-    subprocess.call(cmd, shell=True)
-
-    # on start up initialize the station list
-    stationList = list()
+    mpd.clear()
 
-    # open all stations and fill in the stationList data structure
-    f = open(allStationsFile, 'r')
-
-    printMsg("Loading stations")
-    for line in f:
-        line = line.strip()
-        if line:
-            # line is not blank
-            l = line.split(',')
-            d = (l[0],l[1],l[2],l[3])
-            stationList.append(d)
-
-    f.close()
+    # only parsed again when all_stations.m3u changed
+    if stationCatalog.refresh():
+        printMsg("Loaded " + str(len(stationCatalog)) + " stations")
+    stationList = stationCatalog.stations
 
     readStreamPlayerConfig()
 
+    # start with the station that was playing last time
+    i = stationCatalog.indexOf(currentStation)
+    if i is not None:
+        cStation = i
+
     printMsg("volume = [" + str(currentVolume) + "]")
-    cmd = "amixer set Digital " + str(currentVolume) + "%"
-    subprocess.call(cmd, shell=True)
+    setDigitalVolume(currentVolume)
     if currentStation == "":
-        cmd = "mpc play " + limitMPCoutput
-        subprocess.call(cmd, shell=True)
+        mpd.play()
     else:
         switchStation(cStation)
     return
@@ -1182,36 +1584,27 @@ def initSong():
     printMsg("Initializing song")
     readACRConfig()
 
-    cmd = "amixer set Digital " + str(currentVolume) + "%"
-    subprocess.call(cmd, shell=True)
+    setDigitalVolume(currentVolume)
 
     if playState == "on":
         if currentSong == "":
-            cmd = "mpc play " + limitMPCoutput
+            mpd.play()
         else:
-            cmd = 'mpc searchplay title "' + currentSong + '"' + limitMPCoutput
-
-        subprocess.call(cmd, shell=True)
+            try:
+                mpd.searchPlay('title', currentSong)
+            except MPDError as ex:
+                printMsg("Exception in initSong [" + str(ex) + "]", WARNING)
+                mpd.play()
 
     return
 
 # Insert music from my Apple library into mpd and save it as a playlist
+# the saved playlist is reused, only new or removed files are changed
 def initPlaylist(playlist_name):
     global currentPlaylist
 
-    cmd = "mpc clear" + limitMPCoutput
-    subprocess.call(cmd, shell=True)
-
-    printMsg("Loading songs takes a few minutes. Please wait for > prompt")
-    for file in os.listdir(directoryMusic):
-        if file.endswith(".m4a"):
-            dirName = os.path.join(directoryMusic, file)
-            fileName = "file://" + dirName
-            cmd = 'mpc insert ' + '"' + fileName + '"'
-            subprocess.call(cmd, shell=True)
-
-    cmd = "mpc save " + playlist_name
-    subprocess.call(cmd, shell=True)
+    printMsg("Loading songs")
+    syncPlaylist(mpd, directoryMusic, playlist_name, musicStampFile, log=printMsg)
 
     currentPlaylist = playlist_name
     return
@@ -1220,17 +1613,132 @@ def removePlaylist(p):
     if p == defaultPlaylist:
         printMsg("Cannot remove default playlist: " + defaultPlaylist)
     else:
-        cmd = "mpc stop " + limitMPCoutput
-        subprocess.call(cmd, shell=True)
+        mpd.stop()
         printMsg("Remove playlist " + p)
-        cmd = "mpc rm " + p + limitMPCoutput
-        subprocess.call(cmd, shell=True)
-        cmd = "mpc clear --wait " + limitMPCoutput
-        subprocess.call(cmd, shell=True)
+        mpd.rm(p)
+        mpd.clear()
 
         initPlaylist(defaultPlaylist)
 
 
+# Starting up
+# the clock is shown as soon as the main loop runs, then mpd, the
+# alarms and the FM radio are started on the executor, one stage at a
+# time. Buttons pressed meanwhile queue their commands behind them
+
+# the clock should show this many seconds after acr.py starts
+clockBudget = 3.0
+
+def startMpd():
+    try:
+        mpd.stop()
+    except MPDError as ex:
+        printMsg("mpd is not running yet: " + str(ex))
+
+    initSong()
+
+def mpdStarted(result):
+    updateSongText()
+    nowPlaying.start()
+
+def startAlarms():
+    global my_cron
+    global alarmStore
+
+    my_cron = hal.openCron('pi')
+    metrics.instrument(my_cron, 'write', "crontab write")
+    alarmStore = AlarmStore(alarmsFile, my_cron, log=printMsg)
+    try:
+        alarmStore.load()
+    except Exception as ex:
+        printMsg("could not update crontab alarms: " + str(ex))
+    alarmScheduler.setAlarms(alarmStore.list())
+    alarmScheduler.start()
+
+# returns True if a band scan was saved
+def startRadio():
+    global radio
+    global fmScanner
+    global rdsPoller
+
+    # The Raspberry Pi 3 has two I2C busses and FM Radio uses bus 1
+    # Bus 1 uses SDA.1 (BCM pin 2) and SCL.1 (BCM pin 3)
+    # 0 = /dev/i2c-0 (port I2C0), 1 = /dev/i2c-1 (port I2C1)
+    radio = Si4703(hal.openI2c(1))
+    metrics.instrument(radio, 'flush', "i2c write")
+    metrics.instrument(radio, 'read', "i2c read")
+    fmScanner = FmScanner(radio, fmStationsFile, cancelled=fmScanCancelled, log=printMsg)
+    rdsPoller = RdsPoller(radio, rdsChanged, log=printMsg)
+    rdsPoller.start()
+    return fmScanner.load()
+
+def radioStarted(scanned):
+    if scanned:
+        useScannedStations()
+        updateSongText()
+
+# ACR_REPLAY=trace.txt presses the buttons in trace.txt again once
+# started, see replay.py
+replayer = None
+
+# nothing left on the executor and no presses waiting to be sent
+def replayIdle():
+    return executor.queueDepth() == 0 and not coalescer.pending
+
+def replayState():
+    station = ""
+    if cStation < len(stationList):
+        station = stationList[cStation][0]
+    alarms = 0
+    if alarmStore is not None:
+        alarms = len(alarmStore)
+    return {
+        'mode': mode,
+        'play': playState,
+        'volume': currentVolume,
+        'fmVolume': fmVolume,
+        'fmStation': FavoriteFmStations[fmIndex],
+        'station': station,
+        'song': view.get("song", ""),
+        'alarm': alarmState,
+        'alarmTime': str(alarmHour).zfill(2) + ":" + str(alarmMinute).zfill(2),
+        'alarms': alarms,
+        'sleepTimer': sleepAt is not None,
+        'backlight': backlightOn,
+    }
+
+# runs in the tkinter main loop once every press was handled
+def replayFinished(replayer):
+    printMsg("replayed " + str(len(replayer.events)) + " presses in " + str(round(replayer.took, 1)) + "s, " + str(replayer.lost) + " lost, " + str(replayer.ignored) + " ignored")
+    for line in replayer.lines():
+        printMsg(" replay " + line)
+    for line in replayer.handledMetrics.lines():
+        printMsg(" replay returned " + line)
+    state = replayState()
+    printMsg(" replay state: " + ", ".join(k + "=" + str(v) for k, v in sorted(state.items())))
+    try:
+        replayer.writeReport(REPLAY + '.report.json', state, metrics.snapshot()['histograms'])
+    except (IOError, OSError) as ex:
+        printMsg("could not write " + REPLAY + ".report.json: " + str(ex), WARNING)
+    radioGUI.quit()
+
+def startupDone(result):
+    startup.mark("ready")
+    if replayer is not None:
+        replayer.start()
+
+def startStages():
+    # draw the first frame now, so it is really on the screen
+    view.flush()
+    radioGUI.update_idletasks()
+    startup.mark("clock shown", clockBudget)
+
+    executor.submit("startup mpd", startup.run, ("mpd", startMpd), onDone=mpdStarted, onError=mpdStarted)
+    executor.submit("startup alarms", startup.run, ("alarms", startAlarms), onDone=lambda result: showAlarms(), onError=lambda ex: showAlarms())
+    executor.submit("startup fm", startup.run, ("fm", startRadio), onDone=radioStarted)
+    executor.submit("startup done", lambda: None, onDone=startupDone)
+
+
 ##########
 printMsg("Starting Alarm Clock Radio")
 printMsg("After reboot, mpd loads last playlist. Please wait ...")
@@ -1239,17 +1747,27 @@ try:
     playState = "off"
     exitCondition = "x"
 
-    cmd = 'mpc stop'
-    subprocess.call(cmd, shell=True)
+    # shown until each stage is done
+    view.set("song", "loading ...")
+    view.set("alarmText", "loading alarms ...")
 
-    # The Raspberry Pi 3 has two I2C busses and FM Radio uses bus 1
-    # Bus 1 uses SDA.1 (BCM pin 2) and SCL.1 (BCM pin 3)
-    # 0 = /dev/i2c-0 (port I2C0), 1 = /dev/i2c-1 (port I2C1)
-    i2c = smbus.SMBus(1)
+    minuteClock.start()
 
-    initSong()
+    if REPLAY is not None:
+        if not hal.simulated():
+            raise ValueError("ACR_REPLAY needs ACR_BACKEND=sim")
+        replayer = Replayer(inputs, readTrace(REPLAY), guiCall, REPLAY_SPEED, idle=replayIdle, onDone=replayFinished, log=printMsg)
+
+    # once the main loop has drawn the clock
+    radioGUI.after(0, startStages)
 
-    updateDate()
+    loopLag.start()
+    watchdog.start()
+    radioGUI.after(metricsInterval * 1000, logMetrics)
+    try:
+        metricsServer = MetricsServer(metrics, metricsPort).start()
+    except OSError as ex:
+        printMsg("metrics server not started on port " + str(metricsPort) + ": " + str(ex), WARNING)
 
     radioGUI.mainloop()
 
@@ -1257,26 +1775,70 @@ except KeyboardInterrupt: # trap a CTRL+C keyboard interrupt
     printMsg("keyboard exception occurred")
 
 except Exception as ex:
-    printMsg("ERROR: an unhandled exception occurred: " + str(ex))
+    printMsg("an unhandled exception occurred: " + str(ex), ERROR)
+    printMsg(traceback.format_exc(), DEBUG)
+    # the messages before the crash, including DEBUG ones
+    try:
+        acrLog.dump(crashFile)
+    except (IOError, OSError) as dumpEx:
+        printMsg("could not write " + crashFile + ": " + str(dumpEx), ERROR)
 
 finally:
     printMsg("Alarm Clock Radio terminated")
-    writeSongPlayerTxt()
-    writeStationPlayerTxt()
+    nowPlaying.stop()
+    minuteClock.stop()
+    printMsg(" clock: " + str(minuteClock.wakeups) + " wakeups, " + str(minuteClock.jumps) + " clock jumps, redrawn at most " + str(int(minuteClock.maxLate * 1000)) + " ms after the minute")
+    alarmScheduler.stop()
+    if replayer is not None:
+        replayer.stop()
+    inputs.stop()
+    watchdog.stop()
+    for line in watchdog.report():
+        printMsg(" blocked by " + line)
+    if metricsServer is not None:
+        metricsServer.stop()
+    for line in metrics.lines():
+        printMsg(" " + line)
+    ramper.stop()
+    executor.stop()
+    mixer.close()
+    if rdsPoller is not None:
+        rdsPoller.stop()
+    s = assets.stats()
+    printMsg(" images: " + str(s['loads']) + " read, " + str(s['cacheLoads']) + " read scaled from the cache, " + str(s['shared']) + " shared, scale " + s['scale'])
+    s = view.stats()
+    printMsg(" screen: " + str(s['sets']) + " changes, " + str(s['flushes']) + " frames, " + str(s['updates']) + " widget redraws, " + str(s['skipped']) + " redraws skipped")
+    for key, s in sorted(coalescer.stats().items()):
+        printMsg(" " + key + ": " + str(s['presses']) + " presses, " + str(s['sent']) + " commands sent, " + str(s['saved']) + " saved")
+    for name, s in sorted(executor.stats().items()):
+        printMsg(" " + name + ": " + str(s['count']) + " runs, avg wait " + str(round(s['waitAvg'], 3)) + "s, avg run " + str(round(s['runAvg'], 3)) + "s, max run " + str(round(s['runMax'], 3)) + "s")
+    # mpd may be gone, the GPIO pins and the log still have to be closed
+    try:
+        writeSongPlayerTxt()
+        writeStationPlayerTxt()
+    except MPDError as ex:
+        printMsg("could not save the current song and station: " + str(ex), WARNING)
     backlight.stop()
     # for FM Radio
     GPIO.output(RST, GPIO.LOW)
     GPIO.cleanup()
+    # the fake mpd and Xvfb with ACR_BACKEND=sim
+    hal.stop()
 
+    s = acrLog.stats()
+    printMsg(" log: " + str(s['written']) + " messages written, " + str(s['dropped']) + " dropped, " + str(s['syncs']) + " syncs, " + str(s['rotations']) + " rotations")
     if exitCondition == "x":
         printMsg("... Song still playing")
-        fileLog.close()
+        mpd.close()
+        acrLog.close()
     elif exitCondition == "o":
-        subprocess.call("mpc stop ", shell=True)
+        stopMpd()
+        mpd.close()
         printMsg("... Shutting down raspberry pi")
-        fileLog.close()
-        subprocess.call("sudo shutdown -h 0", shell=True)
+        acrLog.close()
+        hal.runCommand("sudo shutdown -h 0", printMsg)
     else:
-        subprocess.call("mpc stop ", shell=True)
-        fileLog.close()
+        stopMpd()
+        mpd.close()
+        acrLog.close()
 
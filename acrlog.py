@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# acrlog.py writes acr.log on its own thread.
+#
+# acr.py used to open acr.log with 'w+', which threw away the last log
+# every start, and wrote it from the tkinter thread, the GPIO button
+# threads and the worker threads at the same time, without a lock.
+# Nothing reached the SD card until acr.py exited, so a crash or a
+# power cut lost the whole log.
+#
+# LogWriter.write() only puts the message on a queue, it never waits
+# for the SD card. The log thread:
+#    - writes whatever is queued at once and flushes it
+#    - calls fsync at most every syncInterval seconds, or right away
+#      for an ERROR, so the SD card is not written for every line
+#    - starts a new file when acr.log is bigger than maxBytes or has
+#      been open for maxAge seconds, acr.log.1 ... acr.log.<backups>
+#      are kept
+#
+#    acrLog = LogWriter('/home/pi/radio/acr.log')
+#    acrLog.write("mode changed", INFO)
+#    acrLog.close()
+#
+# Messages below level are not written to the file, but every message
+# is kept in a ring of the last ringSize messages. dump() writes the
+# ring to a file, acr.py does that when it crashes so the DEBUG
+# messages leading up to it are not lost
+#
+#########################
+
+import collections
+import datetime
+import os
+import queue
+import threading
+import time
+
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR'}
+
+# messages waiting to be written, more than this are dropped
+QUEUE_SIZE = 10000
+
+
+def formatEntry(t, level, s):
+    stamp = datetime.datetime.fromtimestamp(t).strftime('%Y/%m/%d %H:%M:%S - ')
+    if level == INFO:
+        return stamp + s + "\n"
+    return stamp + LEVEL_NAMES.get(level, str(level)) + " " + s + "\n"
+
+
+class LogWriter:
+    def __init__(self, path, level=INFO, maxBytes=1000000, backups=3, maxAge=7 * 24 * 3600,
+                 syncInterval=5.0, ringSize=500):
+        self.path = path
+        self.level = level
+        self.maxBytes = maxBytes
+        self.backups = backups
+        self.maxAge = maxAge
+        self.syncInterval = syncInterval
+
+        # (time, level, message), appending to a deque is thread safe
+        self.ring = collections.deque(maxlen=ringSize)
+        self.queue = queue.Queue(QUEUE_SIZE)
+
+        self.file = None
+        self.opened = 0.0
+        self.lastSync = time.monotonic()
+        self.unsynced = False
+
+        self.written = 0
+        self.dropped = 0
+        self.syncs = 0
+        self.rotations = 0
+
+        self.open()
+        self.thread = threading.Thread(target=self.run, name='log')
+        self.thread.daemon = True
+        self.thread.start()
+
+    # can be called from any thread, never blocks
+    def write(self, s, level=INFO):
+        entry = (time.time(), level, str(s))
+        self.ring.append(entry)
+        if level < self.level:
+            return
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def open(self):
+        self.file = open(self.path, 'a')
+        # maxAge counts from when the file was opened, Linux does not
+        # keep the time a file was created
+        self.opened = time.time()
+
+    def rotate(self):
+        self.file.close()
+        for i in range(self.backups - 1, 0, -1):
+            old = self.path + '.' + str(i)
+            if os.path.exists(old):
+                os.rename(old, self.path + '.' + str(i + 1))
+        if self.backups > 0:
+            os.rename(self.path, self.path + '.1')
+        else:
+            os.remove(self.path)
+        self.rotations += 1
+        self.open()
+
+    def needsRotation(self):
+        return self.file.tell() >= self.maxBytes or time.time() - self.opened >= self.maxAge
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.lastSync = time.monotonic()
+        self.unsynced = False
+        self.syncs += 1
+
+    def writeEntries(self, entries):
+        # a rotate that failed left the file closed
+        if self.file.closed:
+            self.open()
+        urgent = False
+        for t, level, s in entries:
+            if self.needsRotation():
+                self.sync()
+                self.rotate()
+            self.file.write(formatEntry(t, level, s))
+            self.written += 1
+            urgent = urgent or level >= ERROR
+        self.file.flush()
+        self.unsynced = True
+        if urgent or time.monotonic() - self.lastSync >= self.syncInterval:
+            self.sync()
+
+    def run(self):
+        while True:
+            # wake up in time for a sync that is due
+            timeout = None
+            if self.unsynced:
+                timeout = max(self.lastSync + self.syncInterval - time.monotonic(), 0)
+            try:
+                entry = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                try:
+                    self.sync()
+                except (IOError, OSError, ValueError):
+                    # same as a failed write, try again in syncInterval
+                    self.lastSync = time.monotonic()
+                continue
+
+            entries = []
+            stopping = False
+            while entry is not None:
+                entries.append(entry)
+                try:
+                    entry = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            else:
+                stopping = True
+            try:
+                if entries:
+                    self.writeEntries(entries)
+            except (IOError, OSError, ValueError):
+                # a full or read only SD card must not stop acr.py, the
+                # messages are still in the ring
+                self.dropped += len(entries)
+            if stopping:
+                return
+
+    # the last n messages, oldest first, including ones below level
+    def recent(self, n=None):
+        entries = list(self.ring)
+        if n is not None:
+            entries = entries[-n:]
+        return [formatEntry(t, level, s) for t, level, s in entries]
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            f.writelines(self.recent())
+            f.flush()
+            os.fsync(f.fileno())
+
+    # write everything queued, sync and close the file, waiting at
+    # most timeout seconds for the writer
+    def close(self, timeout=5.0):
+        end = time.monotonic() + timeout
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            # the writer is stuck on the SD card, the queued lines are lost
+            return
+        self.thread.join(max(end - time.monotonic(), 0))
+        if self.thread.is_alive():
+            # a sync here would hang the same way
+            return
+        try:
+            self.sync()
+        except (IOError, OSError, ValueError):
+            pass
+        self.file.close()
+
+    def stats(self):
+        return {'written': self.written, 'dropped': self.dropped, 'syncs': self.syncs, 'rotations': self.rotations}
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# alarmscheduler.py sounds the alarms from inside acr.py.
+#
+# crontab runs "mpc play" at the alarm time. That only works to the
+# minute, knows nothing about the mode acr.py is in and cannot say
+# when the next alarm is. AlarmScheduler keeps the next time every
+# alarm goes off in a heap, soonest first, and its thread sleeps until
+# the first one:
+#    - adding, removing or rescheduling an alarm is O(log n), a
+#      removed alarm's heap entry is skipped when it comes up
+#    - the sleep is measured with time.monotonic(), which NTP and
+#      daylight saving time do not change
+#    - the wall clock is checked every MAX_SLEEP seconds, if it moved
+#      more than JUMP seconds away from the monotonic clock (NTP
+#      setting the clock after boot, someone changing the date) every
+#      alarm's next time is worked out again
+#    - an alarm whose time was jumped over by less than MISSED_GRACE
+#      seconds still goes off, older ones are skipped, and so is
+#      preparing them
+#
+# Alarm times are local time, so an alarm at 06:30 stays at 06:30 when
+# daylight saving time starts or ends.
+#
+# An internet stream takes seconds to connect and buffer and FM has to
+# power up and tune, so sound would start late. If prepare is given it
+# is called alarm.leadTime() seconds before the alarm goes off, with
+# the time the alarm will go off, so the source can be started muted.
+#
+#    scheduler = AlarmScheduler(fire, prepare)
+#                # fire(alarm, when) and prepare(alarm, when) run on
+#                # the scheduler thread
+#    scheduler.setAlarms(alarmStore.list())
+#    scheduler.start()
+#    alarm, when = scheduler.next()
+#
+# crontab is kept as a fallback for when acr.py is not running, see
+# alarmstore.py
+#
+#########################
+
+import datetime
+import heapq
+import itertools
+import threading
+import time
+
+
+# seconds between wall clock checks
+MAX_SLEEP = 30.0
+
+# wall clock and monotonic clock differences bigger than this are a jump
+JUMP = 2.0
+
+# alarms missed by a clock jump by less than this still go off
+MISSED_GRACE = 300.0
+
+# heap entry kinds
+PREPARE = 0
+FIRE = 1
+
+
+# next time alarm goes off after the local time after, as seconds since
+# the epoch
+def nextFireTime(alarm, after):
+    day = after.replace(hour=alarm.hour, minute=alarm.minute, second=0, microsecond=0)
+    if day <= after:
+        day += datetime.timedelta(days=1)
+    for i in range(8):
+        # crontab days start with Sunday = 0, isoweekday has Sunday = 7
+        if not alarm.weekdays or day.isoweekday() % 7 in alarm.weekdays:
+            return time.mktime(day.timetuple())
+        day += datetime.timedelta(days=1)
+    return None
+
+
+# 7h 12m
+def untilText(seconds):
+    minutes = int(max(seconds, 0) + 59) // 60
+    hours, minutes = divmod(minutes, 60)
+    if hours >= 24:
+        return str(hours // 24) + "d " + str(hours % 24) + "h"
+    if hours:
+        return str(hours) + "h " + str(minutes) + "m"
+    return str(minutes) + "m"
+
+
+class AlarmScheduler:
+    def __init__(self, fire, prepare=None, log=None):
+        self.fire = fire
+        self.prepare = prepare
+        self.log = log
+
+        # (wall clock time, seq, alarm id, PREPARE or FIRE, time the
+        # alarm goes off)
+        self.heap = []
+        # alarm id -> (alarm, seq of its live heap entry)
+        self.alarms = {}
+        # alarm id -> the time it last went off
+        self.lastFired = {}
+        self.seq = itertools.count()
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = None
+        self.fired = 0
+
+    def printMsg(self, s):
+        if self.log is not None:
+            self.log(s)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='alarms')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join(1)
+
+    # push the next time alarm goes off, call with condition held
+    def schedule(self, alarm, now):
+        when = nextFireTime(alarm, datetime.datetime.fromtimestamp(now))
+        seq = next(self.seq)
+        self.alarms[alarm.id] = (alarm, seq)
+        if when is None:
+            return
+        heapq.heappush(self.heap, (when, seq, alarm.id, FIRE, when))
+        lead = alarm.leadTime()
+        if self.prepare is not None and lead > 0:
+            # comes up right away if the alarm is closer than lead
+            heapq.heappush(self.heap, (when - lead, seq, alarm.id, PREPARE, when))
+
+    def add(self, alarm):
+        with self.condition:
+            self.schedule(alarm, time.time())
+            self.condition.notify()
+
+    def remove(self, id):
+        with self.condition:
+            # the heap entry is dropped when it reaches the top
+            self.alarms.pop(id, None)
+            self.condition.notify()
+
+    def setAlarms(self, alarms):
+        with self.condition:
+            self.heap = []
+            self.alarms = {}
+            now = time.time()
+            for alarm in alarms:
+                self.schedule(alarm, now)
+            self.condition.notify()
+
+    # call with condition held
+    def dropStale(self):
+        while self.heap:
+            if self.live(self.heap[0]):
+                return
+            heapq.heappop(self.heap)
+
+    def live(self, e):
+        entry = self.alarms.get(e[2])
+        return entry is not None and entry[1] == e[1]
+
+    # the next alarm and the time it goes off, or (None, None)
+    def next(self):
+        with self.condition:
+            fires = [e for e in self.heap if e[3] == FIRE and self.live(e)]
+            if not fires:
+                return None, None
+            e = min(fires)
+            return self.alarms[e[2]][0], e[4]
+
+    def reschedule(self, now):
+        alarms = [a for a, seq in self.alarms.values()]
+        self.heap = []
+        self.alarms = {}
+        for alarm in alarms:
+            after = now
+            # a clock set back a little must not sound an alarm twice
+            last = self.lastFired.get(alarm.id)
+            if last is not None and now < last < now + MISSED_GRACE:
+                after = last
+            self.schedule(alarm, after)
+
+    def run(self):
+        # (function, alarm, time it goes off) to call without the lock
+        calls = []
+        with self.condition:
+            wall = time.time()
+            mono = time.monotonic()
+            while not self.stopped:
+                self.dropStale()
+                now = time.time()
+                elapsed = time.monotonic() - mono
+                if abs((now - wall) - elapsed) > JUMP:
+                    self.printMsg("clock jumped " + str(round((now - wall) - elapsed)) + "s, rescheduling alarms")
+                    # alarms in the part of the day that was skipped
+                    # still go off if it was not too long ago
+                    for t, seq, id, kind, when in self.heap:
+                        if kind == FIRE and self.live((t, seq, id)) and when <= now and now - when < MISSED_GRACE:
+                            calls.append((self.fire, self.alarms[id][0], when))
+                            self.lastFired[id] = when
+                    self.reschedule(now)
+                    self.dropStale()
+                wall = now
+                mono = time.monotonic()
+
+                while self.heap and self.heap[0][0] <= now:
+                    t, seq, id, kind, when = heapq.heappop(self.heap)
+                    alarm = self.alarms[id][0]
+                    if kind == PREPARE:
+                        # the FIRE entry decides whether a late alarm goes off
+                        if now - when < MISSED_GRACE:
+                            calls.append((self.prepare, alarm, when))
+                    else:
+                        if now - when < MISSED_GRACE:
+                            calls.append((self.fire, alarm, when))
+                            self.lastFired[id] = when
+                        # and the next time it goes off
+                        self.schedule(alarm, max(now, when + 1))
+                    self.dropStale()
+
+                if calls:
+                    # never call out with the lock held
+                    self.condition.release()
+                    try:
+                        for fn, alarm, when in calls:
+                            if fn == self.fire:
+                                self.fired += 1
+                                self.printMsg("alarm " + str(alarm.id) + " " + alarm.timeText() + " going off")
+                            fn(alarm, when)
+                    finally:
+                        self.condition.acquire()
+                    calls = []
+                    continue
+
+                timeout = MAX_SLEEP
+                if self.heap:
+                    timeout = min(timeout, max(self.heap[0][0] - now, 0))
+                self.condition.wait(timeout)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# alarmstore.py keeps the alarms and the crontab entries that start
+# them in step.
+#
+# acr.py used to keep the alarms only in crontab, as the text of each
+# job. Removing an alarm re-read crontab, removed every alarm with its
+# own crontab write and added them all back, again one write each, so
+# the remaining alarms could be renumbered alarm0, alarm1, ...
+#
+# AlarmStore keeps the alarms in memory, indexed by a stable id, and
+# saves them in /home/pi/radio/alarms.json. Every change:
+#    1. changes the alarms in memory
+#    2. rewrites the alarm jobs in the crontab object and writes
+#       crontab once
+#    3. saves alarms.json (a new file renamed over the old one)
+# If crontab or alarms.json cannot be written the change is undone.
+#
+# Each alarm has one crontab job with the comment acr-alarm-<id>, the
+# id never changes. The first time AlarmStore runs without alarms.json
+# the old alarm<n> jobs are read from crontab and converted.
+#
+#    store = AlarmStore('/home/pi/radio/alarms.json', CronTab(user='pi'))
+#    store.load()
+#    alarm = store.add(6, 30, [1, 2, 3, 4, 5], 'songs', 60)
+#    store.remove(alarm.id)
+#
+# weekdays uses crontab's day numbers, 0 is Sunday. No weekdays means
+# every day
+#
+# While acr.py is running its own scheduler sounds the alarms (see
+# alarmscheduler.py). The crontab job is only a fallback, it checks
+# with pgrep that acr.py is not running before it runs mpc play
+#
+#########################
+
+import json
+import os
+import re
+
+
+COMMENT_PREFIX = 'acr-alarm-'
+
+# comments acr.py used before alarmstore.py
+LEGACY_COMMENT = re.compile(r'^alarm\d+$')
+LEGACY_VOLUME = re.compile(r'Digital (\d+)')
+
+SOURCES = ('songs', 'iradio', 'fm')
+
+# seconds before the alarm each source is started muted, a stream has
+# to connect and buffer, FM has to power up and tune
+LEAD_TIMES = {'songs': 3, 'iradio': 20, 'fm': 10}
+
+
+class Alarm:
+    def __init__(self, id, hour, minute, weekdays=(), source='songs', volume=60, lead=None):
+        self.id = id
+        self.hour = int(hour)
+        self.minute = int(minute)
+        self.weekdays = sorted(set(int(d) % 7 for d in weekdays))
+        self.source = source
+        self.volume = int(volume)
+        # None uses the source's LEAD_TIMES
+        self.lead = lead
+
+    def asDict(self):
+        return {
+            'id': self.id,
+            'hour': self.hour,
+            'minute': self.minute,
+            'weekdays': self.weekdays,
+            'source': self.source,
+            'volume': self.volume,
+            'lead': self.lead,
+        }
+
+    @classmethod
+    def fromDict(cls, d):
+        return cls(d['id'], d['hour'], d['minute'], d.get('weekdays', ()), d.get('source', 'songs'), d.get('volume', 60), d.get('lead'))
+
+    # seconds before the alarm to start the source muted
+    def leadTime(self):
+        if self.lead is not None:
+            return self.lead
+        return LEAD_TIMES.get(self.source, 0)
+
+    def comment(self):
+        return COMMENT_PREFIX + str(self.id)
+
+    def cronDow(self):
+        if not self.weekdays:
+            return '*'
+        return ','.join(str(d) for d in self.weekdays)
+
+    def command(self):
+        # [.] keeps pgrep from finding this command's own shell
+        cmd = '/usr/bin/pgrep -f "acr[.]py" > /dev/null || ('
+        cmd += '/usr/bin/mpc play; '
+        # need to escape % because it is a special character in crontab
+        cmd += "/usr/bin/amixer set Digital " + str(self.volume) + "\\%)"
+        return cmd
+
+    def timeText(self):
+        return str(self.hour).zfill(2) + ":" + str(self.minute).zfill(2)
+
+
+# crontab day of week field to a list of days, * is every day
+def parseDow(dow):
+    dow = str(dow)
+    if dow == '*':
+        return []
+    days = []
+    for part in dow.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            days.extend(range(int(first), int(last) + 1))
+        else:
+            days.append(int(part))
+    return days
+
+
+class AlarmStore:
+    def __init__(self, path, cron, log=None):
+        self.path = path
+        self.cron = cron
+        self.log = log
+
+        # id -> Alarm
+        self.alarms = {}
+        self.nextId = 1
+
+    def printMsg(self, s):
+        if self.log is not None:
+            self.log(s)
+
+    # alarms in time order
+    def list(self):
+        return sorted(self.alarms.values(), key=lambda a: (a.hour, a.minute, a.id))
+
+    def get(self, id):
+        return self.alarms.get(id)
+
+    def __len__(self):
+        return len(self.alarms)
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                saved = json.load(f)
+        except (IOError, OSError, ValueError):
+            saved = None
+
+        if saved is None:
+            self.migrate()
+            return
+
+        self.alarms = {}
+        for d in saved.get('alarms', []):
+            alarm = Alarm.fromDict(d)
+            self.alarms[alarm.id] = alarm
+        self.nextId = max([saved.get('nextId', 1)] + [a.id + 1 for a in self.alarms.values()])
+
+        # crontab edited by hand or written by an older acr.py
+        if self.cronJobs() != self.expectedJobs():
+            self.printMsg("crontab alarms out of date, rewriting them")
+            self.commit(dict(self.alarms), self.nextId)
+
+    def isAlarmJob(self, job):
+        c = str(job.comment)
+        return c.startswith(COMMENT_PREFIX) or LEGACY_COMMENT.match(c) is not None
+
+    # (comment, command, schedule) of the alarm jobs in crontab
+    def cronJobs(self):
+        jobs = set()
+        for job in self.cron:
+            if self.isAlarmJob(job):
+                jobs.add((str(job.comment), str(job.command), str(job.minute), str(job.hour), str(job.dow)))
+        return jobs
+
+    def expectedJobs(self):
+        return set((a.comment(), a.command(), str(a.minute), str(a.hour), a.cronDow()) for a in self.alarms.values())
+
+    # read the alarm<n> jobs written by older versions of acr.py
+    def migrate(self):
+        self.alarms = {}
+        for job in self.cron:
+            if not LEGACY_COMMENT.match(str(job.comment)):
+                continue
+            # older versions wrote minute 0 as *
+            minute = str(job.minute)
+            if not minute.isdigit():
+                minute = 0
+            volume = 60
+            m = LEGACY_VOLUME.search(str(job.command))
+            if m is not None:
+                volume = int(m.group(1))
+            alarm = Alarm(self.nextId, str(job.hour), minute, parseDow(job.dow), 'songs', volume)
+            self.alarms[alarm.id] = alarm
+            self.nextId += 1
+        if self.alarms:
+            # the old jobs are replaced by acr-alarm-<id> jobs
+            self.commit(dict(self.alarms), self.nextId)
+            self.printMsg("converted " + str(len(self.alarms)) + " crontab alarms")
+        else:
+            self.save()
+
+    def save(self):
+        saved = {
+            'nextId': self.nextId,
+            'alarms': [a.asDict() for a in self.list()],
+        }
+        # write a new file and rename it so a crash never leaves half a file
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(saved, f, indent=1)
+        os.rename(tmp, self.path)
+
+    # replace every alarm job in the crontab object, nothing is written
+    def syncJobs(self):
+        old = [job for job in self.cron if self.isAlarmJob(job)]
+        for job in old:
+            self.cron.remove(job)
+        for alarm in self.list():
+            job = self.cron.new(command=alarm.command(), comment=alarm.comment())
+            job.setall(alarm.minute, alarm.hour, '*', '*', alarm.cronDow())
+
+    # alarms and nextId are the state from before the change, they are
+    # put back if crontab or alarms.json cannot be written
+    def commit(self, alarms, nextId):
+        try:
+            self.syncJobs()
+            self.cron.write()
+            self.save()
+        except Exception:
+            self.alarms = alarms
+            self.nextId = nextId
+            self.syncJobs()
+            raise
+
+    def add(self, hour, minute, weekdays=(), source='songs', volume=60, lead=None):
+        before = (dict(self.alarms), self.nextId)
+        alarm = Alarm(self.nextId, hour, minute, weekdays, source, volume, lead)
+        self.alarms[alarm.id] = alarm
+        self.nextId += 1
+        self.commit(*before)
+        self.printMsg("alarm " + str(alarm.id) + " set for " + alarm.timeText())
+        return alarm
+
+    def update(self, id, **changes):
+        before = (dict(self.alarms), self.nextId)
+        d = self.alarms[id].asDict()
+        d.update(changes)
+        self.alarms[id] = Alarm.fromDict(d)
+        self.commit(*before)
+        return self.alarms[id]
+
+    def remove(self, id):
+        if id not in self.alarms:
+            return False
+        before = (dict(self.alarms), self.nextId)
+        del self.alarms[id]
+        self.commit(*before)
+        self.printMsg("alarm " + str(id) + " removed")
+        return True
+
+    def removeAll(self):
+        before = (dict(self.alarms), self.nextId)
+        self.alarms = {}
+        self.commit(*before)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# assets.py loads the button images.
+#
+# acr.py used to create every tk.PhotoImage when it started, each from
+# its own hard coded path. up.gif was read twice and songs.gif, which
+# is not in the repository, stopped acr.py from starting at all.
+#
+# Assets loads an image the first time it is asked for and then keeps
+# it, so every button using up.gif shares one PhotoImage and the mode
+# images are only read when that mode is first shown:
+#
+#    assets = Assets(radioGUI, '/home/pi/radio/images', '/home/pi/radio/cache')
+#    upButton = tk.Button(radioGUI, image=assets.get('up'), ...)
+#
+# An image that is missing uses the one in FALLBACKS, songs uses
+# music.gif.
+#
+# The images are drawn for a DESIGN_WIDTH x DESIGN_HEIGHT screen. On a
+# different screen they are scaled by a fraction with a small
+# denominator, with tkinter's zoom and subsample. Scaling a GIF is
+# slow on a Raspberry Pi, so the scaled image is saved in cacheDir and
+# read from there on the next start, until the original changes.
+#
+# stats() counts the images read, the ones read from the cache and the
+# loads that were saved by sharing an image
+#
+#########################
+
+import fractions
+import os
+import tkinter as tk
+
+
+# the screen the images were drawn for, the Raspberry Pi 7" touchscreen
+DESIGN_WIDTH = 800
+DESIGN_HEIGHT = 480
+
+# zoom(n).subsample(d) makes a big temporary image for big n
+MAX_DENOMINATOR = 8
+
+# name -> image to use if name.gif does not exist
+FALLBACKS = {'songs': 'music'}
+
+
+# the fraction to scale the images by for a screen
+def screenScale(width, height):
+    if width <= 0 or height <= 0:
+        return fractions.Fraction(1)
+    scale = min(fractions.Fraction(width, DESIGN_WIDTH), fractions.Fraction(height, DESIGN_HEIGHT))
+    scale = scale.limit_denominator(MAX_DENOMINATOR)
+    if scale <= 0:
+        return fractions.Fraction(1, MAX_DENOMINATOR)
+    return scale
+
+
+class Assets:
+    def __init__(self, root, directory, cacheDir=None, scale=None, log=None):
+        self.root = root
+        self.directory = directory
+        self.cacheDir = cacheDir
+        self.log = log
+        if scale is None:
+            scale = screenScale(root.winfo_screenwidth(), root.winfo_screenheight())
+        self.scale = fractions.Fraction(scale)
+
+        # name -> PhotoImage
+        self.images = {}
+        # path of the original -> PhotoImage, names that fall back to
+        # the same file share one image
+        self.bySource = {}
+
+        self.loads = 0
+        self.cacheLoads = 0
+        self.shared = 0
+
+    def printMsg(self, s):
+        if self.log is not None:
+            self.log(s)
+
+    def get(self, name):
+        image = self.images.get(name)
+        if image is not None:
+            self.shared += 1
+            return image
+
+        source = self.sourcePath(name)
+        image = self.bySource.get(source)
+        if image is None:
+            image = self.load(name, source)
+            self.bySource[source] = image
+        else:
+            self.shared += 1
+        self.images[name] = image
+        return image
+
+    # the file to read for name, following FALLBACKS
+    def sourcePath(self, name):
+        tried = name
+        while True:
+            path = os.path.join(self.directory, tried + '.gif')
+            if os.path.exists(path) or tried not in FALLBACKS:
+                if tried != name:
+                    self.printMsg("image " + name + ".gif not found, using " + tried + ".gif")
+                return path
+            tried = FALLBACKS[tried]
+
+    def cachePath(self, source):
+        name = os.path.splitext(os.path.basename(source))[0]
+        return os.path.join(self.cacheDir, name + '-' + str(self.scale.numerator) + '-' + str(self.scale.denominator) + '.gif')
+
+    def load(self, name, source):
+        if self.scale == 1:
+            self.loads += 1
+            return tk.PhotoImage(master=self.root, file=source)
+
+        cached = None
+        if self.cacheDir is not None:
+            cached = self.cachePath(source)
+            try:
+                if os.stat(cached).st_mtime >= os.stat(source).st_mtime:
+                    self.cacheLoads += 1
+                    return tk.PhotoImage(master=self.root, file=cached)
+            except (OSError, tk.TclError):
+                # not cached yet, or the original changed
+                pass
+
+        self.loads += 1
+        image = tk.PhotoImage(master=self.root, file=source)
+        if self.scale.numerator > 1:
+            image = image.zoom(self.scale.numerator)
+        if self.scale.denominator > 1:
+            image = image.subsample(self.scale.denominator)
+
+        if cached is not None:
+            tmp = cached + '.tmp'
+            try:
+                if not os.path.isdir(self.cacheDir):
+                    os.makedirs(self.cacheDir)
+                image.write(tmp, format='gif')
+                os.rename(tmp, cached)
+            except (OSError, tk.TclError) as ex:
+                self.printMsg("could not cache scaled " + name + ": " + str(ex))
+        return image
+
+    def stats(self):
+        return {'loads': self.loads, 'cacheLoads': self.cacheLoads, 'shared': self.shared, 'scale': str(self.scale)}
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# bench.py measures how fast the alarm clock radio answers a button
+# and how it copes with a big music library, station list or many
+# alarms. It runs on the simulated backends in hal.py, so it needs no
+# Raspberry Pi, and writes its results as JSON so two versions can be
+# compared.
+#
+# It measures:
+#    - every button in the control row (modePress, playStopPress,
+#      nextPress, backPress, volumeUpPress and volumeDownPress) in
+#      songs, FM and iRadio mode, the time from the press until
+#         handled  the button function returned
+#         done     everything the press started has finished, the
+#                  executor and the coalescer are idle again
+#    - initPlaylist (musiclibrary.py) with 1000, 10000 and 50000
+#      songs: building the playlist, loading it unchanged and adding
+#      1% new songs
+#    - initStation (stationcatalog.py) with 1000, 10000 and 50000
+#      stations: parsing all_stations.m3u, loading the cache, a refresh
+#      when nothing changed and a search
+#    - adding and removing an alarm with 10, 100 and 1000 alarms set
+#
+# The presses are made by the real acr.py: bench.py writes a trace of
+# them and runs acr.py with ACR_BACKEND=sim and ACR_REPLAY, see
+# replay.py. acr.py replays the trace one press at a time and writes
+# the time each one took to the report bench.py reads. Like any
+# ACR_BACKEND=sim run it needs a DISPLAY or Xvfb
+#
+# Run it with:
+#
+#    $ python3 bench.py results.json
+#
+# and compare with an earlier run, the results whose p50 got more than
+# 25% slower are listed and the exit status is 1:
+#
+#    $ python3 bench.py results.json old.json
+#
+# Without a file name the JSON is written to stdout. All times are in
+# seconds
+#
+#########################
+
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from mpdclient import MPDClient, MPDError
+from fakempd import FakeMPDServer
+from musiclibrary import syncPlaylist
+from stationcatalog import StationCatalog, parseStations
+from alarmstore import Alarm, AlarmStore
+from alarmscheduler import AlarmScheduler
+from fakecron import SimulatedCron
+from replay import Event, writeTrace
+from metrics import msText
+
+
+# bump when the layout of the results changes
+RESULTS_VERSION = 2
+
+ACR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'acr.py')
+
+# everything runAll creates goes in WORK_DIR, removed at the end
+WORK_DIR = None
+
+# presses of each button in each mode, even so play/stop ends stopped
+PRESSES = 20
+# the buttons pressed in every mode
+BUTTONS = ('nextPress', 'backPress', 'volumeUpPress', 'volumeDownPress', 'playStopPress')
+# what modePress changes the mode to
+NEXT_MODE = {"songs": "fm", "fm": "iradio", "iradio": "songs"}
+# runs of each scaling benchmark, the p50 is their median
+REPEATS = 3
+ALARM_REPEATS = 10
+
+PLAYLIST_SIZES = (1000, 10000, 50000)
+CATALOG_SIZES = (1000, 10000, 50000)
+ALARM_COUNTS = (10, 100, 1000)
+
+# songs and stations used for the button presses
+SONGS = 50
+STATIONS = 100
+
+SEARCHES = ('jazz', 'new orl', 'rleans', 'classic rock')
+
+# seconds acr.py gets to start, replay the presses and exit
+ACR_TIMEOUT = 900
+
+# compare: slower by more than REGRESSION, and by more than NOISE
+# seconds, is a regression
+REGRESSION = 0.25
+NOISE = 0.0002
+
+GENRES = ('jazz', 'classic rock', 'blues', 'country', 'news', 'talk', 'classical', 'indie', 'folk', 'soul')
+CITIES = ('new orleans', 'austin', 'chicago', 'seattle', 'memphis', 'boston', 'denver', 'portland')
+
+
+def printMsg(s):
+    sys.stderr.write(s + "\n")
+    sys.stderr.flush()
+
+
+# count, min, avg, p50, p95 and max of a list of seconds
+def summarize(samples):
+    if not samples:
+        return {'count': 0}
+    s = sorted(samples)
+
+    def percentile(p):
+        return s[max(int(math.ceil(p / 100.0 * len(s))) - 1, 0)]
+
+    return {
+        'count': len(s),
+        'min': s[0],
+        'avg': sum(s) / len(s),
+        'p50': percentile(50),
+        'p95': percentile(95),
+        'max': s[-1],
+    }
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
+
+
+# a path in WORK_DIR, the ACR_HOME acr.py runs with
+def homePath(*parts):
+    return os.path.join(WORK_DIR, *parts)
+
+
+def makeFiles(directory, names):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for name in names:
+        open(os.path.join(directory, name), 'w').close()
+
+
+def songNames(n, prefix="Song"):
+    return [prefix + " " + str(i).zfill(5) + ".m4a" for i in range(n)]
+
+
+def streamUrl(i):
+    return "http://127.0.0.1:8000/stream/" + str(i)
+
+
+def writeCatalog(path, n):
+    line = ""
+    with open(path, 'w') as f:
+        f.write("#EXTM3U\n")
+        for i in range(n):
+            genre = GENRES[i % len(GENRES)]
+            city = CITIES[(i // len(GENRES)) % len(CITIES)]
+            # commas separate the fields, none in the names
+            line = ",".join([
+                "Station " + str(i),
+                genre + " from " + city + " " + str(i),
+                "the best " + genre + " in " + city + " - listener supported radio number " + str(i),
+                streamUrl(i),
+            ]) + "\n"
+            f.write(line)
+
+    # the stream must come back as the stream, not as another field
+    stations = parseStations([line])
+    if n > 0 and (len(stations) != 1 or stations[0][3] != streamUrl(n - 1)):
+        raise RuntimeError(path + " does not parse back, station " + str(n - 1) + " is " + str(stations))
+
+
+# the presses benchPresses makes, and for each one the name of the
+# result it counts for, or None for presses that only get to a mode
+def pressTrace():
+    events = []
+    names = []
+    mode = "songs"
+
+    def press(button, name=None):
+        events.append(Event(len(events) * 100, 'tk', button))
+        names.append(name)
+
+    # songs -> fm -> iradio -> songs ...
+    for i in range(PRESSES):
+        mode = NEXT_MODE[mode]
+        press('modePress', "press.modePress." + mode)
+    for m in ("songs", "fm", "iradio"):
+        while mode != m:
+            mode = NEXT_MODE[mode]
+            press('modePress')
+        # next and back change the song only while it is playing
+        press('playStopPress')
+        for button in BUTTONS:
+            for i in range(PRESSES):
+                press(button, "press." + button + "." + m)
+    return events, names
+
+
+def tail(path, n=20):
+    try:
+        with open(path, 'r') as f:
+            return ''.join(f.readlines()[-n:])
+    except (IOError, OSError):
+        return ""
+
+
+# run acr.py on the sim backends replaying trace, returns the report
+def replay(trace):
+    env = dict(os.environ)
+    env['ACR_BACKEND'] = 'sim'
+    env['ACR_HOME'] = WORK_DIR
+    env['ACR_REPLAY'] = trace
+    env['ACR_REPLAY_SPEED'] = '0'
+    env.pop('ACR_RECORD', None)
+    status = subprocess.call([sys.executable, ACR], env=env, stdout=subprocess.DEVNULL, timeout=ACR_TIMEOUT)
+    report = trace + '.report.json'
+    if not os.path.exists(report):
+        raise RuntimeError("acr.py exited with " + str(status) + " and no replay report, the end of acr.log:\n" + tail(homePath('radio', 'acr.log')))
+    with open(report, 'r') as f:
+        return json.load(f)
+
+
+# times is a list of [seconds until handled, seconds until done], None
+# for a press that never got there
+def record(results, name, times):
+    for i, what in enumerate(('handled', 'done')):
+        samples = [t[i] for t in times if t[i] is not None]
+        r = summarize(samples)
+        r['timeouts'] = len(times) - len(samples)
+        results[name + "." + what] = r
+
+
+# returns the metrics.py histograms of the backend calls acr.py made
+def benchPresses(results):
+    makeFiles(homePath('Music'), songNames(SONGS))
+    makeFiles(homePath('Stations', 'playlists'), [])
+    writeCatalog(homePath('Stations', 'playlists', 'all_stations.m3u'), STATIONS)
+
+    events, names = pressTrace()
+    trace = os.path.join(WORK_DIR, 'presses.txt')
+    writeTrace(trace, events)
+    printMsg("acr.py replaying " + str(len(events)) + " presses")
+    report = replay(trace)
+    if report['lost'] or report['ignored']:
+        printMsg("acr.py lost " + str(report['lost']) + " presses and ignored " + str(report['ignored']))
+
+    times = {}
+    for press, name in zip(report['presses'], names):
+        if name is not None:
+            times.setdefault(name, []).append(press[1:])
+    for name, t in sorted(times.items()):
+        record(results, name, t)
+    return report.get('backend') or {}
+
+
+def benchPlaylist(results, n):
+    printMsg("initPlaylist with " + str(n) + " songs")
+    server = FakeMPDServer().start()
+    mpd = MPDClient('127.0.0.1', server.port)
+    directory = os.path.join(WORK_DIR, 'music' + str(n))
+    stampFile = os.path.join(WORK_DIR, 'music' + str(n) + '.stamp')
+    makeFiles(directory, songNames(n))
+
+    build = []
+    commands = 0
+    for r in range(REPEATS):
+        try:
+            mpd.rm("all_songs")
+        except MPDError:
+            pass
+        if os.path.exists(stampFile):
+            os.remove(stampFile)
+        before = server.commands
+        build.append(timed(syncPlaylist, mpd, directory, "all_songs", stampFile))
+        commands = server.commands - before
+    results["playlist." + str(n) + ".build"] = summarize(build)
+    results["playlist." + str(n) + ".build"]['mpdCommands'] = commands
+
+    results["playlist." + str(n) + ".unchanged"] = summarize([timed(syncPlaylist, mpd, directory, "all_songs", stampFile) for r in range(REPEATS)])
+
+    update = []
+    for r in range(REPEATS):
+        makeFiles(directory, songNames(max(n // 100, 1), "New " + str(r)))
+        update.append(timed(syncPlaylist, mpd, directory, "all_songs", stampFile))
+    results["playlist." + str(n) + ".add1pct"] = summarize(update)
+
+    mpd.close()
+    server.stop()
+    shutil.rmtree(directory)
+
+
+def benchCatalog(results, n):
+    printMsg("initStation with " + str(n) + " stations")
+    path = os.path.join(WORK_DIR, 'stations' + str(n) + '.m3u')
+    cacheFile = os.path.join(WORK_DIR, 'stations' + str(n) + '.cache')
+    writeCatalog(path, n)
+
+    results["catalog." + str(n) + ".parse"] = summarize([timed(StationCatalog(path).refresh) for r in range(REPEATS)])
+
+    StationCatalog(path, cacheFile).refresh()
+    results["catalog." + str(n) + ".cached"] = summarize([timed(StationCatalog(path, cacheFile).refresh) for r in range(REPEATS)])
+
+    catalog = StationCatalog(path, cacheFile)
+    catalog.refresh()
+    results["catalog." + str(n) + ".unchanged"] = summarize([timed(catalog.refresh) for r in range(REPEATS)])
+
+    search = []
+    for r in range(REPEATS):
+        for query in SEARCHES:
+            search.append(timed(catalog.search, query))
+    results["catalog." + str(n) + ".search"] = summarize(search)
+
+
+def benchAlarms(results, n):
+    printMsg("alarms with " + str(n) + " set")
+    cron = SimulatedCron(os.path.join(WORK_DIR, 'crontab' + str(n)))
+    store = AlarmStore(os.path.join(WORK_DIR, 'alarms' + str(n) + '.json'), cron)
+    store.load()
+    for i in range(n):
+        alarm = Alarm(i + 1, i % 24, i % 60, [i % 7], 'songs', 60)
+        store.alarms[alarm.id] = alarm
+    store.nextId = n + 1
+    store.commit({}, 1)
+    scheduler = AlarmScheduler(lambda alarm, when: None)
+    scheduler.setAlarms(store.list())
+
+    # setAlarm and removeAlarm in acr.py
+    add = []
+    remove = []
+    writes = cron.writes
+    for r in range(ALARM_REPEATS):
+        started = time.perf_counter()
+        alarm = store.add(6, 30, [1, 2, 3, 4, 5])
+        scheduler.add(alarm)
+        add.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        store.remove(alarm.id)
+        scheduler.remove(alarm.id)
+        remove.append(time.perf_counter() - started)
+    results["alarms." + str(n) + ".add"] = summarize(add)
+    results["alarms." + str(n) + ".add"]['cronWrites'] = (cron.writes - writes) / (2.0 * ALARM_REPEATS)
+    results["alarms." + str(n) + ".remove"] = summarize(remove)
+
+
+def gitCommit():
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL)
+        return out.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def runAll():
+    global WORK_DIR
+
+    results = {}
+    started = time.time()
+    WORK_DIR = tempfile.mkdtemp(prefix='acr-bench-')
+    try:
+        backend = benchPresses(results)
+        for n in PLAYLIST_SIZES:
+            benchPlaylist(results, n)
+        for n in CATALOG_SIZES:
+            benchCatalog(results, n)
+        for n in ALARM_COUNTS:
+            benchAlarms(results, n)
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+        WORK_DIR = None
+    return {
+        'version': RESULTS_VERSION,
+        'commit': gitCommit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)),
+        'took': time.time() - started,
+        'results': results,
+        # every mpd, I2C and mixer call acr.py made
+        'backend': backend,
+    }
+
+
+# names of results whose p50 is more than REGRESSION slower than in
+# baseline, with the old and new p50
+def compare(new, baseline):
+    slower = []
+    old = baseline.get('results', {})
+    for name, r in sorted(new['results'].items()):
+        b = old.get(name)
+        if not b or not b.get('count') or not r.get('count'):
+            continue
+        if r['p50'] > b['p50'] * (1 + REGRESSION) and r['p50'] - b['p50'] > NOISE:
+            slower.append((name, b['p50'], r['p50']))
+    return slower
+
+
+if __name__ == '__main__':
+    results = runAll()
+    for name, r in sorted(results['results'].items()):
+        if r.get('count'):
+            printMsg(name + ": p50 " + msText(r['p50']) + " p95 " + msText(r['p95']) + " max " + msText(r['max']) + " ms")
+
+    text = json.dumps(results, indent=1, sort_keys=True)
+    if len(sys.argv) > 1:
+        tmp = sys.argv[1] + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(text + "\n")
+        os.rename(tmp, sys.argv[1])
+    else:
+        print(text)
+
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], 'r') as f:
+            baseline = json.load(f)
+        slower = compare(results, baseline)
+        for name, before, after in slower:
+            printMsg("slower: " + name + " p50 " + msText(before) + " -> " + msText(after) + " ms")
+        if slower:
+            sys.exit(1)
+        printMsg("nothing slower than " + (baseline.get('commit') or sys.argv[2]))
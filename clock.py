@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# clock.py wakes acr.py up when the minute changes, so the clock can be
+# redrawn.
+#
+# acr.py used to redraw the date and time every 2 seconds. That woke
+# the Raspberry Pi up 43,200 times a day to show 1,440 different times,
+# and the time on the screen could be up to 2 seconds behind.
+#
+# MinuteClock works out from the wall clock how long it is until the
+# next minute starts, and sleeps until then:
+#    - onMinute(now) is called once a minute, just after the minute
+#      starts
+#    - onDay(now) is called when the date changes, and once at the start
+# where now is a datetime.datetime. Both are called through post, so
+# they run in the tkinter main loop:
+#
+#    clock = MinuteClock(guiCall, showTime, showDate)
+#    clock.start()
+#
+# The sleep is measured with time.monotonic(). If the wall clock is
+# changed (NTP setting the clock after boot, daylight saving time, the
+# Pi being suspended) the wake up is at most a minute late, and the
+# next one is worked out from the new wall clock. A wake up that comes
+# too early does not call onMinute, it just sleeps again.
+#
+#########################
+
+import datetime
+import threading
+import time
+
+
+# seconds after the minute to wake up, so a slightly early wake up
+# still sees the new minute
+MARGIN = 0.005
+
+# wall clock and monotonic clock differences bigger than this are a jump
+JUMP = 2.0
+
+
+# seconds from the wall clock time now to the start of the next minute
+def untilNextMinute(now):
+    return 60.0 - now % 60.0
+
+
+class MinuteClock:
+    def __init__(self, post, onMinute, onDay=None, log=None):
+        self.post = post
+        self.onMinute = onMinute
+        self.onDay = onDay
+        self.log = log
+
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = None
+
+        # the minute and date last shown
+        self.minute = None
+        self.day = None
+
+        self.wakeups = 0
+        self.jumps = 0
+        # how long after the minute started onMinute was posted
+        self.maxLate = 0.0
+
+    def printMsg(self, s):
+        if self.log is not None:
+            self.log(s)
+
+    def start(self):
+        self.tick(time.time())
+        self.thread = threading.Thread(target=self.run, name='clock')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join(1)
+
+    # post onMinute, and onDay when the date changed, returns False if
+    # the minute has not changed yet
+    def tick(self, now):
+        minute = int(now // 60)
+        if minute == self.minute:
+            return False
+        self.minute = minute
+        dt = datetime.datetime.fromtimestamp(now)
+        if self.onDay is not None and dt.date() != self.day:
+            self.day = dt.date()
+            self.post(self.onDay, dt)
+        self.post(self.onMinute, dt)
+        return True
+
+    def run(self):
+        with self.condition:
+            while not self.stopped:
+                wall = time.time()
+                mono = time.monotonic()
+                self.condition.wait(untilNextMinute(wall) + MARGIN)
+                if self.stopped:
+                    return
+                self.wakeups += 1
+                now = time.time()
+                elapsed = time.monotonic() - mono
+                jumped = abs((now - wall) - elapsed) > JUMP
+                if jumped:
+                    self.jumps += 1
+                    self.printMsg("clock jumped " + str(round((now - wall) - elapsed)) + "s")
+                if self.tick(now) and not jumped:
+                    self.maxLate = max(self.maxLate, now % 60.0)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# coalesce.py turns a burst of button presses into one command.
+#
+# Every press of volume up/down or next/back used to queue its own
+# amixer, mpd or I2C command. Pressing next five times on FM tuned five
+# times, one after the other, and the radio kept changing stations for
+# seconds after the last press.
+#
+# With a Coalescer the button callback changes the screen right away
+# and then calls press() with a key and a function. The function only
+# runs once no press with the same key has come for delay seconds, so
+# a burst of presses sends one command, with the final state:
+#
+#    coalescer = Coalescer(radioGUI)
+#
+#    def nextPress():
+#        fmIndex += 1
+#        updateSongText()
+#        coalescer.press("tune", sendTune)
+#
+#    def sendTune():
+#        executor.submit("tune", changeFmChannel, (FavoriteFmStations[fmIndex],), key="tune")
+#
+# The function is called on the tkinter thread, through widget.after,
+# and should read the state when it runs. A button held down or pressed
+# without stopping still sends a command every maxDelay seconds, so the
+# volume can be heard changing.
+#
+# flush() sends whatever is pending right away, before a change (like
+# a new mode) that the functions would read the wrong state after.
+#
+# stats() shows how many presses came in and how many commands were
+# sent for each key
+#
+#########################
+
+import time
+
+
+# seconds without a press before the command is sent
+DELAY = 0.15
+
+# a burst never waits longer than this to send
+MAX_DELAY = 0.6
+
+
+class Pending:
+    def __init__(self, fn, now):
+        self.fn = fn
+        self.first = now
+        self.job = None
+
+
+class Coalescer:
+    def __init__(self, widget, delay=DELAY, maxDelay=MAX_DELAY, log=None):
+        self.widget = widget
+        self.delay = delay
+        self.maxDelay = maxDelay
+        self.log = log
+
+        # key -> Pending
+        self.pending = {}
+        # key -> [presses, commands sent]
+        self.counts = {}
+
+    def printMsg(self, s):
+        if self.log is not None:
+            self.log(s)
+
+    # call fn once presses with this key stop, call on the tkinter thread
+    def press(self, key, fn):
+        now = time.monotonic()
+        counts = self.counts.setdefault(key, [0, 0])
+        counts[0] += 1
+
+        p = self.pending.get(key)
+        if p is None:
+            p = Pending(fn, now)
+            self.pending[key] = p
+        else:
+            self.widget.after_cancel(p.job)
+            p.fn = fn
+
+        wait = self.delay
+        if now + wait - p.first > self.maxDelay:
+            wait = max(p.first + self.maxDelay - now, 0)
+        p.job = self.widget.after(int(wait * 1000), self.send, key)
+
+    def send(self, key):
+        p = self.pending.pop(key, None)
+        if p is None:
+            return
+        self.counts[key][1] += 1
+        try:
+            p.fn()
+        except Exception as ex:
+            self.printMsg("coalesced " + key + " failed: " + str(ex))
+
+    # send every pending command now, call on the tkinter thread
+    def flush(self):
+        for key in list(self.pending):
+            self.widget.after_cancel(self.pending[key].job)
+            self.send(key)
+
+    # key -> {'presses', 'sent', 'saved'}
+    def stats(self):
+        stats = {}
+        for key, (presses, sent) in self.counts.items():
+            stats[key] = {'presses': presses, 'sent': sent, 'saved': presses - sent - (1 if key in self.pending else 0)}
+        return stats
+
+    def saved(self):
+        return sum(s['saved'] for s in self.stats().values())
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# executor.py runs slow hardware commands (I2C, mpd, amixer) on a
+# worker thread so tkinter button callbacks return right away.
+#
+# changeFmChannel and initFM sleep for seconds at a time. Run inside
+# a button callback they froze the whole touch screen, including the
+# clock. With CommandExecutor the callback only updates the screen and
+# queues the slow part:
+#
+#    executor = CommandExecutor(post=guiCall)
+#    executor.submit("tune", changeFmChannel, (947,), key="tune",
+#                    onDone=lambda result: updateSongText())
+#
+# Commands run one at a time, in the order they were submitted, so
+# the radio hardware only ever sees one command at once.
+#
+# A command with a key supersedes older commands with the same key:
+#    - queued commands with that key are dropped
+#    - a running command with that key is marked cancelled, long
+#      running commands check cancelled() and stop early
+# so pressing next five times on FM only tunes once or twice.
+# cancel(key) does the same without queueing a new command.
+#
+# onDone and onError run on the tkinter thread through post, so they
+# can safely change widgets.
+#
+# queueDepth() and stats() show how busy the worker is and how long
+# each kind of command waits in the queue and takes to run
+#
+#########################
+
+import collections
+import threading
+import time
+
+
+# thread local so a running command can find itself
+current = threading.local()
+
+
+# True if a newer command with the same key has been submitted
+# while the calling command is running
+def cancelled():
+    command = getattr(current, 'command', None)
+    return command is not None and command.cancelled
+
+
+class Command:
+    def __init__(self, name, fn, args, key, onDone, onError):
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.key = key
+        self.onDone = onDone
+        self.onError = onError
+        self.cancelled = False
+        self.submitted = time.monotonic()
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class CommandStats:
+    def __init__(self):
+        self.count = 0
+        self.cancelled = 0
+        self.errors = 0
+        self.waitTotal = 0.0
+        self.runTotal = 0.0
+        self.runLast = 0.0
+        self.runMax = 0.0
+
+    def asDict(self):
+        n = max(self.count, 1)
+        return {
+            'count': self.count,
+            'cancelled': self.cancelled,
+            'errors': self.errors,
+            'waitAvg': self.waitTotal / n,
+            'runAvg': self.runTotal / n,
+            'runLast': self.runLast,
+            'runMax': self.runMax,
+        }
+
+
+class CommandExecutor:
+    def __init__(self, post=None, log=None, slow=1.0):
+        self.post = post
+        self.log = log
+        # commands taking longer than slow seconds are logged
+        self.slow = slow
+
+        self.queue = collections.deque()
+        self.condition = threading.Condition()
+        self.running = None
+        self.commandStats = collections.defaultdict(CommandStats)
+        self.stopped = False
+
+        self.thread = threading.Thread(target=self.run, name='executor')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def printMsg(self, s):
+        if self.log is not None:
+            self.log(s)
+
+    def submit(self, name, fn, args=(), key=None, onDone=None, onError=None):
+        command = Command(name, fn, args, key, onDone, onError)
+        with self.condition:
+            if key is not None:
+                self.cancelKey(key)
+            self.queue.append(command)
+            self.condition.notify()
+        return command
+
+    # cancel the queued and running commands with key without
+    # submitting a new one, returns True if there were any
+    def cancel(self, key):
+        with self.condition:
+            found = self.cancelKey(key)
+            self.condition.notify_all()
+            return found
+
+    # called with self.condition held
+    def cancelKey(self, key):
+        found = False
+        kept = collections.deque()
+        for c in self.queue:
+            if c.key == key:
+                c.cancel()
+                self.commandStats[c.name].cancelled += 1
+                found = True
+            else:
+                kept.append(c)
+        self.queue = kept
+        if self.running is not None and self.running.key == key and not self.running.cancelled:
+            self.running.cancel()
+            found = True
+        return found
+
+    def queueDepth(self):
+        with self.condition:
+            n = len(self.queue)
+            if self.running is not None:
+                n += 1
+            return n
+
+    def stats(self):
+        with self.condition:
+            return dict((name, s.asDict()) for name, s in self.commandStats.items())
+
+    # wait until every queued command has run, returns False on timeout
+    def wait(self, timeout=None):
+        end = None
+        if timeout is not None:
+            end = time.monotonic() + timeout
+        with self.condition:
+            while self.queue or self.running is not None:
+                remaining = None
+                if end is not None:
+                    remaining = end - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                self.condition.wait(remaining)
+        return True
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            for c in self.queue:
+                c.cancel()
+            self.queue.clear()
+            if self.running is not None:
+                self.running.cancel()
+            self.condition.notify_all()
+        self.thread.join(5)
+
+    def deliver(self, fn, *args):
+        if fn is None:
+            return
+        if self.post is None:
+            fn(*args)
+        else:
+            self.post(fn, *args)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                command = self.queue.popleft()
+                self.running = command
+
+            started = time.monotonic()
+            current.command = command
+            result = None
+            error = None
+            try:
+                result = command.fn(*command.args)
+            except Exception as ex:
+                error = ex
+            current.command = None
+            finished = time.monotonic()
+
+            wait = started - command.submitted
+            took = finished - started
+            with self.condition:
+                s = self.commandStats[command.name]
+                s.count += 1
+                s.waitTotal += wait
+                s.runTotal += took
+                s.runLast = took
+                s.runMax = max(s.runMax, took)
+                if error is not None:
+                    s.errors += 1
+                if command.cancelled:
+                    s.cancelled += 1
+                self.running = None
+                self.condition.notify_all()
+
+            if took > self.slow:
+                self.printMsg("slow command " + command.name + " took " + str(round(took, 2)) + "s")
+
+            if error is not None:
+                self.printMsg("command " + command.name + " failed: " + str(error))
+                self.deliver(command.onError, error)
+            elif not command.cancelled:
+                self.deliver(command.onDone, result)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# fakecron.py simulates python-crontab's CronTab, for running acr.py
+# without touching the real crontab.
+#
+# SimulatedCron has the parts of CronTab that alarmstore.py uses:
+# iterating over the jobs, new, remove and write. The jobs are kept in
+# memory. If path is given, write() saves them there in crontab format
+# and they are read back the next time:
+#
+#    cron = SimulatedCron('/tmp/acr/crontab')
+#    job = cron.new(command='/usr/bin/mpc play', comment='acr-alarm-1')
+#    job.setall(30, 6, '*', '*', '1-5')
+#    cron.write()
+#
+# writes counts the calls to write(), so a script can check that a
+# change only writes crontab once
+#
+#########################
+
+import os
+
+
+class SimulatedJob:
+    def __init__(self, command='', comment=''):
+        self.command = command
+        self.comment = comment
+        self.minute = '*'
+        self.hour = '*'
+        self.dom = '*'
+        self.month = '*'
+        self.dow = '*'
+
+    def setall(self, minute, hour, dom, month, dow):
+        self.minute = str(minute)
+        self.hour = str(hour)
+        self.dom = str(dom)
+        self.month = str(month)
+        self.dow = str(dow)
+
+    def render(self):
+        line = ' '.join([self.minute, self.hour, self.dom, self.month, self.dow, self.command])
+        if self.comment:
+            line += ' # ' + self.comment
+        return line
+
+
+def parseJob(line):
+    comment = ''
+    if ' # ' in line:
+        line, comment = line.rsplit(' # ', 1)
+    fields = line.split(None, 5)
+    if len(fields) < 6:
+        return None
+    job = SimulatedJob(fields[5], comment.strip())
+    job.setall(*fields[:5])
+    return job
+
+
+class SimulatedCron:
+    def __init__(self, path=None):
+        self.path = path
+        self.jobs = []
+        self.writes = 0
+        if path is not None and os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        job = parseJob(line)
+                        if job is not None:
+                            self.jobs.append(job)
+
+    def __iter__(self):
+        return iter(list(self.jobs))
+
+    def new(self, command='', comment=''):
+        job = SimulatedJob(command, comment)
+        self.jobs.append(job)
+        return job
+
+    def remove(self, job):
+        self.jobs.remove(job)
+
+    def write(self):
+        self.writes += 1
+        if self.path is None:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            for job in self.jobs:
+                f.write(job.render() + '\n')
+        os.rename(tmp, self.path)
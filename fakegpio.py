@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# fakegpio.py simulates RPi.GPIO, for running acr.py without a
+# Raspberry Pi.
+#
+# SimulatedGpio has the RPi.GPIO functions and constants acr.py and
+# si4703.py use, so it can be used in place of the module:
+#
+#    GPIO = SimulatedGpio()
+#    GPIO.setmode(GPIO.BCM)
+#    GPIO.setup(17, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+#    GPIO.add_event_detect(17, GPIO.FALLING, callback=toggleBacklight, bouncetime=200)
+#
+# An input reads HIGH with a pull up and LOW otherwise. A script
+# presses a button by pulling its input low:
+#
+#    GPIO.press(17, hold=0.1)
+#
+# Like RPi.GPIO, edge callbacks run on their own thread, one at a
+# time, and an edge within bouncetime of the last one is ignored.
+#
+# edges counts the edges seen on each channel, and PWM keeps the last
+# duty cycle, so a script can check the backlight
+#
+#########################
+
+import queue
+import threading
+import time
+import traceback
+
+
+class SimulatedPWM:
+    def __init__(self, gpio, channel, frequency):
+        self.gpio = gpio
+        self.channel = channel
+        self.frequency = frequency
+        self.duty = None
+
+    def start(self, duty):
+        self.duty = duty
+
+    def ChangeDutyCycle(self, duty):
+        self.duty = duty
+
+    def ChangeFrequency(self, frequency):
+        self.frequency = frequency
+
+    def stop(self):
+        self.duty = None
+
+
+class SimulatedGpio:
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        self.mode = None
+        self.lock = threading.Lock()
+        # channel -> direction
+        self.directions = {}
+        # channel -> level
+        self.levels = {}
+        # channel -> (edge, callbacks, bouncetime in seconds)
+        self.events = {}
+        # channel -> time of the last edge that called back
+        self.lastEdge = {}
+        self.edges = {}
+        self.pwms = {}
+
+        self.callbacks = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name='gpio')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setwarnings(self, flag):
+        pass
+
+    def channels(self, channel):
+        if isinstance(channel, (list, tuple)):
+            return channel
+        return [channel]
+
+    def setup(self, channel, direction, pull_up_down=PUD_OFF, initial=None):
+        with self.lock:
+            for c in self.channels(channel):
+                self.directions[c] = direction
+                if direction == self.IN:
+                    self.levels[c] = self.HIGH if pull_up_down == self.PUD_UP else self.LOW
+                else:
+                    self.levels[c] = self.LOW if initial is None else initial
+
+    def input(self, channel):
+        with self.lock:
+            return self.levels.get(channel, self.LOW)
+
+    def output(self, channel, value):
+        with self.lock:
+            for c in self.channels(channel):
+                self.levels[c] = self.HIGH if value else self.LOW
+
+    def PWM(self, channel, frequency):
+        pwm = SimulatedPWM(self, channel, frequency)
+        self.pwms[channel] = pwm
+        return pwm
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        with self.lock:
+            callbacks = []
+            if callback is not None:
+                callbacks.append(callback)
+            self.events[channel] = (edge, callbacks, (bouncetime or 0) / 1000.0)
+
+    def add_event_callback(self, channel, callback):
+        with self.lock:
+            self.events[channel][1].append(callback)
+
+    def remove_event_detect(self, channel):
+        with self.lock:
+            self.events.pop(channel, None)
+
+    def cleanup(self, channel=None):
+        with self.lock:
+            if channel is None:
+                self.directions.clear()
+                self.events.clear()
+            else:
+                for c in self.channels(channel):
+                    self.directions.pop(c, None)
+                    self.events.pop(c, None)
+
+    #########################
+    # simulation
+
+    # change an input's level as if something outside the Pi did,
+    # returns True if edge callbacks were called
+    def setInput(self, channel, level):
+        with self.lock:
+            old = self.levels.get(channel, self.LOW)
+            self.levels[channel] = level
+            if old == level:
+                return False
+            edge = self.FALLING if level == self.LOW else self.RISING
+            self.edges[channel] = self.edges.get(channel, 0) + 1
+            event = self.events.get(channel)
+            if event is None or event[0] not in (edge, self.BOTH):
+                return False
+            now = time.monotonic()
+            last = self.lastEdge.get(channel)
+            if last is not None and now - last < event[2]:
+                return False
+            self.lastEdge[channel] = now
+            for callback in event[1]:
+                self.callbacks.put((callback, channel))
+            return len(event[1]) > 0
+
+    # a button between the input and ground, held for hold seconds,
+    # returns True if pressing it called back
+    def press(self, channel, hold=0.05):
+        called = self.setInput(channel, self.LOW)
+        time.sleep(hold)
+        called = self.setInput(channel, self.HIGH) or called
+        return called
+
+    def run(self):
+        while True:
+            callback, channel = self.callbacks.get()
+            try:
+                callback(channel)
+            except Exception:
+                # RPi.GPIO prints the traceback and carries on
+                traceback.print_exc()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# fakemixer.py simulates the ALSA Digital volume control, for running
+# acr.py without a sound card.
+#
+# SimulatedMixer works like AlsaMixer and AmixerMixer in mixer.py:
+# set(volume) skips setting the volume it already has. Every volume it
+# was set to is kept, with the time, so a script can check a fade:
+#
+#    mixer = SimulatedMixer()
+#    ramper.ramp('digital', mixer.set, 0, 60, 2.0)
+#    print(mixer.history)
+#
+# setTime seconds are slept for each set, like a real mixer taking
+# time to answer
+#
+#########################
+
+import threading
+import time
+
+
+class SimulatedMixer:
+    def __init__(self, control='Digital', setTime=0.0, log=None):
+        self.control = control
+        self.setTime = setTime
+        self.log = log
+        self.lock = threading.Lock()
+        self.volume = None
+        self.sets = 0
+        # (time.monotonic(), volume)
+        self.history = []
+
+    def set(self, volume):
+        volume = int(volume)
+        with self.lock:
+            if volume == self.volume:
+                return
+            if self.setTime > 0:
+                time.sleep(self.setTime)
+            self.volume = volume
+            self.sets += 1
+            self.history.append((time.monotonic(), volume))
+
+    def close(self):
+        pass
@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# fakempd.py is a local stand-in for mpd. It speaks enough of the mpd
+# protocol for acr.py and mpdclient.py to run without a Raspberry Pi,
+# a sound card or a music library.
+#
+# Start it on its own using:
+#
+#    $ python3 fakempd.py [port]
+#
+# and point mpc or acr.py at it:
+#
+#    $ MPD_PORT=6601 mpc status
+#
+# or start it inside another script:
+#
+#    server = FakeMPDServer()
+#    server.start()
+#    mpd = MPDClient('127.0.0.1', server.port)
+#
+# Nothing is played. The queue, stored playlists, play state and
+# volume are kept in memory. Song titles come from the file name,
+# for example "file:///home/pi/Music/Blue Sky.m4a" has the title
+# "Blue Sky"
+#
+# server.commands counts every command received, so a script can
+# check how many round trips something costs
+#
+# idle and noidle work, commands that change the queue, the play
+# state, stored playlists or the volume wake up idle clients
+#
+# elapsed in status counts up from play. For http streams it only
+# starts after server.state.bufferTime seconds, like a stream that
+# has to connect and buffer first
+#
+#########################
+
+import os
+import select
+import socketserver
+import sys
+import threading
+import time
+
+
+class FakeMPDAck(Exception):
+    def __init__(self, code, message):
+        Exception.__init__(self, message)
+        self.code = code
+        self.message = message
+
+
+# mpd error codes used below
+ACK_ERROR_ARG = 2
+ACK_ERROR_NO_EXIST = 50
+ACK_ERROR_EXIST = 56
+ACK_ERROR_UNKNOWN = 5
+
+# subsystems each command changes, reported to idle clients
+CHANGES = {
+    'play': ('player',),
+    'stop': ('player',),
+    'pause': ('player',),
+    'next': ('player',),
+    'previous': ('player',),
+    'clear': ('playlist', 'player'),
+    'add': ('playlist',),
+    'addid': ('playlist',),
+    'delete': ('playlist', 'player'),
+    'load': ('playlist',),
+    'save': ('stored_playlist',),
+    'rm': ('stored_playlist',),
+    'playlistadd': ('stored_playlist',),
+    'playlistdelete': ('stored_playlist',),
+    'playlistclear': ('stored_playlist',),
+    'setvol': ('mixer',),
+}
+
+
+def splitArgs(line):
+    # mpd arguments are separated by spaces and may be quoted with
+    # double quotes, backslash escapes the next character
+    args = []
+    i = 0
+    n = len(line)
+    while i < n:
+        if line[i] == ' ':
+            i += 1
+            continue
+        if line[i] == '"':
+            i += 1
+            s = ''
+            while i < n and line[i] != '"':
+                if line[i] == '\\' and i + 1 < n:
+                    i += 1
+                s += line[i]
+                i += 1
+            i += 1
+            args.append(s)
+        else:
+            j = line.find(' ', i)
+            if j < 0:
+                j = n
+            args.append(line[i:j])
+            i = j
+    return args
+
+
+def titleFromUri(uri):
+    name = os.path.basename(uri.rstrip('/'))
+    base, ext = os.path.splitext(name)
+    if ext and not uri.startswith('http'):
+        return base
+    return ''
+
+
+class FakeMPDState:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.condition = threading.Condition(self.lock)
+        # one set of pending changes for every connected client
+        self.clients = []
+        self.queue = []
+        self.playlists = {}
+        self.state = 'stop'
+        self.current = -1
+        self.playStarted = 0.0
+        # seconds a stream takes to connect and buffer
+        self.bufferTime = 0.0
+        self.volume = 100
+        self.nextId = 1
+        self.playlistVersion = 1
+        self.commands = 0
+
+    def songAt(self, pos):
+        if pos < 0 or pos >= len(self.queue):
+            raise FakeMPDAck(ACK_ERROR_ARG, "Bad song index")
+        return self.queue[pos]
+
+    def songPairs(self, pos):
+        song = self.queue[pos]
+        pairs = [('file', song['file'])]
+        if song['title']:
+            pairs.append(('Title', song['title']))
+        pairs.append(('Pos', str(pos)))
+        pairs.append(('Id', str(song['id'])))
+        return pairs
+
+    def queueChanged(self):
+        self.playlistVersion += 1
+
+    def addSong(self, uri, pos=None):
+        song = {'file': uri, 'title': titleFromUri(uri), 'id': self.nextId}
+        self.nextId += 1
+        if pos is None:
+            self.queue.append(song)
+        else:
+            if pos < 0 or pos > len(self.queue):
+                raise FakeMPDAck(ACK_ERROR_ARG, "Bad song index")
+            self.queue.insert(pos, song)
+            if pos <= self.current:
+                self.current += 1
+        self.queueChanged()
+        return song['id']
+
+    def changed(self, subsystems):
+        with self.lock:
+            for pending in self.clients:
+                pending.update(subsystems)
+            self.condition.notify_all()
+
+    def storedPlaylist(self, name):
+        if name not in self.playlists:
+            raise FakeMPDAck(ACK_ERROR_NO_EXIST, "No such playlist")
+        return self.playlists[name]
+
+    #########################
+    # one method per mpd command, each returns a list of pairs
+
+    def cmdPing(self):
+        return []
+
+    def cmdStatus(self):
+        pairs = [
+            ('volume', str(self.volume)),
+            ('repeat', '0'),
+            ('random', '0'),
+            ('single', '0'),
+            ('consume', '0'),
+            ('playlist', str(self.playlistVersion)),
+            ('playlistlength', str(len(self.queue))),
+            ('state', self.state),
+        ]
+        if 0 <= self.current < len(self.queue):
+            pairs.append(('song', str(self.current)))
+            pairs.append(('songid', str(self.queue[self.current]['id'])))
+            if self.state != 'stop':
+                elapsed = time.monotonic() - self.playStarted
+                if self.queue[self.current]['file'].startswith('http'):
+                    elapsed -= self.bufferTime
+                pairs.append(('elapsed', '%.3f' % max(elapsed, 0)))
+        return pairs
+
+    def cmdCurrentsong(self):
+        if 0 <= self.current < len(self.queue):
+            return self.songPairs(self.current)
+        return []
+
+    def cmdPlay(self, pos=None):
+        if pos is not None:
+            self.songAt(int(pos))
+            self.current = int(pos)
+        elif self.current < 0:
+            if not self.queue:
+                return []
+            self.current = 0
+        if self.state != 'play' or pos is not None:
+            self.playStarted = time.monotonic()
+        self.state = 'play'
+        return []
+
+    def cmdStop(self):
+        self.state = 'stop'
+        return []
+
+    def cmdPause(self, state=None):
+        if self.state == 'stop':
+            return []
+        if state is None:
+            state = '1' if self.state == 'play' else '0'
+        self.state = 'pause' if state == '1' else 'play'
+        return []
+
+    def cmdNext(self):
+        if self.current + 1 < len(self.queue):
+            self.current += 1
+        else:
+            self.current = -1
+            self.state = 'stop'
+        return []
+
+    def cmdPrevious(self):
+        if self.current > 0:
+            self.current -= 1
+        return []
+
+    def cmdClear(self):
+        self.queue = []
+        self.current = -1
+        self.state = 'stop'
+        self.queueChanged()
+        return []
+
+    def cmdAdd(self, uri):
+        self.addSong(uri)
+        return []
+
+    def cmdAddid(self, uri, pos=None):
+        songId = self.addSong(uri, None if pos is None else int(pos))
+        return [('Id', str(songId))]
+
+    def cmdDelete(self, pos):
+        pos = int(pos)
+        self.songAt(pos)
+        del self.queue[pos]
+        if pos < self.current:
+            self.current -= 1
+        elif pos == self.current:
+            self.current = -1
+            self.state = 'stop'
+        self.queueChanged()
+        return []
+
+    def cmdPlaylistinfo(self):
+        pairs = []
+        for pos in range(len(self.queue)):
+            pairs += self.songPairs(pos)
+        return pairs
+
+    def cmdPlaylistsearch(self, tag, value):
+        tag = tag.lower()
+        value = value.lower()
+        pairs = []
+        for pos, song in enumerate(self.queue):
+            if tag in ('title', 'any') and value in song['title'].lower():
+                pairs += self.songPairs(pos)
+            elif tag in ('file', 'any') and value in song['file'].lower():
+                pairs += self.songPairs(pos)
+        return pairs
+
+    def cmdSave(self, name):
+        if name in self.playlists:
+            raise FakeMPDAck(ACK_ERROR_EXIST, "Playlist already exists")
+        self.playlists[name] = [s['file'] for s in self.queue]
+        return []
+
+    def cmdLoad(self, name):
+        for uri in self.storedPlaylist(name):
+            self.addSong(uri)
+        return []
+
+    def cmdRm(self, name):
+        self.storedPlaylist(name)
+        del self.playlists[name]
+        return []
+
+    def cmdListplaylists(self):
+        return [('playlist', name) for name in sorted(self.playlists)]
+
+    def cmdListplaylist(self, name):
+        return [('file', uri) for uri in self.storedPlaylist(name)]
+
+    def cmdPlaylistadd(self, name, uri):
+        self.playlists.setdefault(name, []).append(uri)
+        return []
+
+    def cmdPlaylistdelete(self, name, pos):
+        songs = self.storedPlaylist(name)
+        pos = int(pos)
+        if pos < 0 or pos >= len(songs):
+            raise FakeMPDAck(ACK_ERROR_ARG, "Bad song index")
+        del songs[pos]
+        return []
+
+    def cmdPlaylistclear(self, name):
+        self.playlists[name] = []
+        return []
+
+    def cmdSetvol(self, volume):
+        v = int(volume)
+        if v < 0 or v > 100:
+            raise FakeMPDAck(ACK_ERROR_ARG, "Invalid volume value")
+        self.volume = v
+        return []
+
+    def run(self, name, args):
+        method = getattr(self, 'cmd' + name.capitalize(), None)
+        if method is None:
+            raise FakeMPDAck(ACK_ERROR_UNKNOWN, "unknown command \"" + name + "\"")
+        try:
+            pairs = method(*args)
+        except TypeError:
+            raise FakeMPDAck(ACK_ERROR_ARG, "wrong number of arguments for \"" + name + "\"")
+        if name in CHANGES:
+            self.changed(CHANGES[name])
+        return pairs
+
+
+class FakeMPDHandler(socketserver.StreamRequestHandler):
+    # buffer each response and send it without waiting for acks
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def writeLine(self, line):
+        self.wfile.write((line + '\n').encode('utf-8'))
+
+    def writePairs(self, pairs):
+        for key, value in pairs:
+            self.writeLine(key + ': ' + value)
+
+    def runCommand(self, line):
+        args = splitArgs(line)
+        if not args:
+            raise FakeMPDAck(ACK_ERROR_UNKNOWN, "No command given")
+        state = self.server.state
+        with state.lock:
+            state.commands += 1
+            return state.run(args[0], args[1:])
+
+    # block until a subscribed subsystem changes or the client sends
+    # noidle, returns False if the client went away
+    def idle(self, subsystems):
+        state = self.server.state
+        while True:
+            with state.lock:
+                changed = [s for s in sorted(self.pending) if not subsystems or s in subsystems]
+                if changed:
+                    self.pending.difference_update(changed)
+                    break
+                state.condition.wait(0.05)
+
+            readable = select.select([self.connection], [], [], 0)[0]
+            if readable:
+                raw = self.rfile.readline()
+                if not raw:
+                    return False
+                changed = []
+                break
+
+        for s in changed:
+            self.writeLine('changed: ' + s)
+        self.writeLine('OK')
+        self.wfile.flush()
+        return True
+
+    def handle(self):
+        state = self.server.state
+        self.pending = set()
+        with state.lock:
+            state.clients.append(self.pending)
+        try:
+            self.serve()
+        finally:
+            with state.lock:
+                state.clients.remove(self.pending)
+
+    def serve(self):
+        self.writeLine('OK MPD 0.21.0')
+        self.wfile.flush()
+        commandList = None
+        listOk = False
+
+        for raw in self.rfile:
+            line = raw.decode('utf-8').rstrip('\n')
+
+            if line == 'close':
+                return
+
+            if line.startswith('idle') and commandList is None:
+                if not self.idle(splitArgs(line)[1:]):
+                    return
+                continue
+
+            if line == 'noidle':
+                # not idle, nothing to cancel
+                continue
+
+            if line in ('command_list_begin', 'command_list_ok_begin'):
+                commandList = []
+                listOk = line == 'command_list_ok_begin'
+                continue
+
+            if commandList is not None and line != 'command_list_end':
+                commandList.append(line)
+                continue
+
+            isList = line == 'command_list_end'
+            if isList:
+                lines = commandList
+                commandList = None
+            else:
+                lines = [line]
+
+            failed = False
+            for n, l in enumerate(lines):
+                try:
+                    self.writePairs(self.runCommand(l))
+                except FakeMPDAck as ex:
+                    name = splitArgs(l)[0] if l.strip() else ''
+                    self.writeLine('ACK [' + str(ex.code) + '@' + str(n) + '] {' + name + '} ' + ex.message)
+                    failed = True
+                    break
+                if isList and listOk:
+                    self.writeLine('list_OK')
+            if not failed:
+                self.writeLine('OK')
+            self.wfile.flush()
+
+
+class FakeMPDServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        socketserver.TCPServer.__init__(self, (host, port), FakeMPDHandler)
+        self.state = FakeMPDState()
+        self.port = self.server_address[1]
+        self.thread = None
+
+    @property
+    def commands(self):
+        return self.state.commands
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='fakempd')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+    port = 6601
+    if len(sys.argv) > 1:
+        port = int(sys.argv[1])
+    server = FakeMPDServer(port=port)
+    print("fake mpd listening on 127.0.0.1:" + str(server.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# fakesi4703.py simulates an Si4703 FM radio chip on an smbus.
+#
+# SimulatedSi4703Bus has the same read_i2c_block_data and
+# write_i2c_block_data methods as smbus.SMBus and behaves like the chip:
+#    - writes start at register 0x02, reads start at 0x0A and wrap
+#    - setting the TUNE bit tunes to the channel in CHANNEL, after
+#      tuneTime seconds STC is set and READCHAN and RSSI are updated
+#    - clearing TUNE clears STC
+#    - setting SEEK seeks up or down from READCHAN to the next channel
+#      whose RSSI is at least the seek threshold, taking seekStepTime
+#      seconds for every channel it passes
+#
+# Every transaction is counted so a script can check how much I2C
+# traffic something costs:
+#
+#    bus = SimulatedSi4703Bus()
+#    radio = Si4703(bus)
+#    radio.readAll()
+#    print(bus.reads, bus.writes, bus.bytesRead, bus.bytesWritten)
+#
+# stations maps a frequency without the dot (947 for 94.7) to an RSSI,
+# every other channel has an RSSI of noise
+#
+# rds maps a frequency to a (station name, RadioText) tuple. While the
+# chip is tuned to it and RDS is enabled, RDS groups 0A and 2A are sent
+# about 11 times a second. RDSR stays set for 40 ms after each group
+#
+#########################
+
+import threading
+import time
+
+from si4703 import POWERCFG, CHANNEL, SYSCONFIG1, SYSCONFIG2, OSCILLATOR, STATUSRSSI, READCHAN, SI4703_Address
+from si4703 import RDSA, RDSB, RDSC, RDSD, RDS, RDSR
+from si4703 import STC, TUNE, SEEK, SEEKUP, SKMODE, SFBL, ST, LAST_CHANNEL, BAND_BOTTOM, CHANNEL_SPACING
+
+
+# Austin, TX
+DEFAULT_STATIONS = {937: 40, 947: 45, 955: 38, 1023: 30, 1035: 35}
+DEFAULT_RDS = {947: ('KGSR', 'Now playing on 94.7')}
+
+RDS_PI = 0x1234
+RDS_GROUP_TIME = 0.0876
+RDSR_TIME = 0.04
+
+
+# the groups a station sends over and over
+def rdsGroups(ps, rt):
+    groups = []
+    ps = (ps + ' ' * 8)[:8]
+    for segment in range(4):
+        d = ord(ps[segment * 2]) << 8 | ord(ps[segment * 2 + 1])
+        groups.append((RDS_PI, (0 << 12) | segment, 0xE0CD, d))
+    rt = rt[:63] + '\r'
+    rt += ' ' * (-len(rt) % 4)
+    for segment in range(len(rt) // 4):
+        chars = [ord(x) for x in rt[segment * 4:segment * 4 + 4]]
+        c = chars[0] << 8 | chars[1]
+        d = chars[2] << 8 | chars[3]
+        groups.append((RDS_PI, (2 << 12) | segment, c, d))
+    return groups
+
+
+class SimulatedSi4703Bus:
+    def __init__(self, stations=None, tuneTime=0.06, seekStepTime=0.005, noise=8, rds=None, address=SI4703_Address):
+        if stations is None:
+            stations = DEFAULT_STATIONS
+        if rds is None:
+            rds = DEFAULT_RDS
+        self.stations = dict(stations)
+        self.rds = dict(rds)
+        self.tunedAt = None
+        self.tuneTime = tuneTime
+        self.seekStepTime = seekStepTime
+        self.noise = noise
+        self.address = address
+
+        self.regs = [0] * 16
+        self.regs[0x00] = 0x1242   # DEVICEID
+        self.regs[0x01] = 0x1253   # CHIPID, Si4703 rev C
+        self.tuneDone = None
+        self.lock = threading.Lock()
+
+        self.reads = 0
+        self.writes = 0
+        self.bytesRead = 0
+        self.bytesWritten = 0
+
+    @property
+    def transactions(self):
+        return self.reads + self.writes
+
+    def resetCounts(self):
+        self.reads = 0
+        self.writes = 0
+        self.bytesRead = 0
+        self.bytesWritten = 0
+
+    def checkAddress(self, address):
+        if address != self.address:
+            raise IOError("no device at address " + hex(address))
+
+    # US band, 200 kHz spacing
+    def frequency(self, channel):
+        return BAND_BOTTOM + channel * CHANNEL_SPACING
+
+    def rssi(self, channel):
+        return self.stations.get(self.frequency(channel), self.noise)
+
+    def startTune(self):
+        channel = self.regs[CHANNEL] & 0x03FF
+        self.tuneDone = (time.monotonic() + self.tuneTime, channel, False)
+
+    def startSeek(self):
+        threshold = self.regs[SYSCONFIG2] >> 8
+        step = 1 if self.regs[POWERCFG] & SEEKUP else -1
+        channel = self.regs[READCHAN] & 0x03FF
+        steps = 0
+        failed = False
+        while True:
+            channel += step
+            steps += 1
+            if channel < 0 or channel > LAST_CHANNEL:
+                # SKMODE 1 stops at the band limit, 0 wraps around
+                if self.regs[POWERCFG] & SKMODE:
+                    channel = max(0, min(channel, LAST_CHANNEL))
+                    failed = True
+                    break
+                channel %= LAST_CHANNEL + 1
+            if self.rssi(channel) >= threshold:
+                break
+            if steps > LAST_CHANNEL:
+                failed = True
+                break
+        when = time.monotonic() + self.tuneTime + steps * self.seekStepTime
+        self.tuneDone = (when, channel, failed)
+
+    # finish a tune whose time has passed
+    def step(self):
+        if self.tuneDone is None:
+            return
+        when, channel, failed = self.tuneDone
+        if time.monotonic() < when:
+            return
+        self.tuneDone = None
+        status = self.regs[STATUSRSSI] & 0xC000
+        status |= STC | self.rssi(channel)
+        if self.rssi(channel) > self.noise:
+            status |= ST
+        if failed:
+            status |= SFBL
+        self.tunedAt = when
+        self.regs[STATUSRSSI] = status
+        self.regs[READCHAN] = (self.regs[READCHAN] & 0xFC00) | channel
+
+    # put the RDS group being sent right now in RDSA-RDSD
+    def stepRds(self):
+        self.regs[STATUSRSSI] &= ~RDSR
+        if self.tunedAt is None or not self.regs[SYSCONFIG1] & RDS:
+            return
+        freq = self.frequency(self.regs[READCHAN] & 0x03FF)
+        if freq not in self.rds:
+            return
+        groups = rdsGroups(self.rds[freq][0], self.rds[freq][1])
+        elapsed = time.monotonic() - self.tunedAt
+        n = int(elapsed / RDS_GROUP_TIME)
+        if n == 0 or elapsed - n * RDS_GROUP_TIME > RDSR_TIME:
+            return
+        a, b, c, d = groups[(n - 1) % len(groups)]
+        self.regs[RDSA] = a
+        self.regs[RDSB] = b
+        self.regs[RDSC] = c
+        self.regs[RDSD] = d
+        self.regs[STATUSRSSI] |= RDSR
+
+    def writeRegister(self, r, value):
+        old = self.regs[r]
+        self.regs[r] = value
+        if r == CHANNEL:
+            if value & TUNE and not old & TUNE:
+                self.startTune()
+            if value & TUNE:
+                self.tunedAt = None
+            if not value & TUNE and old & TUNE:
+                self.tuneDone = None
+                self.regs[STATUSRSSI] &= ~(STC | SFBL)
+        if r == POWERCFG:
+            if value & SEEK and not old & SEEK:
+                self.tunedAt = None
+                self.startSeek()
+            if not value & SEEK and old & SEEK:
+                self.tuneDone = None
+                self.regs[STATUSRSSI] &= ~(STC | SFBL)
+
+    def write_i2c_block_data(self, address, cmd, data):
+        self.checkAddress(address)
+        with self.lock:
+            self.step()
+            self.writes += 1
+            data = [cmd] + list(data)
+            self.bytesWritten += len(data)
+            if len(data) % 2:
+                # a lone high byte only changes the top of POWERCFG
+                data.append(self.regs[POWERCFG] & 0xFF)
+            for i in range(0, len(data), 2):
+                r = POWERCFG + i // 2
+                if r > OSCILLATOR:
+                    break
+                self.writeRegister(r, data[i] * 256 + data[i + 1])
+
+    def read_i2c_block_data(self, address, cmd, length=32):
+        self.checkAddress(address)
+        with self.lock:
+            # smbus writes cmd first, the chip takes it as POWERCFG high byte
+            self.regs[POWERCFG] = (cmd << 8) | (self.regs[POWERCFG] & 0xFF)
+            self.step()
+            self.stepRds()
+            self.reads += 1
+            self.bytesRead += length
+            data = []
+            for i in range(length // 2):
+                r = (STATUSRSSI + i) % 16
+                data.append(self.regs[r] >> 8)
+                data.append(self.regs[r] & 0xFF)
+            return data[:length]
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# fakestream.py is a local stand-in for internet radio servers. It
+# serves fake streams over HTTP so stationcheck.py can be tried
+# without the internet.
+#
+# Every stream is a path on the server with its own behavior:
+#
+#    server = FakeStreamServer()
+#    server.addStream('/jazz', delay=0.2, bitrate=128)
+#    server.addStream('/gone', status=404)
+#    server.addStream('/slow', firstByteDelay=10)
+#    server.addStream('/broken', fail='reset')
+#    server.addStream('/moved', redirect='/jazz')
+#    server.start()
+#    url = server.url('/jazz')
+#
+#    delay            seconds before the response headers are sent
+#    firstByteDelay   seconds between the headers and the first byte
+#    status           HTTP status, anything but 200 has no body
+#    contentType      Content-Type header
+#    bitrate          icy-br header, None leaves it out
+#    fail             'reset' closes the connection without a response,
+#                     'empty' sends the headers and then closes
+#    redirect         path or url to redirect to with a 302
+#    icy              answer with ICY 200 OK instead of HTTP/1.0 200 OK,
+#                     like SHOUTcast v1 servers
+#
+# A path that was never added gets a 404. A working stream sends
+# bytes until the client hangs up or duration seconds have passed.
+#
+# Start it on its own using:
+#
+#    $ python3 fakestream.py [port]
+#
+# which serves a few example streams
+#
+#########################
+
+import http.server
+import socketserver
+import sys
+import threading
+import time
+
+
+CHUNK = b'\xff\xfb' * 512
+
+
+class FakeStream:
+    def __init__(self, delay=0.0, firstByteDelay=0.0, status=200, contentType='audio/mpeg',
+                 bitrate=128, fail=None, redirect=None, duration=5.0, icy=False):
+        self.delay = delay
+        self.firstByteDelay = firstByteDelay
+        self.status = status
+        self.contentType = contentType
+        self.bitrate = bitrate
+        self.fail = fail
+        self.redirect = redirect
+        self.duration = duration
+        self.icy = icy
+
+
+class FakeStreamHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests += 1
+        stream = self.server.streams.get(self.path.split('?')[0])
+        if stream is None:
+            self.send_error(404)
+            return
+
+        time.sleep(stream.delay)
+        if stream.fail == 'reset':
+            self.close_connection = True
+            return
+
+        if stream.redirect is not None:
+            self.send_response(302)
+            self.send_header('Location', stream.redirect)
+            self.end_headers()
+            return
+
+        if stream.status != 200:
+            self.send_error(stream.status)
+            return
+
+        if stream.icy:
+            headers = 'ICY 200 OK\r\nContent-Type: ' + stream.contentType + '\r\n'
+            if stream.bitrate is not None:
+                headers += 'icy-br: ' + str(stream.bitrate) + '\r\n'
+            self.wfile.write((headers + '\r\n').encode('latin-1'))
+        else:
+            self.send_response(200)
+            self.send_header('Content-Type', stream.contentType)
+            if stream.bitrate is not None:
+                self.send_header('icy-br', str(stream.bitrate))
+            self.end_headers()
+        self.wfile.flush()
+        if stream.fail == 'empty':
+            return
+
+        time.sleep(stream.firstByteDelay)
+        end = time.monotonic() + stream.duration
+        try:
+            while time.monotonic() < end:
+                self.wfile.write(CHUNK)
+                self.wfile.flush()
+                time.sleep(0.05)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client hung up
+            pass
+
+
+class FakeStreamServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        http.server.HTTPServer.__init__(self, (host, port), FakeStreamHandler)
+        self.port = self.server_address[1]
+        self.streams = {}
+        self.requests = 0
+        self.thread = None
+
+    def addStream(self, path, **kwargs):
+        self.streams[path] = FakeStream(**kwargs)
+        return self.url(path)
+
+    def url(self, path):
+        return 'http://127.0.0.1:' + str(self.port) + path
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='fakestream')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+    port = 8001
+    if len(sys.argv) > 1:
+        port = int(sys.argv[1])
+    server = FakeStreamServer(port=port)
+    server.addStream('/ok', bitrate=128)
+    server.addStream('/slow', delay=2, bitrate=64)
+    server.addStream('/missing', status=404)
+    server.addStream('/reset', fail='reset')
+    server.addStream('/empty', fail='empty')
+    server.addStream('/html', contentType='text/html', bitrate=None)
+    server.addStream('/moved', redirect='/ok')
+    server.addStream('/icy', icy=True)
+    print("fake streams on http://127.0.0.1:" + str(server.port) + "/ok /slow /missing /reset /empty /html /moved /icy")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
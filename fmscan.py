@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# fmscan.py builds a list of the FM stations that can be received,
+# ranked by signal strength, so FM mode is not limited to a hardcoded
+# list of favorite stations.
+#
+# A full scan tunes to every channel from 87.5 to 107.9 MHz and records
+# the RSSI and stereo indicator of each one. The results are saved in
+# /home/pi/radio/fm_stations.json
+#
+# A rescan uses the Si4703's own seek to sweep the band. Seek only
+# stops on channels with a signal, so a sweep takes a few seconds.
+# Only channels whose state changed are tuned and measured again:
+#    - a channel seek found that was not a station before
+#    - a station seek did not find any more
+#
+# The scan runs in small steps so it can share the radio with button
+# presses:
+#
+#    scanner = FmScanner(radio, '/home/pi/radio/fm_stations.json')
+#    scanner.load()
+#    scanner.startFull()      # or scanner.startRescan()
+#    while not scanner.step(8):
+#        pass
+#    print(scanner.stations())
+#
+# cancelled is checked between steps and while the radio tunes or
+# seeks, so a button press does not wait for the scan. A cancelled
+# tune or seek is done again by the next step.
+#
+#########################
+
+import json
+import os
+import time
+
+from si4703 import BAND_BOTTOM, CHANNEL_SPACING, LAST_CHANNEL
+
+
+# a channel with an RSSI at or above this is a station
+STATION_RSSI = 25
+
+# rescan the band when the saved scan is older than this, in seconds
+RESCAN_AGE = 7 * 24 * 3600
+
+
+def frequency(channel):
+    return BAND_BOTTOM + channel * CHANNEL_SPACING
+
+
+def channelOf(freq):
+    return (freq - BAND_BOTTOM) // CHANNEL_SPACING
+
+
+class FmScanner:
+    def __init__(self, radio, indexFile, threshold=STATION_RSSI, tuneTimeout=0.5, cancelled=None, log=None):
+        self.radio = radio
+        self.indexFile = indexFile
+        self.threshold = threshold
+        self.tuneTimeout = tuneTimeout
+        # returns True when the running step has to stop
+        self.cancelled = cancelled
+        self.log = log
+
+        # frequency (947 for 94.7) -> (rssi, stereo)
+        self.channels = {}
+        self.scanned = 0
+        self.job = None
+
+    def printMsg(self, s):
+        if self.log is not None:
+            self.log(s)
+
+    def isCancelled(self):
+        return self.cancelled is not None and self.cancelled()
+
+    def load(self):
+        try:
+            with open(self.indexFile, 'r') as f:
+                index = json.load(f)
+        except (IOError, OSError, ValueError):
+            return False
+
+        self.channels = {}
+        for c in index.get('channels', []):
+            self.channels[int(c['freq'])] = (int(c['rssi']), bool(c['stereo']))
+        self.scanned = index.get('scanned', 0)
+        return True
+
+    def save(self):
+        channels = []
+        for freq in self.stations(ranked=False) + self.others():
+            rssi, stereo = self.channels[freq]
+            channels.append({'freq': freq, 'rssi': rssi, 'stereo': stereo})
+
+        index = {
+            'scanned': self.scanned,
+            'threshold': self.threshold,
+            'stations': self.stations(),
+            'channels': channels,
+        }
+
+        # write a new file and rename it so a crash never leaves half a file
+        tmp = self.indexFile + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(index, f, indent=1)
+        os.rename(tmp, self.indexFile)
+
+    # stations, strongest signal first
+    # ranked=False sorts them by frequency
+    def stations(self, ranked=True):
+        found = [f for f, (rssi, stereo) in self.channels.items() if rssi >= self.threshold]
+        if ranked:
+            found.sort(key=lambda f: (-self.channels[f][0], not self.channels[f][1], f))
+        else:
+            found.sort()
+        return found
+
+    def others(self):
+        return sorted(f for f, (rssi, stereo) in self.channels.items() if rssi < self.threshold)
+
+    def needsScan(self):
+        if not self.channels:
+            return True
+        return time.time() - self.scanned > RESCAN_AGE
+
+    def scanning(self):
+        return self.job is not None
+
+    def startFull(self):
+        self.job = self.fullScan()
+
+    def startRescan(self):
+        if not self.channels:
+            self.startFull()
+        else:
+            self.job = self.rescan()
+
+    # do up to n tunes or seeks, returns True when the scan is finished
+    def step(self, n=1):
+        if self.job is None:
+            return True
+        for i in range(n):
+            if self.isCancelled():
+                return False
+            try:
+                next(self.job)
+            except StopIteration:
+                self.job = None
+                self.scanned = time.time()
+                self.save()
+                self.printMsg("FM scan found " + str(len(self.stations())) + " stations")
+                return True
+        return False
+
+    def tune(self, channel):
+        return self.radio.tune(channel, self.tuneTimeout, self.cancelled)
+
+    # measure one channel, returns False if the tune was cancelled and
+    # the channel has to be probed again
+    def probe(self, channel):
+        if self.tune(channel):
+            self.channels[frequency(channel)] = (self.radio.rssi(), self.radio.stereo())
+        elif self.isCancelled():
+            return False
+        else:
+            self.channels[frequency(channel)] = (0, False)
+        return True
+
+    def fullScan(self):
+        started = time.monotonic()
+        for channel in range(LAST_CHANNEL + 1):
+            while not self.probe(channel):
+                yield
+            yield
+        self.printMsg("FM full scan took " + str(round(time.monotonic() - started, 1)) + "s")
+
+    def rescan(self):
+        started = time.monotonic()
+
+        # start the sweep below the bottom of the band so a station on
+        # the first channel is found
+        last = 0
+        while not self.tune(last) and self.isCancelled():
+            yield
+        yield
+        found = {}
+        if self.radio.rssi() >= self.threshold:
+            found[frequency(0)] = (self.radio.rssi(), self.radio.stereo())
+
+        while True:
+            # a button press between steps tuned somewhere else, or a
+            # cancelled seek stopped half way, seek on from the last
+            # station found
+            if self.radio.channel() != last:
+                self.tune(last)
+            channel = self.radio.seek(up=True, threshold=self.threshold, cancelled=self.cancelled)
+            if channel is None:
+                if self.isCancelled():
+                    yield
+                    continue
+                break
+            last = channel
+            found[frequency(channel)] = (self.radio.rssi(), self.radio.stereo())
+            yield
+
+        known = set(self.stations())
+        changed = known.symmetric_difference(found)
+
+        # seek already measured the stations it stopped on
+        for freq in found:
+            if freq in known:
+                self.channels[freq] = found[freq]
+
+        for freq in sorted(changed):
+            while not self.probe(channelOf(freq)):
+                yield
+            yield
+
+        self.printMsg("FM rescan took " + str(round(time.monotonic() - started, 1)) + "s, " + str(len(changed)) + " channels changed")
@@ -22,6 +22,7 @@ import time
 from datetime import datetime
 
 import tkinter as tk
+from assets import Assets
 # from tkinter import ttk
 
 radioGUI = tk.Tk()
@@ -35,6 +36,9 @@ radioGUI.geometry("{0}x{1}+0+0".format(radioGUI.winfo_screenwidth(), radioGUI.wi
 # radioGUI.geometry("320x240+0+0".format(radioGUI.winfo_screenwidth(), radioGUI.winfo_screenheight()))
 # radioGUI.rowconfigure(1, minsize=200)
 
+# images are read once each and scaled to the screen, see assets.py
+assets = Assets(radioGUI, '/home/pi/radio/images', '/home/pi/radio/cache')
+
 # ??? time and date are not centered
 dateRow = 0
 dateText = tk.StringVar()
@@ -95,7 +99,7 @@ def alarmHourPress():
     alarmHourText.set(str(alarmHour).zfill(2))
 
 
-alarmHourImage = tk.PhotoImage(file='/home/pi/radio/images/up.gif')
+alarmHourImage = assets.get('up')
 alarmHourButton = tk.Button(radioGUI, image=alarmHourImage, command=alarmHourPress, bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0).grid(row=setAlarmRow, column=2)
 
 alarmMinuteLabel = tk.Label(radioGUI, textvariable=alarmMinuteText, font=('arial', 30, 'bold'), fg='red', bg='black').grid(row=setAlarmRow, column=3)
@@ -110,11 +114,11 @@ def alarmMinutePress():
 
     alarmMinuteText.set(str(alarmMinute).zfill(2))
 
-alarmMinuteImage = tk.PhotoImage(file='/home/pi/radio/images/up.gif')
+alarmMinuteImage = assets.get('up')
 alarmMinuteButton = tk.Button(radioGUI, image=alarmMinuteImage, command=alarmMinutePress, bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0).grid(row=setAlarmRow, column=4)
 
-alarmOnImage = tk.PhotoImage(file='/home/pi/radio/images/on.gif')
-alarmOffImage = tk.PhotoImage(file='/home/pi/radio/images/off.gif')
+alarmOnImage = assets.get('on')
+alarmOffImage = assets.get('off')
 
 def alarmOnOffPress():
     global alarmState
@@ -142,9 +146,9 @@ controlRow = 5
 # ??? mode toggles 2nd, 3rd and 4th buttons
 # ??? mode sets: FM, iRadio or Songs
 mode = "songs"
-songsImage = tk.PhotoImage(file='/home/pi/radio/images/songs.gif')
-fmImage = tk.PhotoImage(file='/home/pi/radio/images/fm.gif')
-iRadioImage = tk.PhotoImage(file='/home/pi/radio/images/iradio.gif')
+songsImage = assets.get('songs')
+fmImage = assets.get('fm')
+iRadioImage = assets.get('iradio')
 
 def modePress():
     global mode
@@ -169,8 +173,8 @@ modeButton.grid(row=controlRow, column=0)
 
 
 # ??? play and stop toggle states
-stopImage = tk.PhotoImage(file='/home/pi/radio/images/stop.gif')
-playImage = tk.PhotoImage(file='/home/pi/radio/images/play.gif')
+stopImage = assets.get('stop')
+playImage = assets.get('play')
 playState = "off"
 
 def playStopPress():
@@ -195,25 +199,25 @@ playStopButton.grid(row=controlRow, column=1)
 def backPress():
     i=2
 
-backImage = tk.PhotoImage(file='/home/pi/radio/images/back.gif')
+backImage = assets.get('back')
 backButton = tk.Button(radioGUI, image=backImage, command=backPress, bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0).grid(row=controlRow, column=2)
 
 def nextPress():
     i=2
 
-nextImage = tk.PhotoImage(file='/home/pi/radio/images/next.gif')
+nextImage = assets.get('next')
 nextButton = tk.Button(radioGUI, image=nextImage, command=nextPress, bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0).grid(row=controlRow, column=3)
 
 def volumeUpPress():
     i=2
 
-volumeUpImage = tk.PhotoImage(file='/home/pi/radio/images/volumeup.gif')
+volumeUpImage = assets.get('volumeup')
 volumeUpButton = tk.Button(radioGUI, image=volumeUpImage, command=volumeUpPress, bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0).grid(row=controlRow, column=4)
 
 def volumeDownPress():
     i=2
 
-volumeDownImage = tk.PhotoImage(file='/home/pi/radio/images/volumedown.gif')
+volumeDownImage = assets.get('volumedown')
 volumeDownButton = tk.Button(radioGUI, image=volumeDownImage, command=volumeDownPress, bg='black', borderwidth=0, relief="flat", highlightcolor="black", highlightbackground="black", highlightthickness=0).grid(row=controlRow, column=5)
 
 ##########
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# hal.py picks the hardware acr.py talks to: the real Raspberry Pi, or
+# simulations that run on any Linux box.
+#
+# acr.py used to import RPi.GPIO, smbus and crontab directly and keep
+# its files in /home/pi, so it could not even start anywhere else.
+# It now gets each piece from here:
+#
+#    openGpio()        RPi.GPIO, or SimulatedGpio (fakegpio.py)
+#    openI2c()         smbus.SMBus(1), or SimulatedSi4703Bus
+#                      (fakesi4703.py), a register level Si4703
+#    openCron()        CronTab(user='pi'), or SimulatedCron
+#                      (fakecron.py) saved in ACR_HOME/radio/crontab
+#    openMixer()       the ALSA Digital control (mixer.py), or
+#                      SimulatedMixer (fakemixer.py)
+#    startMpd()        nothing, or starts FakeMPDServer (fakempd.py) in
+#                      this process and points MPD_HOST and MPD_PORT
+#                      at it
+#    startDisplay()    nothing, or starts Xvfb with an 800x480 screen if
+#                      there is no DISPLAY
+#    runCommand()      runs shutdown, reboot, gpio, ... or only logs
+#                      them
+#
+# Two environment variables choose:
+#
+#    ACR_BACKEND   pi (the default) or sim
+#    ACR_HOME      where radio/, Music/ and Stations/ are, /home/pi on
+#                  the Pi and /tmp/acr for sim
+#
+#    $ ACR_BACKEND=sim python3 acr.py
+#
+# With sim the images are read from the directory hal.py is in, and
+# ACR_HOME and its directories are created
+#
+#########################
+
+import os
+import subprocess
+import tempfile
+
+
+BACKENDS = ('pi', 'sim')
+
+BACKEND = os.environ.get('ACR_BACKEND', 'pi')
+if BACKEND not in BACKENDS:
+    raise ValueError("ACR_BACKEND must be one of " + ", ".join(BACKENDS) + ", not " + BACKEND)
+
+if BACKEND == 'sim':
+    HOME = os.environ.get('ACR_HOME', os.path.join(tempfile.gettempdir(), 'acr'))
+else:
+    HOME = os.environ.get('ACR_HOME', '/home/pi')
+
+# width x height x depth of the Xvfb screen, the Raspberry Pi 7" touchscreen
+SIM_SCREEN = '800x480x24'
+
+# what startMpd and startDisplay started, stopped by stop()
+mpdServer = None
+display = None
+
+
+def simulated():
+    return BACKEND == 'sim'
+
+
+# a path under ACR_HOME
+def path(*parts):
+    return os.path.join(HOME, *parts)
+
+
+def prepareHome():
+    if not simulated():
+        return
+    for d in (path('radio', 'cache'), path('Music'), path('Stations', 'playlists')):
+        if not os.path.isdir(d):
+            os.makedirs(d)
+
+
+def imagesDir():
+    if simulated():
+        return os.path.dirname(os.path.abspath(__file__))
+    return path('radio', 'images')
+
+
+def openGpio():
+    if simulated():
+        from fakegpio import SimulatedGpio
+        return SimulatedGpio()
+    import RPi.GPIO as GPIO
+    return GPIO
+
+
+def openI2c(bus=1):
+    if simulated():
+        from fakesi4703 import SimulatedSi4703Bus
+        return SimulatedSi4703Bus()
+    import smbus
+    return smbus.SMBus(bus)
+
+
+def openCron(user='pi'):
+    if simulated():
+        from fakecron import SimulatedCron
+        return SimulatedCron(path('radio', 'crontab'))
+    from crontab import CronTab
+    return CronTab(user=user)
+
+
+def openMixer(control='Digital', log=None):
+    if simulated():
+        from fakemixer import SimulatedMixer
+        return SimulatedMixer(control, log=log)
+    import mixer
+    return mixer.openMixer(control, log=log)
+
+
+# with sim, MPDClient() and NowPlayingWatcher() created after this use
+# the fake mpd
+def startMpd():
+    global mpdServer
+
+    if not simulated() or mpdServer is not None:
+        return mpdServer
+    from fakempd import FakeMPDServer
+    mpdServer = FakeMPDServer().start()
+    os.environ['MPD_HOST'] = '127.0.0.1'
+    os.environ['MPD_PORT'] = str(mpdServer.port)
+    return mpdServer
+
+
+# call before tk.Tk(), returns the Xvfb process or None
+def startDisplay():
+    global display
+
+    if not simulated() or os.environ.get('DISPLAY') or display is not None:
+        return display
+    # Xvfb writes the display number it picked to the pipe
+    r, w = os.pipe()
+    try:
+        display = subprocess.Popen(['Xvfb', '-displayfd', str(w), '-screen', '0', SIM_SCREEN, '-nolisten', 'tcp'],
+                                   pass_fds=(w,), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError:
+        os.close(r)
+        os.close(w)
+        raise RuntimeError("no DISPLAY and Xvfb is not installed ($ sudo apt-get install xvfb)")
+    os.close(w)
+    with os.fdopen(r) as f:
+        number = f.readline().strip()
+    if not number:
+        display.kill()
+        display = None
+        raise RuntimeError("Xvfb did not start")
+    os.environ['DISPLAY'] = ':' + number
+    return display
+
+
+# cmd is a string for the shell or a list, with sim it is only logged
+def runCommand(cmd, log=None, check=False):
+    if simulated():
+        if log is not None:
+            log("sim: not running " + str(cmd))
+        return 0
+    shell = not isinstance(cmd, (list, tuple))
+    if check:
+        return subprocess.check_call(cmd, shell=shell)
+    return subprocess.call(cmd, shell=shell)
+
+
+def stop():
+    global mpdServer
+    global display
+
+    if mpdServer is not None:
+        mpdServer.stop()
+        mpdServer = None
+    if display is not None:
+        display.terminate()
+        display.wait(2)
+        display = None
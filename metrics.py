@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# metrics.py measures how long the hardware and mpd take.
+#
+# When a button takes 3 seconds to do anything it could be mpd, the
+# I2C bus, amixer, crontab or the tkinter main loop being busy. Metrics
+# keeps a count and a latency histogram for each kind of call:
+#
+#    metrics = Metrics()
+#    mpd.command = metrics.wrapCommand("mpd", mpd.command)
+#    metrics.instrument(mixer, 'set', "amixer set")
+#    with metrics.timer("crontab write"):
+#        cron.write()
+#
+# A histogram has fixed buckets, each BUCKET_FACTOR wider than the one
+# before, so adding a time is a bisect and a few additions, and memory
+# does not grow. p50 and p95 are the top of the bucket they fall in,
+# good to within 20%. Cheap enough to leave on all the time.
+#
+# LoopLag schedules an after job every interval seconds on the tkinter
+# main loop and records how late it runs, the time a button press
+# would have waited before its callback started.
+#
+# MetricsServer serves the numbers on localhost only:
+#
+#    $ curl http://127.0.0.1:8077/            one line per histogram
+#    $ curl http://127.0.0.1:8077/metrics     everything as JSON
+#
+# summary() is a one line summary for the log
+#
+#########################
+
+import bisect
+import http.server
+import json
+import socketserver
+import threading
+import time
+
+
+BUCKET_FACTOR = 1.2
+
+
+def bucketBounds(low, high, factor):
+    bounds = []
+    b = low
+    while b < high:
+        bounds.append(b)
+        b *= factor
+    return bounds
+
+
+# bucket upper bounds in seconds, 50 us to about 2 minutes
+BUCKETS = bucketBounds(0.00005, 120, BUCKET_FACTOR)
+
+
+def msText(seconds):
+    ms = seconds * 1000
+    if ms < 10:
+        return str(round(ms, 1))
+    return str(int(round(ms)))
+
+
+class Histogram:
+    def __init__(self):
+        # the last bucket is everything bigger than BUCKETS[-1]
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        if self.count == 0:
+            return 0.0
+        wanted = p / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= wanted and n:
+                if i < len(BUCKETS):
+                    return min(BUCKETS[i], self.max)
+                return self.max
+        return self.max
+
+    def asDict(self):
+        return {
+            'count': self.count,
+            'avg': self.total / max(self.count, 1),
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'max': self.max,
+        }
+
+    def text(self):
+        return str(self.count) + " p50 " + msText(self.percentile(50)) + " p95 " + msText(self.percentile(95)) + " max " + msText(self.max) + " ms"
+
+
+class Timer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, kind, value, tb):
+        self.metrics.observe(self.name, time.monotonic() - self.started)
+        if kind is not None:
+            self.metrics.increment(self.name + " errors")
+        return False
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        # name -> Histogram
+        self.histograms = {}
+        # name -> count
+        self.counters = {}
+
+    def observe(self, name, seconds):
+        with self.lock:
+            h = self.histograms.get(name)
+            if h is None:
+                h = Histogram()
+                self.histograms[name] = h
+            h.add(seconds)
+
+    def increment(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def timer(self, name):
+        return Timer(self, name)
+
+    # fn, timed as name
+    def wrap(self, name, fn):
+        def timed(*args, **kwargs):
+            started = time.monotonic()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                self.increment(name + " errors")
+                raise
+            finally:
+                self.observe(name, time.monotonic() - started)
+        timed.__name__ = getattr(fn, '__name__', name)
+        return timed
+
+    # fn(command, ...), timed as prefix + " " + command
+    def wrapCommand(self, prefix, fn):
+        def timed(command, *args, **kwargs):
+            name = prefix + " " + str(command)
+            started = time.monotonic()
+            try:
+                return fn(command, *args, **kwargs)
+            except Exception:
+                self.increment(name + " errors")
+                raise
+            finally:
+                self.observe(name, time.monotonic() - started)
+        timed.__name__ = getattr(fn, '__name__', prefix)
+        return timed
+
+    # replace the method obj.attr with a timed one
+    def instrument(self, obj, attr, name):
+        setattr(obj, attr, self.wrap(name, getattr(obj, attr)))
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'uptime': time.monotonic() - self.started,
+                'histograms': dict((name, h.asDict()) for name, h in self.histograms.items()),
+                'counters': dict(self.counters),
+            }
+
+    # the histograms with the most total time first
+    def lines(self):
+        with self.lock:
+            hs = sorted(self.histograms.items(), key=lambda item: -item[1].total)
+            lines = [name + ": " + h.text() for name, h in hs]
+            for name, n in sorted(self.counters.items()):
+                lines.append(name + ": " + str(n))
+        return lines
+
+    def summary(self, top=6):
+        with self.lock:
+            hs = sorted(self.histograms.items(), key=lambda item: -item[1].total)[:top]
+            return ", ".join(name + " " + h.text() for name, h in hs)
+
+
+class LoopLag:
+    def __init__(self, widget, metrics, interval=0.25, name="tk loop lag"):
+        self.widget = widget
+        self.metrics = metrics
+        self.interval = interval
+        self.name = name
+        self.due = None
+        self.job = None
+
+    def start(self):
+        self.due = time.monotonic() + self.interval
+        self.job = self.widget.after(int(self.interval * 1000), self.tick)
+
+    def tick(self):
+        now = time.monotonic()
+        self.metrics.observe(self.name, max(now - self.due, 0.0))
+        self.due = now + self.interval
+        self.job = self.widget.after(int(self.interval * 1000), self.tick)
+
+    def stop(self):
+        if self.job is not None:
+            self.widget.after_cancel(self.job)
+            self.job = None
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/metrics':
+            body = json.dumps(self.server.metrics.snapshot(), indent=1, sort_keys=True)
+            contentType = 'application/json'
+        elif path == '/':
+            body = "\n".join(self.server.metrics.lines()) + "\n"
+            contentType = 'text/plain'
+        else:
+            self.send_error(404)
+            return
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class MetricsServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    # localhost only, the numbers are nobody else's business
+    def __init__(self, metrics, port=8077, host='127.0.0.1'):
+        http.server.HTTPServer.__init__(self, (host, port), MetricsHandler)
+        self.metrics = metrics
+        self.port = self.server_address[1]
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name='metrics')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
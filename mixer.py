@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# mixer.py sets the volume without starting a new process every time,
+# and fades the volume in and out.
+#
+# acr.py used to run "amixer set Digital N%" through a shell for every
+# volume change. That is fine for a button press, but a fade needs a
+# step every 40 ms or so.
+#
+# openMixer() returns one of:
+#    - AlsaMixer, an open ALSA mixer handle from pyalsaaudio, if it is
+#      installed ($ sudo apt-get install python3-alsaaudio)
+#    - AmixerMixer, one amixer started with -s that reads commands
+#      from a pipe for the life of acr.py
+# Both have set(volume) and skip setting the volume it already has.
+# set is called by the ramper thread and the executor, so both lock.
+#
+# Ramper runs volume fades on its own thread. A fade calls a setter
+# with the volume at RATE steps a second, on a fixed schedule so late
+# steps do not add up. Each fade has a key, a new fade with the same
+# key replaces the old one:
+#
+#    mixer = openMixer('Digital')
+#    ramper = Ramper()
+#    ramper.ramp('digital', mixer.set, 0, 60, 30.0, EASE_IN)   # wake up
+#    ramper.ramp('fm', setFmVolume, 7, 0, 60.0)                # sleep
+#
+# The same Ramper fades the FM radio, setFmVolume writes one I2C
+# register per step and only when the 0-15 volume changes
+#
+#########################
+
+import subprocess
+import threading
+import time
+
+try:
+    import alsaaudio
+except ImportError:
+    alsaaudio = None
+
+
+# fade steps a second
+RATE = 25
+
+# fade curves, the fraction of the way from start to end at a fraction
+# of the duration
+LINEAR = 'linear'
+# starts slowly, for waking up
+EASE_IN = 'ease in'
+
+
+def curveValue(curve, x):
+    if curve == EASE_IN:
+        return x * x
+    return x
+
+
+class AlsaMixer:
+    def __init__(self, control='Digital', cardindex=-1, log=None):
+        self.control = control
+        self.log = log
+        if cardindex < 0:
+            self.mixer = alsaaudio.Mixer(control)
+        else:
+            self.mixer = alsaaudio.Mixer(control, cardindex=cardindex)
+        self.lock = threading.Lock()
+        self.volume = None
+        self.sets = 0
+
+    def set(self, volume):
+        volume = int(volume)
+        with self.lock:
+            if volume == self.volume:
+                return
+            self.mixer.setvolume(volume)
+            self.volume = volume
+            self.sets += 1
+
+    def close(self):
+        with self.lock:
+            self.mixer.close()
+
+
+class AmixerMixer:
+    def __init__(self, control='Digital', log=None):
+        self.control = control
+        self.log = log
+        self.process = None
+        self.lock = threading.Lock()
+        self.volume = None
+        self.sets = 0
+        self.starts = 0
+
+    def printMsg(self, s):
+        if self.log is not None:
+            self.log(s)
+
+    def start(self):
+        # -s reads amixer commands from stdin, -q does not print the
+        # new setting after each one
+        self.process = subprocess.Popen(['amixer', '-s', '-q'], stdin=subprocess.PIPE, universal_newlines=True)
+        self.starts += 1
+
+    def send(self, line):
+        if self.process is None or self.process.poll() is not None:
+            if self.process is not None:
+                self.printMsg("amixer exited with " + str(self.process.returncode) + ", restarting it")
+            self.start()
+        self.process.stdin.write(line + "\n")
+        self.process.stdin.flush()
+
+    def set(self, volume):
+        volume = int(volume)
+        with self.lock:
+            if volume == self.volume:
+                return
+            line = "sset " + self.control + " " + str(volume) + "%"
+            try:
+                self.send(line)
+            except (BrokenPipeError, OSError):
+                # amixer died between commands, try a new one once
+                self.process = None
+                self.send(line)
+            self.volume = volume
+            self.sets += 1
+
+    def close(self):
+        with self.lock:
+            if self.process is not None:
+                try:
+                    self.process.stdin.close()
+                    self.process.wait(2)
+                except (OSError, subprocess.TimeoutExpired):
+                    # amixer is stuck, acr.py is exiting and must not wait
+                    self.printMsg("amixer did not exit, killing it")
+                    self.process.kill()
+                    self.process.wait()
+                self.process = None
+
+
+def openMixer(control='Digital', log=None):
+    if alsaaudio is not None:
+        try:
+            return AlsaMixer(control, log=log)
+        except alsaaudio.ALSAAudioError as ex:
+            if log is not None:
+                log("ALSA mixer " + control + " not available: " + str(ex))
+    return AmixerMixer(control, log=log)
+
+
+class Fade:
+    def __init__(self, key, setter, start, end, duration, curve, onDone):
+        self.key = key
+        self.setter = setter
+        self.start = start
+        self.end = end
+        self.duration = max(duration, 0.0)
+        self.curve = curve
+        self.onDone = onDone
+        self.started = time.monotonic()
+        self.steps = 0
+        self.maxLate = 0.0
+        # the time of the step being waited for
+        self.due = self.started
+        self.last = None
+
+    # the time of step n
+    def stepTime(self, n):
+        return self.started + n / float(RATE)
+
+    def value(self, now):
+        if self.duration <= 0:
+            return self.end
+        x = min((now - self.started) / self.duration, 1.0)
+        return int(round(self.start + (self.end - self.start) * curveValue(self.curve, x)))
+
+    def finished(self, now):
+        return now - self.started >= self.duration
+
+
+class Ramper:
+    def __init__(self, log=None):
+        self.log = log
+        # key -> Fade
+        self.fades = {}
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, name='ramper')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def printMsg(self, s):
+        if self.log is not None:
+            self.log(s)
+
+    # fade from start to end over duration seconds, onDone(completed)
+    # is called on the ramper thread, completed is False if the fade
+    # was cancelled or replaced
+    def ramp(self, key, setter, start, end, duration, curve=LINEAR, onDone=None):
+        fade = Fade(key, setter, start, end, duration, curve, onDone)
+        with self.condition:
+            old = self.fades.get(key)
+            self.fades[key] = fade
+            self.condition.notify()
+        if old is not None and old.onDone is not None:
+            old.onDone(False)
+        return fade
+
+    def cancel(self, key):
+        with self.condition:
+            fade = self.fades.pop(key, None)
+        if fade is not None and fade.onDone is not None:
+            fade.onDone(False)
+        return fade is not None
+
+    def running(self, key):
+        with self.condition:
+            return key in self.fades
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.thread.join(1)
+
+    def step(self, fade, now):
+        value = fade.value(now)
+        if value != fade.last:
+            fade.setter(value)
+            fade.last = value
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.fades and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                # sleep until the next step of the next fade
+                wake = min(fade.due for fade in self.fades.values())
+                now = time.monotonic()
+                if wake > now:
+                    self.condition.wait(wake - now)
+                now = time.monotonic()
+                fades = [fade for fade in self.fades.values() if fade.due <= now]
+
+            done = []
+            for fade in fades:
+                fade.steps += 1
+                # how far behind its schedule this step is
+                fade.maxLate = max(fade.maxLate, now - fade.due)
+                # the next step on the schedule, steps that were missed
+                # are skipped instead of run all at once
+                fade.due = fade.stepTime(int((now - fade.started) * RATE) + 1)
+                try:
+                    self.step(fade, now)
+                except Exception as ex:
+                    self.printMsg("volume fade " + fade.key + " failed: " + str(ex))
+                    done.append((fade, False))
+                    continue
+                if fade.finished(now):
+                    done.append((fade, True))
+
+            for fade, completed in done:
+                with self.condition:
+                    # a new fade with the same key may have replaced it
+                    if self.fades.get(fade.key) is not fade:
+                        continue
+                    del self.fades[fade.key]
+                self.printMsg("volume fade " + fade.key + " " + str(fade.start) + " to " + str(fade.end) + " took " + str(round(time.monotonic() - fade.started, 2)) + "s, " + str(fade.steps) + " steps, " + str(int(fade.maxLate * 1000)) + " ms late at most")
+                if fade.onDone is not None:
+                    fade.onDone(completed)
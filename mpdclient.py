@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# mpdclient.py is a small, persistent client for the mpd protocol.
+#
+# acr.py used to run "mpc ..." through a shell for every button press,
+# which forks /bin/sh, mpc and usually grep. On a Raspberry Pi 3 that
+# costs hundreds of milliseconds per press. MPDClient keeps one socket
+# open to mpd and talks the protocol directly:
+#
+#    from mpdclient import MPDClient
+#    mpd = MPDClient()
+#    mpd.play()
+#    print(mpd.currentSong().get('title'))
+#
+# The host and port default to the same values mpc uses:
+#    MPD_HOST and MPD_PORT (default 6600). Without MPD_HOST the unix
+#    socket /run/mpd/socket is tried first, then localhost
+#
+#    A host starting with / is a unix socket. mpd only accepts file://
+#    URIs for files outside the music directory from unix socket
+#    clients
+#
+#    MPD_HOST may be password@host, same as mpc
+#
+# If mpd restarts or the connection drops, the next command reconnects.
+# Commands that only read (status, currentsong, ...) are then retried
+# once. Others, like next or add, are only retried when they were not
+# sent yet, so a dropped connection never runs them twice.
+#
+# Several commands can be sent in one round trip with commandList:
+#
+#    mpd.commandList([('clear',), ('add', uri), ('play',)])
+#
+# Responses are typed: numeric fields come back as int or float and
+# keys are lower case.
+#
+# idle blocks until mpd reports a change, use a separate MPDClient
+# for it (see nowplaying.py) so other commands are not held up
+#
+# fakempd.py is a local stand-in for mpd that can be used to try
+# this client without a Raspberry Pi
+#
+#########################
+
+import os
+import socket
+import threading
+
+
+# fields mpd returns as numbers
+INT_FIELDS = set([
+    'volume', 'repeat', 'random', 'single', 'consume', 'playlist',
+    'playlistlength', 'song', 'songid', 'nextsong', 'nextsongid',
+    'bitrate', 'xfade', 'pos', 'id', 'time', 'updating_db', 'prio',
+])
+FLOAT_FIELDS = set(['elapsed', 'duration', 'mixrampdb', 'mixrampdelay'])
+
+# key that starts a new entry in a list of songs
+SONG_START = 'file'
+
+# where mpd listens when MPD_HOST is not set, same as libmpdclient
+DEFAULT_SOCKET = '/run/mpd/socket'
+DEFAULT_HOST = 'localhost'
+
+# commands that change nothing, so they can be sent again after the
+# connection dropped
+READ_COMMANDS = set([
+    'ping', 'status', 'stats', 'currentsong', 'playlistinfo', 'playlistsearch',
+    'listplaylists', 'listplaylist', 'outputs',
+])
+
+
+class MPDError(Exception):
+    # mpd answered with ACK [error@command_listNum] {current_command} message
+    pass
+
+
+class MPDConnectionError(MPDError):
+    # mpd could not be reached or the connection dropped
+    pass
+
+
+def quoteArg(arg):
+    s = str(arg)
+    s = s.replace('\\', '\\\\').replace('"', '\\"')
+    return '"' + s + '"'
+
+
+def formatCommand(name, args):
+    line = name
+    for a in args:
+        if a is None:
+            continue
+        line += ' ' + quoteArg(a)
+    return line
+
+
+def typedValue(key, value):
+    try:
+        if key in INT_FIELDS:
+            return int(value)
+        if key in FLOAT_FIELDS:
+            return float(value)
+    except ValueError:
+        pass
+    return value
+
+
+def pairsToDict(pairs):
+    d = {}
+    for key, value in pairs:
+        d[key] = typedValue(key, value)
+    return d
+
+
+def pairsToSongs(pairs):
+    songs = []
+    for key, value in pairs:
+        if key == SONG_START or not songs:
+            songs.append({})
+        songs[-1][key] = typedValue(key, value)
+    return songs
+
+
+def pairsToValues(pairs, key):
+    return [value for k, value in pairs if k == key]
+
+
+class MPDClient:
+    def __init__(self, host=None, port=None, timeout=10, log=None):
+        # try DEFAULT_SOCKET before host
+        self.trySocket = False
+        if host is None:
+            host = os.environ.get('MPD_HOST')
+        if host is None:
+            host = DEFAULT_HOST
+            self.trySocket = True
+        if port is None:
+            port = int(os.environ.get('MPD_PORT', 6600))
+
+        self.password = None
+        if '@' in host and not host.startswith('/'):
+            self.password, host = host.split('@', 1)
+
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.log = log
+
+        self.sock = None
+        self.rfile = None
+        self.wfile = None
+        self.mpdVersion = None
+
+        # the GUI thread and worker threads share one connection
+        self.lock = threading.RLock()
+
+    def printMsg(self, s):
+        if self.log is not None:
+            self.log(s)
+
+    #########################
+    # connection handling
+
+    def connect(self):
+        with self.lock:
+            if self.sock is not None:
+                return
+
+            sock = None
+            if self.trySocket and os.path.exists(DEFAULT_SOCKET):
+                try:
+                    sock = self.openSocket(DEFAULT_SOCKET)
+                except (OSError, socket.error) as ex:
+                    self.printMsg("cannot connect to mpd at " + DEFAULT_SOCKET + ", trying " + self.address() + ": " + str(ex))
+            if sock is None:
+                try:
+                    sock = self.openSocket(self.host)
+                except (OSError, socket.error) as ex:
+                    raise MPDConnectionError("cannot connect to mpd at " + self.address() + ": " + str(ex))
+
+            self.sock = sock
+            self.rfile = sock.makefile('rb')
+            self.wfile = sock.makefile('wb')
+
+            hello = self.readLine()
+            if not hello.startswith('OK MPD '):
+                self.disconnect()
+                raise MPDConnectionError("unexpected mpd greeting [" + hello + "]")
+            self.mpdVersion = hello[len('OK MPD '):]
+
+            if self.password is not None:
+                self.writeLines([formatCommand('password', [self.password])])
+                self.readPairs()
+
+    def openSocket(self, host):
+        if host.startswith('/'):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(host)
+            except (OSError, socket.error):
+                sock.close()
+                raise
+        else:
+            sock = socket.create_connection((host, self.port), self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def disconnect(self):
+        with self.lock:
+            for f in (self.rfile, self.wfile, self.sock):
+                if f is not None:
+                    try:
+                        f.close()
+                    except (OSError, socket.error):
+                        pass
+            self.sock = None
+            self.rfile = None
+            self.wfile = None
+
+    def close(self):
+        with self.lock:
+            if self.sock is not None:
+                try:
+                    self.writeLines(['close'])
+                except MPDConnectionError:
+                    pass
+            self.disconnect()
+
+    def address(self):
+        if self.host.startswith('/'):
+            return self.host
+        return self.host + ':' + str(self.port)
+
+    #########################
+    # low level protocol
+
+    def writeLines(self, lines):
+        data = ''.join(l + '\n' for l in lines).encode('utf-8')
+        try:
+            self.wfile.write(data)
+            self.wfile.flush()
+        except (OSError, socket.error, AttributeError) as ex:
+            self.disconnect()
+            raise MPDConnectionError("lost connection to mpd: " + str(ex))
+
+    def readLine(self):
+        try:
+            line = self.rfile.readline()
+        except (OSError, socket.error, AttributeError) as ex:
+            self.disconnect()
+            raise MPDConnectionError("lost connection to mpd: " + str(ex))
+        if not line:
+            self.disconnect()
+            raise MPDConnectionError("mpd closed the connection")
+        return line.decode('utf-8', 'replace').rstrip('\n')
+
+    # read key: value pairs until OK, list_OK or ACK
+    # returns the pairs and the line that ended the response
+    def readPairs(self, endings=('OK',)):
+        pairs = []
+        while True:
+            line = self.readLine()
+            if line in endings:
+                return pairs, line
+            if line.startswith('ACK '):
+                raise MPDError(line[4:])
+            key, sep, value = line.partition(': ')
+            if not sep:
+                raise MPDError("unexpected line from mpd [" + line + "]")
+            pairs.append((key.lower(), value))
+
+    # sends the lines and reads the response, all while holding the
+    # lock. On a dropped connection it reconnects and tries once more,
+    # if retry is False only when the lines were not sent yet
+    def exchange(self, lines, reader, retry=False):
+        with self.lock:
+            for attempt in (0, 1):
+                sent = False
+                try:
+                    self.connect()
+                    self.writeLines(lines)
+                    sent = True
+                    return reader()
+                except MPDConnectionError as ex:
+                    if attempt == 1 or (sent and not retry):
+                        raise
+                    self.printMsg("mpd connection lost, reconnecting: " + str(ex))
+
+    def command(self, name, *args):
+        line = formatCommand(name, args)
+        return self.exchange([line], lambda: self.readPairs()[0], name in READ_COMMANDS)
+
+    # send many commands in a single round trip
+    #    commands is a list of tuples: (name, arg1, arg2, ...)
+    #    returns a list with the key, value pairs of every command
+    # mpd stops at the first failing command and rolls nothing back
+    def commandList(self, commands):
+        if not commands:
+            return []
+
+        lines = ['command_list_ok_begin']
+        for c in commands:
+            lines.append(formatCommand(c[0], c[1:]))
+        lines.append('command_list_end')
+
+        def readList():
+            results = []
+            while True:
+                pairs, end = self.readPairs(endings=('OK', 'list_OK'))
+                if end == 'OK':
+                    return results
+                results.append(pairs)
+
+        retry = all(c[0] in READ_COMMANDS for c in commands)
+        return self.exchange(lines, readList, retry)
+
+    #########################
+    # typed commands used by acr.py
+
+    def ping(self):
+        self.command('ping')
+
+    def status(self):
+        return pairsToDict(self.command('status'))
+
+    def currentSong(self):
+        return pairsToDict(self.command('currentsong'))
+
+    def play(self, pos=None):
+        self.command('play', pos)
+
+    def stop(self):
+        self.command('stop')
+
+    def pause(self, state=1):
+        self.command('pause', state)
+
+    def next(self):
+        self.command('next')
+
+    def previous(self):
+        self.command('previous')
+
+    def clear(self):
+        self.command('clear')
+
+    def add(self, uri):
+        self.command('add', uri)
+
+    def addId(self, uri, pos=None):
+        pairs = self.command('addid', uri, pos)
+        return pairsToDict(pairs).get('id')
+
+    # same as mpc insert: add the song right after the current one
+    def insert(self, uri):
+        song = self.currentSong()
+        if 'pos' in song:
+            return self.addId(uri, song['pos'] + 1)
+        return self.addId(uri)
+
+    def playlistInfo(self):
+        return pairsToSongs(self.command('playlistinfo'))
+
+    def save(self, name):
+        self.command('save', name)
+
+    def load(self, name):
+        self.command('load', name)
+
+    def rm(self, name):
+        self.command('rm', name)
+
+    def listPlaylists(self):
+        return pairsToValues(self.command('listplaylists'), 'playlist')
+
+    def listPlaylist(self, name):
+        return pairsToValues(self.command('listplaylist', name), 'file')
+
+    def playlistAdd(self, name, uri):
+        self.command('playlistadd', name, uri)
+
+    def playlistDelete(self, name, pos):
+        self.command('playlistdelete', name, pos)
+
+    def setVol(self, volume):
+        self.command('setvol', int(volume))
+
+    # wait for one of the subsystems to change, for example:
+    #    idle('player', 'playlist', 'mixer')
+    # returns the list of subsystems that changed
+    # the socket timeout is lifted while waiting
+    def idle(self, *subsystems):
+        with self.lock:
+            self.connect()
+            self.sock.settimeout(None)
+            try:
+                self.writeLines([formatCommand('idle', subsystems)])
+                return pairsToValues(self.readPairs()[0], 'changed')
+            finally:
+                if self.sock is not None:
+                    self.sock.settimeout(self.timeout)
+
+    # wakes up a thread blocked in idle by closing the socket under it
+    def abort(self):
+        sock = self.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except (OSError, socket.error):
+                pass
+
+    def playlistSearch(self, tag, value):
+        return pairsToSongs(self.command('playlistsearch', tag, value))
+
+    # same as mpc searchplay: play the first song in the queue
+    # whose tag contains value
+    def searchPlay(self, tag, value):
+        songs = self.playlistSearch(tag, value)
+        if not songs:
+            raise MPDError("no song matching " + tag + " [" + value + "]")
+        self.play(songs[0]['pos'])
+        return songs[0]
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# musiclibrary.py keeps the mpd playlist of songs in /home/pi/Music
+# in step with the files in that directory.
+#
+# acr.py used to clear the queue and run "mpc insert" once per .m4a
+# file every time the mode changed back to songs, which took minutes.
+# syncPlaylist does the least amount of work possible:
+#
+#    1. if the directory has not changed since the playlist was last
+#       saved, the stored playlist is loaded as is (one round trip)
+#
+#    2. if it changed, only the new files are added to and the removed
+#       files are deleted from the stored playlist, then it is loaded
+#
+#    3. if there is no stored playlist, all of the files are added in
+#       a few large command lists and the queue is saved
+#
+# The modification time of the music directory is remembered in a
+# small stamp file next to acr.conf
+#
+#########################
+
+import os
+
+from mpdclient import MPDError
+
+
+# how many commands to send in one command list
+# mpd limits a command list to 2 MB by default (max_command_list_size)
+BATCH_SIZE = 1000
+
+MUSIC_EXTENSIONS = ('.m4a',)
+
+# mpd error code for a missing playlist
+ACK_ERROR_NO_EXIST = '[50@'
+
+
+def listMusic(directory):
+    uris = []
+    for f in sorted(os.listdir(directory)):
+        if f.endswith(MUSIC_EXTENSIONS):
+            uris.append("file://" + os.path.join(directory, f))
+    return uris
+
+
+def directoryStamp(directory):
+    st = os.stat(directory)
+    return str(st.st_mtime_ns)
+
+
+def readStamp(stampFile):
+    try:
+        with open(stampFile, 'r') as f:
+            return f.readline().rstrip()
+    except (IOError, OSError):
+        return ""
+
+
+def writeStamp(stampFile, stamp):
+    try:
+        with open(stampFile, 'w') as f:
+            f.write(stamp + "\n")
+    except (IOError, OSError):
+        pass
+
+
+def sendBatches(mpd, commands):
+    for i in range(0, len(commands), BATCH_SIZE):
+        mpd.commandList(commands[i:i + BATCH_SIZE])
+
+
+def storedPlaylist(mpd, name):
+    try:
+        return mpd.listPlaylist(name)
+    except MPDError as ex:
+        if str(ex).startswith(ACK_ERROR_NO_EXIST):
+            return None
+        raise
+
+
+# returns a tuple (added, removed) with the number of files changed
+# in the stored playlist, (0, 0) when the playlist was reused as is
+def syncPlaylist(mpd, directory, name, stampFile, log=None):
+    def printMsg(s):
+        if log is not None:
+            log(s)
+
+    stamp = directoryStamp(directory)
+    if stamp == readStamp(stampFile):
+        try:
+            mpd.commandList([('clear',), ('load', name)])
+            printMsg("Loaded playlist " + name + ", music directory unchanged")
+            return (0, 0)
+        except MPDError as ex:
+            if not str(ex).startswith(ACK_ERROR_NO_EXIST):
+                raise
+            printMsg("Playlist " + name + " is missing, rebuilding it")
+
+    files = listMusic(directory)
+    stored = storedPlaylist(mpd, name)
+
+    if stored is None:
+        printMsg("Building playlist " + name + " with " + str(len(files)) + " songs")
+        commands = [('clear',)]
+        commands += [('add', f) for f in files]
+        sendBatches(mpd, commands)
+        mpd.save(name)
+        writeStamp(stampFile, stamp)
+        return (len(files), 0)
+
+    wanted = set(files)
+    have = set(stored)
+
+    # delete from the end so the positions still to delete do not move
+    commands = []
+    for pos in range(len(stored) - 1, -1, -1):
+        if stored[pos] not in wanted:
+            commands.append(('playlistdelete', name, pos))
+    removed = len(commands)
+
+    for f in files:
+        if f not in have:
+            commands.append(('playlistadd', name, f))
+    added = len(commands) - removed
+
+    sendBatches(mpd, commands)
+    mpd.commandList([('clear',), ('load', name)])
+    writeStamp(stampFile, stamp)
+
+    printMsg("Updated playlist " + name + ": " + str(added) + " added, " + str(removed) + " removed")
+    return (added, removed)
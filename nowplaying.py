@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# nowplaying.py watches mpd for changes to the song that is playing.
+#
+# acr.py used to run "mpc current > acr.tmp" every 2 seconds and read
+# the temp file back, so the Raspberry Pi forked processes and wrote to
+# the SD card around the clock, even when nothing was playing.
+#
+# NowPlayingWatcher uses its own connection to mpd and waits in
+# "idle player playlist mixer". mpd answers only when something
+# changes, so the watcher costs nothing while the radio is idle and a
+# new song shows up right away. Every time something changes the
+# callback gets two dictionaries, the current song and the status:
+#
+#    def changed(song, status):
+#        print(song.get('title'), status.get('state'))
+#
+#    watcher = NowPlayingWatcher(changed)
+#    watcher.start()
+#
+# The callback runs on the watcher thread. tkinter is not thread safe,
+# so acr.py passes the result to the GUI using radioGUI.after
+#
+# If mpd goes away the watcher keeps trying to reconnect, waiting a
+# little longer after each failure
+#
+#########################
+
+import threading
+import time
+
+from mpdclient import MPDClient, MPDError, pairsToDict
+
+
+SUBSYSTEMS = ('player', 'playlist', 'mixer')
+
+# seconds to wait before reconnecting to mpd
+RETRY_MIN = 1
+RETRY_MAX = 30
+
+
+class NowPlayingWatcher:
+    def __init__(self, callback, host=None, port=None, log=None):
+        self.callback = callback
+        self.log = log
+        self.client = MPDClient(host, port, log=log)
+        self.running = False
+        self.thread = None
+
+    def printMsg(self, s):
+        if self.log is not None:
+            self.log(s)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='nowplaying')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.client.abort()
+        if self.thread is not None:
+            self.thread.join(2)
+        self.client.disconnect()
+
+    def notify(self):
+        song, status = self.client.commandList([('currentsong',), ('status',)])
+        self.callback(pairsToDict(song), pairsToDict(status))
+
+    def run(self):
+        retry = RETRY_MIN
+        while self.running:
+            try:
+                self.notify()
+                retry = RETRY_MIN
+                while self.running:
+                    self.client.idle(*SUBSYSTEMS)
+                    self.notify()
+            except MPDError as ex:
+                if not self.running:
+                    break
+                self.printMsg("now playing watcher: " + str(ex))
+                self.client.disconnect()
+                time.sleep(retry)
+                retry = min(retry * 2, RETRY_MAX)
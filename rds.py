@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# rds.py decodes RDS data from the Si4703 so FM mode can show the
+# station name (PS) and RadioText instead of just the frequency.
+#
+# RDS sends groups of four 16 bit blocks, A B C D, about 11 times a
+# second. The Si4703 sets the RDSR bit in STATUSRSSI when a new group
+# is in RDSA-RDSD. Only two group types are needed:
+#
+#    0A/0B   two characters of the 8 character station name, the
+#            segment address (0-3) is in the low bits of block B
+#    2A      four characters of the 64 character RadioText
+#    2B      two characters of the 32 character RadioText
+#
+# RdsDecoder builds the strings up a few characters at a time. Radio
+# reception is noisy, so:
+#    - blocks with uncorrectable errors are thrown away
+#    - a station name character only counts once the same character
+#      has been received twice in a row
+#    - the RadioText A/B flag changing means new text, start over
+# decode() returns True only when a complete string has changed.
+#
+# RdsPoller reads the Si4703 on its own thread. It reads STATUSRSSI
+# (2 bytes) and only when RDSR is set reads the RDS registers. It
+# never waits for the radio: if a tune or seek holds the chip, that
+# poll is skipped. With the default 40 ms interval RDS costs at most
+# 25 small reads a second and none while FM mode is off.
+#
+# The decoder is only used while holding the radio lock, so a group
+# read before a tune is never decoded after reset()
+#
+#    poller = RdsPoller(radio, changed)
+#    poller.start()
+#    poller.resume()       # FM mode on
+#    poller.pause()        # FM mode off
+#
+#########################
+
+import threading
+import time
+
+from si4703 import STATUSRSSI, READCHAN, RDSA, RDSB, RDSC, RDSD, RDSR
+
+
+# block errors in verbose mode, 3 means the block could not be corrected
+BLERA_SHIFT = 9          # STATUSRSSI
+BLERB_SHIFT = 14         # READCHAN
+BLERC_SHIFT = 12         # READCHAN
+BLERD_SHIFT = 10         # READCHAN
+BLER_UNCORRECTABLE = 3
+
+PS_LENGTH = 8
+RT_LENGTH = 64
+
+# seconds between polls
+POLL_INTERVAL = 0.04
+
+
+def rdsChar(c):
+    # RDS uses its own character table, the printable ASCII part is
+    # the same and is all that is shown
+    if 0x20 <= c <= 0x7E:
+        return chr(c)
+    return ' '
+
+
+class RdsDecoder:
+    def __init__(self, maxErrors=BLER_UNCORRECTABLE - 1):
+        # blocks with more errors than this are ignored
+        self.maxErrors = maxErrors
+        self.reset()
+
+    def reset(self):
+        self.ps = ""
+        self.radioText = ""
+        self.psChars = [None] * PS_LENGTH
+        self.psCandidate = [None] * PS_LENGTH
+        self.rtChars = [None] * RT_LENGTH
+        self.rtFlag = None
+        self.groups = 0
+
+    # errors is a tuple with the BLER value of blocks A-D
+    def decode(self, a, b, c, d, errors=(0, 0, 0, 0)):
+        # block B says what the group is, it has to be good
+        if errors[1] > 1:  # more than 2 bit errors
+            return False
+        self.groups += 1
+
+        groupType = b >> 12
+        versionB = (b >> 11) & 1
+
+        if groupType == 0:
+            if errors[3] > self.maxErrors:
+                return False
+            return self.decodePs(b & 0x03, d)
+
+        if groupType == 2:
+            flag = (b >> 4) & 1
+            if flag != self.rtFlag:
+                # the station has new text
+                self.rtFlag = flag
+                self.rtChars = [None] * RT_LENGTH
+            segment = b & 0x0F
+            if versionB:
+                if errors[3] > self.maxErrors:
+                    return False
+                return self.decodeRt(segment * 2, [d >> 8, d & 0xFF], 32)
+            if errors[2] > self.maxErrors or errors[3] > self.maxErrors:
+                return False
+            return self.decodeRt(segment * 4, [c >> 8, c & 0xFF, d >> 8, d & 0xFF], RT_LENGTH)
+
+        return False
+
+    def decodePs(self, segment, d):
+        changed = False
+        for i, byte in enumerate((d >> 8, d & 0xFF)):
+            pos = segment * 2 + i
+            ch = rdsChar(byte)
+            # a character is accepted after two identical receptions
+            if self.psCandidate[pos] == ch:
+                self.psChars[pos] = ch
+            self.psCandidate[pos] = ch
+
+        if None not in self.psChars:
+            ps = ''.join(self.psChars).strip()
+            if ps != self.ps:
+                self.ps = ps
+                changed = True
+        return changed
+
+    def decodeRt(self, pos, chars, length):
+        for i, byte in enumerate(chars):
+            if pos + i < length:
+                self.rtChars[pos + i] = byte
+
+        # the text ends at a carriage return or at the full length
+        text = []
+        for i in range(length):
+            byte = self.rtChars[i]
+            if byte is None:
+                return False
+            if byte == 0x0D:
+                break
+            text.append(rdsChar(byte))
+
+        radioText = ' '.join(''.join(text).split())
+        if radioText != self.radioText:
+            self.radioText = radioText
+            return True
+        return False
+
+
+class RdsPoller:
+    def __init__(self, radio, callback, interval=POLL_INTERVAL, log=None):
+        self.radio = radio
+        self.callback = callback
+        self.interval = interval
+        self.log = log
+        self.decoder = RdsDecoder()
+
+        self.active = threading.Event()
+        self.stopped = False
+        self.polls = 0
+        self.reads = 0
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='rds')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped = True
+        self.active.set()
+        if self.thread is not None:
+            self.thread.join(1)
+
+    def resume(self):
+        self.active.set()
+
+    def pause(self):
+        self.active.clear()
+
+    # a new station has different RDS data
+    def reset(self):
+        with self.radio.lock:
+            self.decoder.reset()
+
+    def pollOnce(self):
+        radio = self.radio
+        # never make a tune wait for RDS
+        if not radio.lock.acquire(False):
+            return False
+        try:
+            self.polls += 1
+            radio.read(1)
+            if not radio.get(STATUSRSSI) & RDSR:
+                return False
+            radio.read(6)
+            self.reads += 1
+            status = radio.get(STATUSRSSI)
+            readchan = radio.get(READCHAN)
+            blocks = (radio.get(RDSA), radio.get(RDSB), radio.get(RDSC), radio.get(RDSD))
+
+            errors = (
+                (status >> BLERA_SHIFT) & 3,
+                (readchan >> BLERB_SHIFT) & 3,
+                (readchan >> BLERC_SHIFT) & 3,
+                (readchan >> BLERD_SHIFT) & 3,
+            )
+            # still holding the lock, so reset() cannot run between the
+            # read and the callback
+            if self.decoder.decode(blocks[0], blocks[1], blocks[2], blocks[3], errors):
+                self.callback(self.decoder.ps, self.decoder.radioText)
+        finally:
+            radio.lock.release()
+        return True
+
+    def run(self):
+        while not self.stopped:
+            self.active.wait()
+            if self.stopped:
+                return
+            try:
+                self.pollOnce()
+            except (IOError, OSError) as ex:
+                if self.log is not None:
+                    self.log("RDS read failed: " + str(ex))
+            time.sleep(self.interval)
@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# replay.py records the buttons pressed on acr.py and presses them
+# again, so bugs and slowdowns that only show up after a particular
+# run of presses can be reproduced.
+#
+# acr.py records when ACR_RECORD names a trace file:
+#
+#    $ ACR_RECORD=/home/pi/radio/trace.txt python3 acr.py
+#
+# Every touchscreen button and every PiTFT button (GPIO 17, 22, 23
+# and 27) is written to the trace, one line each:
+#
+#    # acr trace 1
+#    1520 tk modePress
+#    2210 tk playStopDown
+#    2301 tk playStopPress
+#    4005 gpio 17 120
+#
+# ms since recording started, tk or gpio, the button function or the
+# channel, and for gpio how many ms the button was held.
+#
+# With ACR_REPLAY acr.py presses the buttons in a trace again once it
+# has started. The PiTFT buttons are pressed on SimulatedGpio
+# (fakegpio.py), so it needs ACR_BACKEND=sim:
+#
+#    $ ACR_BACKEND=sim ACR_REPLAY=trace.txt python3 acr.py
+#
+# ACR_REPLAY_SPEED is how fast: 1 (the default) keeps the time between
+# presses, 10 is ten times as fast and 0 is as fast as possible. With 0
+# each press waits until everything the one before it started is done,
+# so they are handled in the same order every time. Holds are never
+# shortened, a long press stays a long press.
+#
+# A press is done when its function returned and then the executor
+# and the coalescer are idle, asked in the tkinter main loop so the
+# onDone callbacks already posted have run. Its latency is from when it
+# was due until it was done, so a mode change waiting behind a tune
+# counts the wait. With presses closer together than their work takes,
+# a press is done when the work of the ones before it is done too.
+#
+# Once every press is done, the latency of each button, how long its
+# function took to return and the final state (mode, volume, station,
+# alarm, ...) are logged and written to <trace>.report.json, then
+# acr.py exits. The report also has the latency of every press in
+# trace order and the time of the mpd, I2C and mixer calls, bench.py
+# reads them.
+#
+# A trace of random presses, for a stress test:
+#
+#    $ python3 replay.py random 10000 trace.txt [seed]
+#
+#########################
+
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from metrics import Metrics
+
+
+RECORD = os.environ.get('ACR_RECORD')
+REPLAY = os.environ.get('ACR_REPLAY')
+REPLAY_SPEED = float(os.environ.get('ACR_REPLAY_SPEED', '1'))
+
+TRACE_HEADER = "# acr trace 1\n"
+
+# a held PiTFT button is checked every HOLD_POLL seconds, for at most
+# MAX_HOLD seconds
+HOLD_POLL = 0.02
+MAX_HOLD = 30.0
+
+# a press not handled TIMEOUT seconds after it was due is lost, and so
+# is one whose work is not done IDLE_TIMEOUT seconds later
+TIMEOUT = 10.0
+IDLE_TIMEOUT = 120.0
+# seconds between asking whether acr.py is idle while presses are not
+# done
+IDLE_POLL = 0.005
+# acr.py is done once it was idle for SETTLE seconds
+SETTLE = 0.2
+
+# what a random trace presses, GPIO 17 (the backlight) RANDOM_GPIO of
+# the time, with RANDOM_GAP seconds between presses on average
+RANDOM_BUTTONS = ('modePress', 'playStopPress', 'nextPress', 'backPress', 'volumeUpPress', 'volumeDownPress',
+                  'alarmHourPress', 'alarmMinutePress', 'alarmOnOffPress')
+RANDOM_GPIO = 0.02
+RANDOM_GAP = 0.3
+
+
+class Event:
+    def __init__(self, ms, kind, name, hold=0):
+        self.ms = ms
+        self.kind = kind
+        self.name = name
+        self.hold = hold
+
+        # time.monotonic() while replaying
+        self.due = None
+        self.started = None
+        self.finished = None
+        # idle after finished
+        self.done = None
+        # a GPIO press within bouncetime of the last one
+        self.ignored = False
+        self.handled = threading.Event()
+
+    def line(self):
+        line = str(self.ms) + " " + self.kind + " " + self.name
+        if self.kind == 'gpio':
+            line += " " + str(self.hold)
+        return line + "\n"
+
+    def label(self):
+        if self.kind == 'gpio':
+            return "gpio " + self.name
+        return self.name
+
+    # due until done
+    def latency(self):
+        if self.done is None or self.due is None:
+            return None
+        return self.done - self.due
+
+    # due until the function returned
+    def handledLatency(self):
+        if self.finished is None or self.due is None:
+            return None
+        return self.finished - self.due
+
+
+def parseEvent(line):
+    fields = line.split()
+    if len(fields) < 3 or fields[1] not in ('tk', 'gpio') or not fields[0].isdigit():
+        return None
+    hold = 0
+    if len(fields) > 3:
+        hold = int(fields[3])
+    return Event(int(fields[0]), fields[1], fields[2], hold)
+
+
+def readTrace(path):
+    events = []
+    with open(path, 'r') as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            event = parseEvent(line)
+            if event is None:
+                raise ValueError(path + " line " + str(n) + " is not a press: " + line)
+            events.append(event)
+    # a gpio line is written when the button is let go, after the
+    # presses made while it was held
+    events.sort(key=lambda e: e.ms)
+    return events
+
+
+def writeTrace(path, events):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(TRACE_HEADER)
+        for event in events:
+            f.write(event.line())
+    os.rename(tmp, path)
+
+
+def randomTrace(n, seed=None):
+    rng = random.Random(seed)
+    events = []
+    ms = 0
+    for i in range(n):
+        ms += int(rng.expovariate(1.0 / RANDOM_GAP) * 1000)
+        if rng.random() < RANDOM_GPIO:
+            events.append(Event(ms, 'gpio', '17', rng.randint(50, 300)))
+        else:
+            events.append(Event(ms, 'tk', rng.choice(RANDOM_BUTTONS)))
+    return events
+
+
+# every button command and GPIO callback in acr.py goes through
+# Inputs, which records them and lets Replayer press them
+class Inputs:
+    def __init__(self, gpio, log=None):
+        self.gpio = gpio
+        self.log = log
+        self.lock = threading.Lock()
+        self.file = None
+        self.started = time.monotonic()
+        self.recorded = 0
+
+        # name -> button function
+        self.commands = {}
+        # channel -> Event being replayed
+        self.replaying = {}
+
+    def printMsg(self, s):
+        if self.log is not None:
+            self.log(s)
+
+    def record(self, path):
+        with self.lock:
+            self.file = open(path, 'w')
+            self.file.write(TRACE_HEADER)
+            self.started = time.monotonic()
+        self.printMsg("recording button presses to " + path)
+
+    def write(self, at, kind, name, hold=0):
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(Event(int((at - self.started) * 1000), kind, name, hold).line())
+            self.recorded += 1
+
+    def stop(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+                self.printMsg("recorded " + str(self.recorded) + " button presses")
+
+    # fn for a button's command, recorded as name
+    def button(self, name, fn):
+        self.commands[name] = fn
+
+        def pressed(*args):
+            if self.file is not None:
+                self.write(time.monotonic(), 'tk', name)
+            return fn(*args)
+        return pressed
+
+    # fn for a GPIO callback
+    def edge(self, fn):
+        def edge(channel):
+            at = time.monotonic()
+            with self.lock:
+                event = self.replaying.pop(channel, None)
+            if event is not None:
+                event.started = at
+            try:
+                fn(channel)
+            finally:
+                if event is not None:
+                    event.finished = time.monotonic()
+                    event.handled.set()
+                if self.file is not None:
+                    # reboot, shutdown and exit wait for the button to be
+                    # let go, the backlight does not
+                    while self.gpio.input(channel) == self.gpio.LOW and time.monotonic() - at < MAX_HOLD:
+                        time.sleep(HOLD_POLL)
+                    self.write(at, 'gpio', str(channel), int((time.monotonic() - at) * 1000))
+        return edge
+
+
+class Replayer:
+    def __init__(self, inputs, events, post, speed=1.0, idle=None, onDone=None, log=None):
+        self.inputs = inputs
+        self.events = events
+        # post(fn, *args) runs fn in the tkinter main loop
+        self.post = post
+        self.speed = speed
+        # idle() is True when acr.py has nothing left to do
+        self.idle = idle
+        # onDone(replayer) runs in the tkinter main loop at the end
+        self.onDone = onDone
+        self.log = log
+
+        self.stopped = threading.Event()
+        self.thread = None
+        # sent and not done yet
+        self.busy = []
+        # when acr.py was last asked and found idle, and when it
+        # answered, None if it was busy since
+        self.idleAsked = None
+        self.idleAt = None
+        self.metrics = Metrics()
+        self.handledMetrics = Metrics()
+        self.lost = 0
+        self.ignored = 0
+        self.took = 0.0
+
+    def printMsg(self, s):
+        if self.log is not None:
+            self.log(s)
+
+    def start(self):
+        self.printMsg("replaying " + str(len(self.events)) + " button presses")
+        self.thread = threading.Thread(target=self.run, name='replay')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(1)
+
+    def run(self):
+        began = time.monotonic()
+        first = 0
+        if self.events:
+            first = self.events[0].ms
+        for event in self.events:
+            if self.speed > 0:
+                if not self.waitUntil(began + (event.ms - first) / 1000.0 / self.speed):
+                    return
+            elif self.stopped.is_set():
+                return
+            self.send(event)
+            if self.speed == 0:
+                event.handled.wait(TIMEOUT)
+                self.waitDone(IDLE_TIMEOUT)
+
+        end = time.monotonic() + TIMEOUT
+        for event in self.events:
+            event.handled.wait(max(end - time.monotonic(), 0))
+        self.waitDone(IDLE_TIMEOUT)
+        self.waitIdle()
+        self.took = time.monotonic() - began
+
+        for event in self.events:
+            latency = event.latency()
+            if latency is not None:
+                self.metrics.observe(event.label(), latency)
+                self.metrics.observe("all", latency)
+                self.handledMetrics.observe(event.label(), event.handledLatency())
+                self.handledMetrics.observe("all", event.handledLatency())
+            elif event.ignored:
+                self.ignored += 1
+            else:
+                self.lost += 1
+        if self.onDone is not None and not self.stopped.is_set():
+            self.post(self.onDone, self)
+
+    # idle() in the tkinter main loop, after the callbacks posted before
+    # it, returns (idle, time.monotonic() it was asked) or None
+    def askIdle(self):
+        answer = []
+        ready = threading.Event()
+
+        def probe():
+            answer.append((self.idle(), time.monotonic()))
+            ready.set()
+
+        self.post(probe)
+        if not ready.wait(TIMEOUT):
+            return None
+        return answer[0]
+
+    # mark the presses whose function returned done, if acr.py is idle
+    def checkDone(self):
+        if self.idle is None:
+            # nothing to wait for but the function
+            for event in self.busy:
+                if event.handled.is_set():
+                    event.done = event.finished
+            self.busy = [e for e in self.busy if e.done is None and not e.ignored]
+            return
+        asked = time.monotonic()
+        answer = self.askIdle()
+        if answer is None or not answer[0]:
+            self.idleAsked = None
+            self.idleAt = None
+            return
+        if self.idleAsked is not None:
+            # a command may have just finished with its onDone not
+            # posted yet, so idle only counts once it still is when
+            # asked again. Presses that returned before the first
+            # question were done when it was answered
+            busy = []
+            for event in self.busy:
+                if event.ignored:
+                    continue
+                if event.handled.is_set() and event.finished is not None and event.finished <= self.idleAsked:
+                    event.done = self.idleAt
+                else:
+                    busy.append(event)
+            self.busy = busy
+        self.idleAsked = asked
+        self.idleAt = answer[1]
+
+    # wait until time.monotonic() is t, checking for presses that are
+    # done, returns False when stopped
+    def waitUntil(self, t):
+        while True:
+            wait = t - time.monotonic()
+            if wait <= 0:
+                return not self.stopped.is_set()
+            if self.busy:
+                self.checkDone()
+                wait = min(wait, IDLE_POLL)
+            if self.stopped.wait(max(wait, 0)):
+                return False
+
+    # wait until every press sent is done, returns False on timeout
+    def waitDone(self, timeout):
+        end = time.monotonic() + timeout
+        while self.busy and not self.stopped.is_set():
+            self.checkDone()
+            if not self.busy:
+                break
+            if time.monotonic() > end:
+                return False
+            self.stopped.wait(IDLE_POLL)
+        return not self.busy
+
+    def send(self, event):
+        event.due = time.monotonic()
+        self.busy.append(event)
+        if event.kind == 'tk':
+            fn = self.inputs.commands.get(event.name)
+            if fn is None:
+                self.printMsg("replay: there is no button " + event.name)
+                event.ignored = True
+                event.handled.set()
+                return
+            self.post(self.press, event, fn)
+            return
+
+        channel = int(event.name)
+        with self.inputs.lock:
+            self.inputs.replaying[channel] = event
+        if self.speed == 0:
+            self.pressGpio(event, channel)
+        else:
+            # a held button must not hold up the presses after it
+            t = threading.Thread(target=self.pressGpio, args=(event, channel), name='replay gpio')
+            t.daemon = True
+            t.start()
+
+    # runs in the tkinter main loop
+    def press(self, event, fn):
+        event.started = time.monotonic()
+        try:
+            fn()
+        except Exception as ex:
+            self.printMsg("replay: " + event.name + " failed: " + str(ex))
+        event.finished = time.monotonic()
+        event.handled.set()
+
+    def pressGpio(self, event, channel):
+        if not self.inputs.gpio.press(channel, event.hold / 1000.0):
+            # within bouncetime of the last press
+            with self.inputs.lock:
+                if self.inputs.replaying.get(channel) is event:
+                    del self.inputs.replaying[channel]
+            event.ignored = True
+            event.handled.set()
+
+    def waitIdle(self):
+        if self.idle is None:
+            return True
+        end = time.monotonic() + IDLE_TIMEOUT
+        quiet = None
+        while time.monotonic() < end and not self.stopped.is_set():
+            if not self.idle():
+                quiet = None
+            elif quiet is None:
+                quiet = time.monotonic()
+            elif time.monotonic() - quiet >= SETTLE:
+                return True
+            time.sleep(SETTLE / 4)
+        return False
+
+    # latency of each button, worst first
+    def lines(self):
+        return self.metrics.lines()
+
+    # presses is [name, seconds until handled, seconds until done] for
+    # every press in trace order, None where it never was
+    # backend is the metrics.py histograms of the mpd, I2C and mixer calls
+    def report(self, state, backend=None):
+        presses = []
+        for event in self.events:
+            presses.append([event.label(), event.handledLatency(), event.latency()])
+        return {
+            'events': len(self.events),
+            'speed': self.speed,
+            'took': self.took,
+            'lost': self.lost,
+            'ignored': self.ignored,
+            'latency': self.metrics.snapshot()['histograms'],
+            'handled': self.handledMetrics.snapshot()['histograms'],
+            'presses': presses,
+            'state': state,
+            'backend': backend,
+        }
+
+    def writeReport(self, path, state, backend=None):
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.report(state, backend), f, indent=1, sort_keys=True)
+        os.rename(tmp, path)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4 or sys.argv[1] != 'random':
+        print("usage: python3 replay.py random <presses> <trace> [seed]")
+        sys.exit(2)
+    seed = None
+    if len(sys.argv) > 4:
+        seed = int(sys.argv[4])
+    events = randomTrace(int(sys.argv[2]), seed)
+    writeTrace(sys.argv[3], events)
+    took = 0
+    if events:
+        took = events[-1].ms / 1000.0
+    print("wrote " + str(len(events)) + " presses to " + sys.argv[3] + ", " + str(round(took)) + "s at speed 1")
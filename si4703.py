@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# si4703.py talks to the Si4703 FM radio chip over I2C.
+#
+# The Si4703 does not let you pick a register to read or write:
+#    - writes always start at register 0x02 (POWERCFG)
+#    - reads always start at register 0x0A (STATUSRSSI) and wrap
+#      around from 0x0F to 0x00
+#
+# acr.py used to write registers 2-7 and then read back all 32 bytes
+# after every change, and read all 32 bytes again before changing
+# anything. A volume step cost three full I2C round trips.
+#
+# Si4703 keeps a shadow copy of the 16 registers:
+#    - set() and update() change the shadow copy and mark the
+#      register dirty
+#    - flush() writes registers 2 up to the highest dirty register,
+#      nothing else
+#    - readStatus() reads only STATUSRSSI and READCHAN (4 bytes),
+#      which is all that is needed while waiting for a tune
+#    - readAll() reads all 32 bytes, only needed at power up
+#
+# The bus is anything with the smbus methods read_i2c_block_data and
+# write_i2c_block_data, so a simulated bus can be used off the
+# Raspberry Pi (see fakesi4703.py):
+#
+#    radio = Si4703(smbus.SMBus(1))
+#    radio.readAll()
+#    radio.update(SYSCONFIG2, 0x000F, 5)
+#    radio.flush()
+#
+# smbus sends a command byte before every read and write. The Si4703
+# sees it as the high byte of POWERCFG, so the shadow copy of that byte
+# is always sent as the command byte to leave POWERCFG unchanged.
+#
+# tune() sets the TUNE bit and waits for Seek/Tune Complete (STC).
+# The chip usually finishes in well under 100 ms, so STC is polled
+# every few milliseconds, backing off slowly up to 50 ms. If the
+# Si4703 GPIO2 pin is wired to the Raspberry Pi, enableStcInterrupt()
+# makes the chip pulse GPIO2 when STC is set and tune() just waits for
+# the edge. The time every tune took is kept in tuneTimes.
+#
+# seek() uses the chip's own seek to find the next channel whose RSSI
+# is above the seek threshold, see fmscan.py
+#
+#########################
+
+import collections
+import threading
+import time
+
+
+#   Register Descriptions
+DEVICEID = 0x00
+CHIPID = 0x01
+POWERCFG = 0x02
+CHANNEL = 0x03
+SYSCONFIG1 = 0x04
+SYSCONFIG2 = 0x05
+SYSCONFIG3 = 0x06
+OSCILLATOR = 0x07
+STATUSRSSI = 0x0A
+READCHAN = 0x0B
+RDSA = 0x0C
+RDSB = 0x0D
+RDSC = 0x0E
+RDSD = 0x0F
+
+#   Si4703 Address
+#     Need to find the address of the Si4703
+#     This is a bit complicated, because the output won't show
+#     correctly until it works. The command to run is:
+#
+#       $ i2cdetect -y 1
+SI4703_Address = 0x10
+
+#   Register bits
+TUNE = 1 << 15          # CHANNEL
+RDSM = 1 << 11          # POWERCFG, verbose RDS with block error counts
+SKMODE = 1 << 10        # POWERCFG, 1 stops seeking at the band limit
+SEEKUP = 1 << 9         # POWERCFG
+SEEK = 1 << 8           # POWERCFG
+RDSR = 1 << 15          # STATUSRSSI, RDS group ready
+STC = 1 << 14           # STATUSRSSI, Seek/Tune Complete
+SFBL = 1 << 13          # STATUSRSSI, Seek Fail/Band Limit
+ST = 1 << 8             # STATUSRSSI, stereo
+RSSI_MASK = 0x00FF      # STATUSRSSI
+SEEKTH_MASK = 0xFF00    # SYSCONFIG2
+STCIEN = 1 << 14        # SYSCONFIG1, STC interrupt enable
+RDS = 1 << 12           # SYSCONFIG1, RDS enable
+GPIO2_INT = 0x0004      # SYSCONFIG1, GPIO2 is the STC/RDS interrupt
+GPIO2_MASK = 0x000C
+
+# STC polling, in seconds
+POLL_FIRST = 0.005
+POLL_MAX = 0.050
+POLL_GROWTH = 1.5
+
+# US band 87.5 - 107.9 MHz with 200 kHz spacing
+BAND_BOTTOM = 875
+CHANNEL_SPACING = 2
+LAST_CHANNEL = 102
+
+# reads start here and wrap around after register 0x0F
+FIRST_READ = STATUSRSSI
+# writes start here, registers 2-7 are the only writable ones
+FIRST_WRITE = POWERCFG
+LAST_WRITE = OSCILLATOR
+
+
+class Si4703:
+    def __init__(self, bus, address=SI4703_Address):
+        self.bus = bus
+        self.address = address
+        self.regs = [0] * 16
+        self.dirty = set()
+
+        # the executor and background pollers share the chip
+        self.lock = threading.RLock()
+
+        # set by the GPIO2 interrupt when STC goes high
+        self.stcEvent = None
+
+        # seconds each of the last tunes took, newest last
+        self.tuneTimes = collections.deque(maxlen=50)
+
+    def get(self, r):
+        return self.regs[r]
+
+    def set(self, r, value):
+        value &= 0xFFFF
+        with self.lock:
+            if self.regs[r] != value:
+                self.regs[r] = value
+                self.dirty.add(r)
+
+    # change only the bits in mask
+    def update(self, r, mask, value):
+        with self.lock:
+            self.set(r, (self.regs[r] & ~mask) | (value & mask))
+
+    def commandByte(self):
+        return self.regs[POWERCFG] >> 8
+
+    # write registers 2 up to the highest dirty one
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            last = max(self.dirty)
+            data = []
+            for r in range(FIRST_WRITE, last + 1):
+                data.append(self.regs[r] >> 8)
+                data.append(self.regs[r] & 0xFF)
+            # the first byte goes out as the smbus command byte
+            self.bus.write_i2c_block_data(self.address, data[0], data[1:])
+            self.dirty.clear()
+
+    # read count registers starting at STATUSRSSI
+    def read(self, count):
+        with self.lock:
+            data = self.bus.read_i2c_block_data(self.address, self.commandByte(), count * 2)
+            for i in range(count):
+                r = (FIRST_READ + i) % 16
+                # never overwrite a change that has not been written yet
+                if r not in self.dirty:
+                    self.regs[r] = data[i * 2] * 256 + data[i * 2 + 1]
+
+    # STATUSRSSI and READCHAN, enough to poll for tune complete
+    def readStatus(self):
+        self.read(2)
+
+    def readAll(self):
+        self.read(16)
+
+    # have the chip pulse its GPIO2 pin low when STC is set
+    #    gpio is the RPi.GPIO module, pin is the BCM pin GPIO2 is wired to
+    def enableStcInterrupt(self, gpio, pin):
+        self.stcEvent = threading.Event()
+        gpio.setup(pin, gpio.IN, pull_up_down=gpio.PUD_UP)
+        gpio.add_event_detect(pin, gpio.FALLING, callback=lambda channel: self.stcEvent.set())
+        self.update(SYSCONFIG1, STCIEN | GPIO2_MASK, STCIEN | GPIO2_INT)
+        self.flush()
+
+    def stcSet(self):
+        self.readStatus()
+        return (self.regs[STATUSRSSI] & STC) != 0
+
+    # wait for STC, returns False on timeout or if cancelled() is True
+    def waitForStc(self, timeout, cancelled=None):
+        end = time.monotonic() + timeout
+        delay = POLL_FIRST
+        while True:
+            if self.stcSet():
+                return True
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return False
+            if cancelled is not None and cancelled():
+                return False
+            if self.stcEvent is not None:
+                # the interrupt wakes us up, poll now and then in
+                # case an edge is missed
+                self.stcEvent.wait(min(remaining, POLL_MAX * 4))
+                self.stcEvent.clear()
+            else:
+                time.sleep(min(remaining, delay))
+                delay = min(delay * POLL_GROWTH, POLL_MAX)
+
+    # tune to channel (0-1023 steps above the bottom of the band)
+    # returns True once the chip reports STC
+    def tune(self, channel, timeout=1.0, cancelled=None):
+        with self.lock:
+            started = time.monotonic()
+            if self.stcEvent is not None:
+                self.stcEvent.clear()
+            self.update(CHANNEL, TUNE | 0x03FF, TUNE | channel)
+            self.flush()
+            done = self.waitForStc(timeout, cancelled)
+
+            # TUNE must be cleared before the next tune, that also clears STC
+            self.update(CHANNEL, TUNE, 0)
+            self.flush()
+
+            if done:
+                self.tuneTimes.append(time.monotonic() - started)
+            return done
+
+    # seek from the current channel to the next one with an RSSI of at
+    # least threshold, stopping at the end of the band
+    # returns the channel found or None
+    def seek(self, up=True, threshold=25, timeout=5.0, cancelled=None):
+        with self.lock:
+            if self.stcEvent is not None:
+                self.stcEvent.clear()
+            # POWERCFG is written first, so the threshold has to be
+            # written before SEEK is set
+            self.update(SYSCONFIG2, SEEKTH_MASK, threshold << 8)
+            self.flush()
+            direction = SEEKUP if up else 0
+            self.update(POWERCFG, SEEK | SEEKUP | SKMODE, SEEK | direction | SKMODE)
+            self.flush()
+            done = self.waitForStc(timeout, cancelled)
+
+            self.update(POWERCFG, SEEK, 0)
+            self.flush()
+
+            if not done or self.regs[STATUSRSSI] & SFBL:
+                return None
+            return self.channel()
+
+    # channel, RSSI and stereo from the last status read
+    def channel(self):
+        return self.regs[READCHAN] & 0x03FF
+
+    def rssi(self):
+        return self.regs[STATUSRSSI] & RSSI_MASK
+
+    def stereo(self):
+        return (self.regs[STATUSRSSI] & ST) != 0
+
+    def lastTuneTime(self):
+        if not self.tuneTimes:
+            return None
+        return self.tuneTimes[-1]
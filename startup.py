@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# startup.py times the stages acr.py goes through when it starts.
+#
+# acr.py used to stop mpd, open the FM radio, read crontab and start
+# the last song before the main loop ran, so the screen stayed blank
+# for seconds after every boot. Now it starts in stages:
+#    1. the window and the clock, then the main loop
+#    2. mpd, the alarms and the FM radio, one after the other on the
+#       executor, while the clock is already showing
+#
+# Startup logs how long each stage took and when it finished, counted
+# from when acr.py started and, on Linux, from when the Pi booted:
+#
+#    startup = Startup(log=printMsg)
+#    startup.mark("clock shown")
+#    startup.run("mpd", startMpd)
+#    startup.mark("ready")
+#
+# mark() warns if it is later than the budget given for it, so a slow
+# boot shows up in the log
+#
+#########################
+
+import time
+
+
+# seconds since the kernel started, None where /proc/uptime does not exist
+def uptime():
+    try:
+        with open('/proc/uptime', 'r') as f:
+            return float(f.read().split()[0])
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+
+class Startup:
+    def __init__(self, log=None):
+        self.log = log
+        self.started = time.monotonic()
+        self.bootStarted = uptime()
+
+        # (name, seconds it took)
+        self.stages = []
+        # name -> seconds since started
+        self.marks = {}
+
+    def printMsg(self, s):
+        if self.log is not None:
+            self.log(s)
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def sinceText(self):
+        text = str(int(self.elapsed() * 1000)) + " ms after start"
+        if self.bootStarted is not None:
+            text += ", " + str(round(self.bootStarted + self.elapsed(), 1)) + "s after boot"
+        return text
+
+    # run fn(*args) as a stage, an exception is logged and raised again
+    def run(self, name, fn, *args):
+        started = time.monotonic()
+        try:
+            return fn(*args)
+        except Exception as ex:
+            self.printMsg("startup: " + name + " failed: " + str(ex))
+            raise
+        finally:
+            took = time.monotonic() - started
+            self.stages.append((name, took))
+            self.printMsg("startup: " + name + " took " + str(int(took * 1000)) + " ms, " + self.sinceText())
+
+    def mark(self, name, budget=None):
+        self.marks[name] = self.elapsed()
+        self.printMsg("startup: " + name + " " + self.sinceText())
+        if budget is not None and self.marks[name] > budget:
+            self.printMsg("startup: " + name + " is over its " + str(budget) + "s budget")
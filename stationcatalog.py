@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# stationcatalog.py loads the internet radio stations in
+# all_stations.m3u and searches them.
+#
+# Every line of all_stations.m3u is one station:
+#
+#    station,brief description,long description,stream
+#
+# stationcheck.py adds more columns after the stream, the first one
+# says whether the stream worked. Other extra columns are ignored.
+# Dead stations are kept, alive(i) is False for them.
+#
+# acr.py used to read and split the whole file every time the mode
+# changed to iradio. StationCatalog parses it once and keeps:
+#    - stations, a list of (station, brief, long, stream) tuples in
+#      file order, so an index into it works like the old stationList
+#    - a sorted list of every word in the station, brief and long
+#      fields and the stations each word is in, for prefix search
+#      with bisect
+#    - one lower case string with the text of every station and the
+#      offset where each station starts, for substring search with
+#      str.find
+#
+# The parsed form is saved in a cache file. It is only used while the
+# size and modification time of the .m3u file are the same as when it
+# was saved, otherwise the .m3u file is parsed again. refresh() only
+# costs an os.stat when nothing changed.
+#
+#    catalog = StationCatalog('/home/pi/Stations/playlists/all_stations.m3u',
+#                             '/home/pi/radio/stations.cache')
+#    catalog.refresh()
+#    catalog.search('jazz')           # indexes into catalog.stations
+#    catalog.prefixSearch('new orl')  # every word must start a word
+#    catalog.substringSearch('rleans')
+#
+#########################
+
+import bisect
+import json
+import os
+import re
+
+
+# bump when the cache layout changes
+CACHE_VERSION = 2
+
+# station, brief, long, stream
+FIELDS = 4
+
+# the column stationcheck.py puts after the stream
+STATUS_COLUMN = FIELDS
+STATUS_OK = 'ok'
+STATUS_DEAD = 'dead'
+
+WORD = re.compile(r'\w+')
+
+
+def words(text):
+    return WORD.findall(text.lower())
+
+
+# the text searched for a station, lower case with the fields kept apart
+def searchText(station):
+    return '\t'.join(station[:3]).lower()
+
+
+def fileStamp(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+# returns the stations and the indexes of the dead ones
+def parseCatalog(f, log=None):
+    stations = []
+    dead = []
+    for n, line in enumerate(f, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            # blank line or an m3u comment such as #EXTM3U
+            continue
+        l = line.split(',')
+        if len(l) < FIELDS:
+            if log is not None:
+                log("station line " + str(n) + " has only " + str(len(l)) + " fields")
+            continue
+        if len(l) > STATUS_COLUMN and l[STATUS_COLUMN].strip() == STATUS_DEAD:
+            dead.append(len(stations))
+        stations.append(tuple(x.strip() for x in l[:FIELDS]))
+    return stations, dead
+
+
+def parseStations(f, log=None):
+    return parseCatalog(f, log)[0]
+
+
+class StationCatalog:
+    def __init__(self, path, cacheFile=None, log=None):
+        self.path = path
+        self.cacheFile = cacheFile
+        self.log = log
+
+        self.stamp = None
+        self.stations = []
+        # indexes of stations whose stream did not work
+        self.dead = set()
+        # stream -> index into stations
+        self.streams = {}
+        # vocabulary is sorted, postings[i] lists the stations that have
+        # the word vocabulary[i], in order
+        self.vocabulary = []
+        self.postings = []
+        # text of every station joined with '\n', starts[i] is the
+        # offset of station i
+        self.text = ""
+        self.starts = []
+
+    def printMsg(self, s):
+        if self.log is not None:
+            self.log(s)
+
+    def __len__(self):
+        return len(self.stations)
+
+    # load the catalog if the .m3u file changed, returns True if it did
+    def refresh(self):
+        stamp = fileStamp(self.path)
+        if stamp == self.stamp:
+            return False
+
+        if not self.readCache(stamp):
+            with open(self.path, 'r') as f:
+                stations, dead = parseCatalog(f, self.log)
+            self.build(stations, dead)
+            self.printMsg("Parsed " + str(len(stations)) + " stations")
+            self.writeCache(stamp)
+        self.stamp = stamp
+        return True
+
+    def build(self, stations, dead, vocabulary=None, postings=None):
+        self.stations = stations
+        self.dead = set(dead)
+        self.streams = {}
+        for i, station in enumerate(stations):
+            self.streams.setdefault(station[3], i)
+
+        texts = [searchText(station) for station in stations]
+
+        if vocabulary is None:
+            index = {}
+            for i, t in enumerate(texts):
+                for w in set(words(t)):
+                    if w in index:
+                        index[w].append(i)
+                    else:
+                        index[w] = [i]
+            vocabulary = sorted(index)
+            postings = [index[w] for w in vocabulary]
+        self.vocabulary = vocabulary
+        self.postings = postings
+
+        self.starts = []
+        offset = 0
+        for t in texts:
+            self.starts.append(offset)
+            offset += len(t) + 1
+        self.text = '\n'.join(texts)
+
+    def readCache(self, stamp):
+        if self.cacheFile is None:
+            return False
+        try:
+            with open(self.cacheFile, 'r') as f:
+                cache = json.load(f)
+        except (IOError, OSError, ValueError):
+            return False
+        if cache.get('version') != CACHE_VERSION or cache.get('stamp') != stamp:
+            return False
+
+        stations = [tuple(s) for s in cache['stations']]
+        self.build(stations, cache['dead'], cache['vocabulary'], cache['postings'])
+        self.printMsg("Loaded " + str(len(stations)) + " stations from cache")
+        return True
+
+    def writeCache(self, stamp):
+        if self.cacheFile is None:
+            return
+        cache = {
+            'version': CACHE_VERSION,
+            'stamp': stamp,
+            'stations': self.stations,
+            'dead': sorted(self.dead),
+            'vocabulary': self.vocabulary,
+            'postings': self.postings,
+        }
+        # write a new file and rename it so a crash never leaves half a file
+        tmp = self.cacheFile + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(cache, f, separators=(',', ':'))
+            os.rename(tmp, self.cacheFile)
+        except (IOError, OSError) as ex:
+            self.printMsg("could not write station cache: " + str(ex))
+
+    # False if stationcheck.py found the stream dead
+    def alive(self, i):
+        return i not in self.dead
+
+    # index of the station playing stream, or None
+    def indexOf(self, stream):
+        return self.streams.get(stream)
+
+    # stations with a word starting with every word in query
+    def prefixSearch(self, query):
+        found = None
+        for w in words(query):
+            matches = set()
+            i = bisect.bisect_left(self.vocabulary, w)
+            while i < len(self.vocabulary) and self.vocabulary[i].startswith(w):
+                matches.update(self.postings[i])
+                i += 1
+            if found is None:
+                found = matches
+            else:
+                found &= matches
+            if not found:
+                return []
+        if found is None:
+            return []
+        return sorted(found)
+
+    # stations whose station, brief or long field contains query
+    # stops after limit stations
+    def substringSearch(self, query, limit=None):
+        query = query.lower().strip()
+        found = []
+        if not query:
+            return found
+        text = self.text
+        pos = text.find(query)
+        while pos >= 0:
+            i = bisect.bisect_right(self.starts, pos) - 1
+            found.append(i)
+            if limit is not None and len(found) >= limit:
+                break
+            # one match per station is enough, go on with the next one
+            if i + 1 >= len(self.starts):
+                break
+            pos = text.find(query, self.starts[i + 1])
+        return found
+
+    # prefix matches first, then the other stations containing query
+    def search(self, query, limit=None):
+        found = self.prefixSearch(query)
+        if limit is not None and len(found) >= limit:
+            return found[:limit]
+        seen = set(found)
+        more = None
+        if limit is not None:
+            # enough for limit even if they all are prefix matches too
+            more = limit + len(found)
+        for i in self.substringSearch(query, more):
+            if i not in seen:
+                found.append(i)
+        if limit is not None:
+            found = found[:limit]
+        return found
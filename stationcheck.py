@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# stationcheck.py checks which internet radio streams in
+# all_stations.m3u still work.
+#
+# Finding working stations is difficult and checking them one at a
+# time by hand takes forever. stationcheck.py opens every stream at
+# the same time, a few at once, and records for each one:
+#    - connect time, how long the TCP (and TLS) connection took
+#    - first byte time, from connecting to the first byte of audio
+#    - the Content-Type header
+#    - the bitrate from the icy-br header, if the server sends one
+#
+# all_stations.m3u is then written back with the working stations
+# first, fastest first, and the dead ones at the end. The results
+# are added as extra columns after the stream:
+#
+#    station,brief,long,stream,status,connect ms,first byte ms,content type,bitrate
+#
+# status is ok or dead. #EXTM3U and other comment lines are kept at
+# the top. The old file is kept as all_stations.m3u.bak.
+# acr.py skips dead stations when next and back are pressed in iradio
+# mode, see stationcatalog.py
+#
+# SHOUTcast v1 servers answer ICY 200 OK instead of HTTP/1.0 200 OK,
+# which http.client does not accept, IcyResponse reads it as HTTP/1.0
+#
+# Run it on the Raspberry Pi with:
+#
+#    $ python3 stationcheck.py [all_stations.m3u] [workers]
+#
+# fakestream.py serves fake streams with delays and failures so the
+# checker can be tried without the internet
+#
+#########################
+
+import concurrent.futures
+import http.client
+import os
+import shutil
+import socket
+import sys
+import time
+import urllib.parse
+
+from stationcatalog import parseStations, STATUS_OK, STATUS_DEAD
+
+
+# streams checked at once
+WORKERS = 16
+
+# seconds to wait for a connection and for the first byte
+TIMEOUT = 5.0
+
+# a stream can redirect to the real server a few times
+MAX_REDIRECTS = 3
+
+AUDIO_TYPES = ('audio/', 'application/ogg', 'video/mp2t')
+
+# longest status line read, same as http.client
+MAX_STATUS_LINE = 65536
+
+
+class StreamResult:
+    def __init__(self, url):
+        self.url = url
+        self.ok = False
+        self.status = None
+        self.connectTime = None
+        self.firstByteTime = None
+        self.contentType = ""
+        self.bitrate = None
+        self.error = ""
+
+    # the extra columns written after the stream
+    def columns(self):
+        columns = [STATUS_OK if self.ok else STATUS_DEAD]
+        for t in (self.connectTime, self.firstByteTime):
+            columns.append("" if t is None else str(int(t * 1000)))
+        columns.append(self.contentType)
+        columns.append("" if self.bitrate is None else str(self.bitrate))
+        # commas separate the columns
+        return [c.replace(',', ' ') for c in columns]
+
+
+class IcyResponse(http.client.HTTPResponse):
+    # same as http.client's, with ICY read as HTTP/1.0
+    def _read_status(self):
+        line = str(self.fp.readline(MAX_STATUS_LINE + 1), 'iso-8859-1')
+        if len(line) > MAX_STATUS_LINE:
+            raise http.client.LineTooLong("status line")
+        if not line:
+            raise http.client.RemoteDisconnected("Remote end closed connection without response")
+        if line.startswith('ICY '):
+            line = 'HTTP/1.0 ' + line[len('ICY '):]
+
+        fields = line.split(None, 2)
+        if len(fields) < 2 or not fields[0].startswith('HTTP/'):
+            self._close_conn()
+            raise http.client.BadStatusLine(line)
+        reason = ""
+        if len(fields) > 2:
+            reason = fields[2]
+        try:
+            status = int(fields[1])
+        except ValueError:
+            raise http.client.BadStatusLine(line)
+        if status < 100 or status > 999:
+            raise http.client.BadStatusLine(line)
+        return fields[0], status, reason
+
+
+def isAudio(contentType):
+    return contentType.lower().startswith(AUDIO_TYPES)
+
+
+def openConnection(url, timeout):
+    u = urllib.parse.urlsplit(url)
+    if u.scheme == 'https':
+        conn = http.client.HTTPSConnection(u.hostname, u.port, timeout=timeout)
+    elif u.scheme == 'http':
+        conn = http.client.HTTPConnection(u.hostname, u.port, timeout=timeout)
+    else:
+        raise ValueError("not an http stream: " + url)
+    conn.response_class = IcyResponse
+    path = u.path or '/'
+    if u.query:
+        path += '?' + u.query
+    return conn, path
+
+
+# open url, wait for the first byte of audio and hang up
+def probeStream(url, timeout=TIMEOUT):
+    result = StreamResult(url)
+    try:
+        for redirect in range(MAX_REDIRECTS + 1):
+            conn, path = openConnection(url, timeout)
+            try:
+                started = time.monotonic()
+                conn.connect()
+                result.connectTime = time.monotonic() - started
+                # Icy-MetaData 0 asks shoutcast servers for audio only
+                conn.request('GET', path, headers={'Icy-MetaData': '0', 'User-Agent': 'acr-stationcheck'})
+                response = conn.getresponse()
+                result.status = response.status
+                location = response.getheader('Location')
+                if response.status in (301, 302, 303, 307, 308) and location:
+                    url = urllib.parse.urljoin(url, location)
+                    continue
+
+                result.contentType = response.getheader('Content-Type', '').split(';')[0].strip()
+                br = response.getheader('icy-br', '').split(',')[0].strip()
+                if br.isdigit():
+                    result.bitrate = int(br)
+                if response.status != 200:
+                    result.error = "HTTP " + str(response.status)
+                    return result
+
+                if not response.read(1):
+                    result.error = "no data"
+                    return result
+                result.firstByteTime = time.monotonic() - started
+                if not isAudio(result.contentType):
+                    result.error = "not audio: " + result.contentType
+                    return result
+                result.ok = True
+                return result
+            finally:
+                conn.close()
+        result.error = "too many redirects"
+    except (socket.timeout, http.client.HTTPException, OSError, ValueError) as ex:
+        result.error = str(ex) or ex.__class__.__name__
+    return result
+
+
+# probe every station's stream, returns StreamResults in station order
+def checkStations(stations, workers=WORKERS, timeout=TIMEOUT, log=None):
+    results = [None] * len(stations)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for i, station in enumerate(stations):
+            futures[pool.submit(probeStream, station[3], timeout)] = i
+        for future in concurrent.futures.as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            if log is not None and not results[i].ok:
+                log("dead station " + stations[i][0] + ": " + results[i].error)
+    return results
+
+
+# working stations first, fastest first, then the dead ones in file order
+def rankStations(stations, results):
+    order = list(range(len(stations)))
+    order.sort(key=lambda i: (not results[i].ok, results[i].firstByteTime if results[i].ok else 0, i))
+    return order
+
+
+def writeCatalog(path, stations, results):
+    # #EXTM3U and the other comments stay, at the top since the stations
+    # are reordered
+    lines = []
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            lines = [line.rstrip('\n') + '\n' for line in f if line.strip().startswith('#')]
+    for i in rankStations(stations, results):
+        lines.append(','.join(list(stations[i]) + results[i].columns()) + '\n')
+
+    # keep the old file and never leave half a file behind
+    if os.path.exists(path):
+        shutil.copy2(path, path + '.bak')
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.writelines(lines)
+    os.rename(tmp, path)
+
+
+def checkCatalog(path, workers=WORKERS, timeout=TIMEOUT, log=None):
+    with open(path, 'r') as f:
+        stations = parseStations(f, log)
+    started = time.monotonic()
+    results = checkStations(stations, workers, timeout, log)
+    took = time.monotonic() - started
+    writeCatalog(path, stations, results)
+    ok = sum(1 for r in results if r.ok)
+    if log is not None:
+        log("checked " + str(len(results)) + " stations in " + str(round(took, 1)) + "s, " + str(ok) + " ok")
+    return results
+
+
+if __name__ == '__main__':
+    path = '/home/pi/Stations/playlists/all_stations.m3u'
+    workers = WORKERS
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+    if len(sys.argv) > 2:
+        workers = int(sys.argv[2])
+    checkCatalog(path, workers, log=print)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# test_alarmscheduler.py checks when alarms go off: nextFireTime for
+# times and weekdays, and AlarmScheduler calling prepare and fire in
+# order, and not for a removed alarm. The scheduler tests replace
+# nextFireTime so the alarms go off within a second instead of at the
+# next whole minute
+#
+#    $ python3 -m pytest test_alarmscheduler.py
+#
+#########################
+
+import datetime
+import threading
+import time
+
+import pytest
+
+import alarmscheduler
+from alarmscheduler import AlarmScheduler, nextFireTime, untilText
+from alarmstore import Alarm
+
+
+def timestamp(*args):
+    return time.mktime(datetime.datetime(*args).timetuple())
+
+
+def test_laterToday():
+    # Saturday 2026-10-17 05:00
+    alarm = Alarm(1, 6, 30)
+    assert nextFireTime(alarm, datetime.datetime(2026, 10, 17, 5, 0)) == timestamp(2026, 10, 17, 6, 30)
+
+
+def test_passedGoesTomorrow():
+    alarm = Alarm(1, 6, 30)
+    assert nextFireTime(alarm, datetime.datetime(2026, 10, 17, 6, 30)) == timestamp(2026, 10, 18, 6, 30)
+    assert nextFireTime(alarm, datetime.datetime(2026, 10, 17, 23, 59)) == timestamp(2026, 10, 18, 6, 30)
+
+
+def test_weekdays():
+    # crontab days, Sunday is 0, Monday 1
+    weekdays = Alarm(1, 6, 30, weekdays=[1, 2, 3, 4, 5])
+    assert nextFireTime(weekdays, datetime.datetime(2026, 10, 17, 5, 0)) == timestamp(2026, 10, 19, 6, 30)
+    sunday = Alarm(2, 9, 0, weekdays=[7])
+    assert nextFireTime(sunday, datetime.datetime(2026, 10, 17, 5, 0)) == timestamp(2026, 10, 18, 9, 0)
+
+
+def test_untilText():
+    assert untilText(0) == "0m"
+    assert untilText(61) == "2m"
+    assert untilText(3600) == "1h 0m"
+    assert untilText(7 * 3600 + 12 * 60) == "7h 12m"
+    assert untilText(25 * 3600) == "1d 1h"
+
+
+# each alarm goes off once, at the time in times
+@pytest.fixture
+def times(monkeypatch):
+    times = {}
+    def fireTime(alarm, after):
+        when = times.get(alarm.id)
+        if when is None or when <= after.timestamp():
+            return None
+        return when
+    monkeypatch.setattr(alarmscheduler, 'nextFireTime', fireTime)
+    return times
+
+
+class Calls:
+    def __init__(self):
+        self.calls = []
+        self.event = threading.Event()
+
+    def record(self, kind):
+        def call(alarm, when):
+            self.calls.append((kind, alarm.id, when))
+            self.event.set()
+        return call
+
+
+def test_preparesThenFires(times):
+    calls = Calls()
+    scheduler = AlarmScheduler(calls.record("fire"), calls.record("prepare"))
+    alarm = Alarm(1, 6, 30, source='iradio', lead=0.2)
+    times[1] = time.time() + 0.4
+    scheduler.setAlarms([alarm])
+    assert scheduler.next() == (alarm, times[1])
+    scheduler.start()
+    try:
+        deadline = time.monotonic() + 5
+        while len(calls.calls) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        scheduler.stop()
+    assert calls.calls == [("prepare", 1, times[1]), ("fire", 1, times[1])]
+    assert scheduler.fired == 1
+    assert scheduler.next() == (None, None)
+
+
+def test_removedAlarmDoesNotFire(times):
+    calls = Calls()
+    scheduler = AlarmScheduler(calls.record("fire"))
+    times[1] = time.time() + 0.3
+    times[2] = time.time() + 0.3
+    scheduler.setAlarms([Alarm(1, 6, 30), Alarm(2, 7, 0)])
+    scheduler.remove(1)
+    scheduler.start()
+    try:
+        assert calls.event.wait(5)
+        time.sleep(0.1)
+    finally:
+        scheduler.stop()
+    assert [c[1] for c in calls.calls] == [2]
+
+
+def test_nextIsTheSoonest(times):
+    scheduler = AlarmScheduler(lambda alarm, when: None)
+    now = time.time()
+    alarms = [Alarm(1, 6, 30), Alarm(2, 7, 0), Alarm(3, 8, 0)]
+    times.update({1: now + 300, 2: now + 100, 3: now + 200})
+    scheduler.setAlarms(alarms)
+    assert scheduler.next() == (alarms[1], now + 100)
+    scheduler.remove(2)
+    assert scheduler.next() == (alarms[2], now + 200)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# test_coalesce.py checks that Coalescer turns a burst of presses into
+# one command, sends at least every maxDelay seconds and that flush()
+# sends what is pending. A fake clock and widget stand in for time and
+# tkinter's after()
+#
+#    $ python3 -m pytest test_coalesce.py
+#
+#########################
+
+import pytest
+
+import coalesce
+from coalesce import Coalescer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+# after() and after_cancel() like a tkinter widget, the jobs run when
+# advance() moves the clock past them
+class FakeWidget:
+    def __init__(self, clock):
+        self.clock = clock
+        self.jobs = {}
+        self.nextJob = 0
+
+    def after(self, ms, fn, *args):
+        self.nextJob += 1
+        job = 'after#' + str(self.nextJob)
+        self.jobs[job] = (self.clock.now + ms / 1000.0, fn, args)
+        return job
+
+    def after_cancel(self, job):
+        self.jobs.pop(job, None)
+
+    def advance(self, seconds):
+        end = self.clock.now + seconds
+        while True:
+            due = [(t, job) for job, (t, fn, args) in self.jobs.items() if t <= end]
+            if not due:
+                break
+            t, job = min(due)
+            self.clock.now = max(self.clock.now, t)
+            when, fn, args = self.jobs.pop(job)
+            fn(*args)
+        self.clock.now = end
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = FakeClock()
+    monkeypatch.setattr(coalesce.time, 'monotonic', c.monotonic)
+    return c
+
+
+@pytest.fixture
+def widget(clock):
+    return FakeWidget(clock)
+
+
+def test_burstSendsOnce(widget):
+    coalescer = Coalescer(widget, delay=0.15, maxDelay=0.6)
+    sent = []
+    for i in range(5):
+        coalescer.press("volume", lambda i=i: sent.append(i))
+        widget.advance(0.05)
+    assert sent == []
+    widget.advance(0.15)
+    # the function from the last press is the one sent
+    assert sent == [4]
+    assert coalescer.stats()['volume'] == {'presses': 5, 'sent': 1, 'saved': 4}
+    assert coalescer.saved() == 4
+
+
+def test_heldButtonSendsEveryMaxDelay(widget):
+    coalescer = Coalescer(widget, delay=0.15, maxDelay=0.6)
+    sent = []
+    for i in range(20):
+        coalescer.press("volume", lambda: sent.append(widget.clock.now))
+        widget.advance(0.1)
+    widget.advance(1)
+    # 2 seconds of presses, so a send at least every 0.6 seconds
+    assert len(sent) >= 3
+    gaps = [b - a for a, b in zip(sent, sent[1:])]
+    assert max(gaps) <= 0.6 + 1e-9
+
+
+def test_keysAreIndependent(widget):
+    coalescer = Coalescer(widget, delay=0.15, maxDelay=0.6)
+    sent = []
+    coalescer.press("volume", lambda: sent.append("volume"))
+    coalescer.press("tune", lambda: sent.append("tune"))
+    coalescer.press("volume", lambda: sent.append("volume"))
+    widget.advance(0.2)
+    assert sorted(sent) == ["tune", "volume"]
+
+
+def test_flushSendsPendingNow(widget):
+    coalescer = Coalescer(widget, delay=0.15, maxDelay=0.6)
+    sent = []
+    coalescer.press("skip", lambda: sent.append("skip"))
+    coalescer.press("volume", lambda: sent.append("volume"))
+    coalescer.flush()
+    assert sorted(sent) == ["skip", "volume"]
+    assert not coalescer.pending
+    # the timers were cancelled, nothing is sent twice
+    widget.advance(1)
+    assert len(sent) == 2
+
+
+def test_failingSendIsLogged(widget):
+    logged = []
+    coalescer = Coalescer(widget, log=logged.append)
+    def fail():
+        raise IOError("mixer gone")
+    coalescer.press("volume", fail)
+    widget.advance(1)
+    assert len(logged) == 1 and "mixer gone" in logged[0]
+    assert not coalescer.pending
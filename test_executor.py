@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# test_executor.py checks CommandExecutor: commands run in order, a
+# command with a key supersedes older ones with the same key, and
+# onDone and onError are delivered through post
+#
+#    $ python3 -m pytest test_executor.py
+#
+#########################
+
+import threading
+
+import pytest
+
+from executor import CommandExecutor, cancelled
+
+
+@pytest.fixture
+def executor():
+    e = CommandExecutor()
+    yield e
+    e.stop()
+
+
+# a command that holds the worker until release() is called
+class Gate:
+    def __init__(self):
+        self.started = threading.Event()
+        self.released = threading.Event()
+
+    def hold(self):
+        self.started.set()
+        self.released.wait(5)
+
+    def release(self):
+        self.released.set()
+
+
+def test_runsInOrder(executor):
+    ran = []
+    for i in range(5):
+        executor.submit("append", ran.append, (i,))
+    assert executor.wait(5)
+    assert ran == [0, 1, 2, 3, 4]
+
+
+def test_onDoneGetsResult(executor):
+    results = []
+    executor.submit("add", lambda a, b: a + b, (2, 3), onDone=results.append)
+    assert executor.wait(5)
+    assert results == [5]
+
+
+def test_onErrorGetsException(executor):
+    errors = []
+    def fail():
+        raise IOError("no ack")
+    executor.submit("fail", fail, onDone=lambda result: errors.append("done"), onError=errors.append)
+    assert executor.wait(5)
+    assert len(errors) == 1 and isinstance(errors[0], IOError)
+    assert executor.stats()['fail']['errors'] == 1
+
+
+def test_postDeliversCallbacks():
+    posted = []
+    e = CommandExecutor(post=lambda fn, *args: posted.append((fn, args)))
+    try:
+        results = []
+        e.submit("one", lambda: 1, onDone=results.append)
+        assert e.wait(5)
+        # nothing runs until the tkinter thread calls what was posted
+        assert results == []
+        fn, args = posted[0]
+        fn(*args)
+        assert results == [1]
+    finally:
+        e.stop()
+
+
+def test_keyDropsQueuedCommands(executor):
+    gate = Gate()
+    executor.submit("hold", gate.hold)
+    assert gate.started.wait(5)
+
+    tuned = []
+    for channel in (947, 955, 1023):
+        executor.submit("tune", tuned.append, (channel,), key="tune")
+    assert executor.queueDepth() == 2
+    gate.release()
+    assert executor.wait(5)
+    assert tuned == [1023]
+    assert executor.stats()['tune']['cancelled'] == 2
+
+
+def test_keyCancelsRunningCommand(executor):
+    started = threading.Event()
+    seen = []
+    done = []
+    def tune():
+        started.set()
+        while not cancelled():
+            threading.Event().wait(0.01)
+        seen.append("cancelled")
+
+    executor.submit("tune", tune, key="tune", onDone=done.append)
+    assert started.wait(5)
+    executor.submit("tune", lambda: "second", key="tune", onDone=done.append)
+    assert executor.wait(5)
+    assert seen == ["cancelled"]
+    # a cancelled command's onDone is not delivered
+    assert done == ["second"]
+
+
+def test_cancelWithoutNewCommand(executor):
+    gate = Gate()
+    executor.submit("hold", gate.hold, key="scan")
+    assert gate.started.wait(5)
+    ran = []
+    executor.submit("scan", ran.append, (1,), key="scan")
+
+    assert executor.cancel("scan")
+    assert not executor.cancel("scan")
+    assert not executor.cancel("tune")
+    gate.release()
+    assert executor.wait(5)
+    assert ran == []
+
+
+def test_waitTimesOut(executor):
+    gate = Gate()
+    executor.submit("hold", gate.hold)
+    assert gate.started.wait(5)
+    assert not executor.wait(0.05)
+    assert executor.queueDepth() == 1
+    gate.release()
+    assert executor.wait(5)
+    assert executor.queueDepth() == 0
+
+
+def test_stats(executor):
+    for i in range(3):
+        executor.submit("volume", lambda: None)
+    assert executor.wait(5)
+    s = executor.stats()['volume']
+    assert s['count'] == 3
+    assert s['cancelled'] == 0
+    assert s['runMax'] >= s['runLast'] >= 0
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# test_rds.py checks RdsDecoder on the groups fakesi4703.py sends, and
+# RdsPoller reading them from the simulated Si4703
+#
+#    $ python3 -m pytest test_rds.py
+#
+#########################
+
+import threading
+import time
+
+from fakesi4703 import SimulatedSi4703Bus, rdsGroups
+from fmscan import channelOf
+from rds import RdsDecoder, RdsPoller, BLER_UNCORRECTABLE
+from si4703 import Si4703, SYSCONFIG1, RDS
+
+
+PS_GROUPS = 4
+
+
+# decode groups in order, returns how many times decode() said
+# something changed
+def feed(decoder, groups, errors=(0, 0, 0, 0)):
+    changed = 0
+    for a, b, c, d in groups:
+        if decoder.decode(a, b, c, d, errors):
+            changed += 1
+    return changed
+
+
+def test_stationNameNeedsTwoReceptions():
+    decoder = RdsDecoder()
+    groups = rdsGroups('KGSR', '')[:PS_GROUPS]
+    assert feed(decoder, groups) == 0
+    assert decoder.ps == ""
+    assert feed(decoder, groups) == 1
+    assert decoder.ps == "KGSR"
+    # the same name again is not a change
+    assert feed(decoder, groups) == 0
+
+
+def test_radioText():
+    decoder = RdsDecoder()
+    groups = rdsGroups('KGSR', 'Now playing on 94.7')[PS_GROUPS:]
+    assert feed(decoder, groups) == 1
+    assert decoder.radioText == "Now playing on 94.7"
+
+
+def test_newTextFlagStartsOver():
+    decoder = RdsDecoder()
+    feed(decoder, rdsGroups('KGSR', 'First song')[PS_GROUPS:])
+    assert decoder.radioText == "First song"
+    # the A/B flag is bit 4 of block B
+    second = [(a, b | 0x10, c, d) for a, b, c, d in rdsGroups('KGSR', 'Second')[PS_GROUPS:]]
+    assert feed(decoder, second) == 1
+    assert decoder.radioText == "Second"
+
+
+def test_badBlocksAreIgnored():
+    decoder = RdsDecoder()
+    groups = rdsGroups('KGSR', 'Now playing')
+    assert feed(decoder, groups * 2, errors=(0, 2, 0, 0)) == 0
+    assert feed(decoder, groups * 2, errors=(0, 0, BLER_UNCORRECTABLE, BLER_UNCORRECTABLE)) == 0
+    assert decoder.ps == "" and decoder.radioText == ""
+    assert decoder.groups == len(groups) * 2
+
+
+def test_reset():
+    decoder = RdsDecoder()
+    feed(decoder, rdsGroups('KGSR', 'Now playing') * 2)
+    decoder.reset()
+    assert decoder.ps == "" and decoder.radioText == ""
+    # a reset decoder needs two receptions again
+    assert feed(decoder, rdsGroups('KUTX', '')[:PS_GROUPS]) == 0
+
+
+def tunedRadio(freq):
+    bus = SimulatedSi4703Bus(tuneTime=0.01)
+    radio = Si4703(bus)
+    radio.readAll()
+    radio.update(SYSCONFIG1, RDS, RDS)
+    radio.flush()
+    assert radio.tune(channelOf(freq))
+    return radio
+
+
+def test_pollerReadsStation():
+    radio = tunedRadio(947)
+    got = []
+    event = threading.Event()
+    def changed(ps, radioText):
+        got.append((ps, radioText))
+        if ps and radioText:
+            event.set()
+    poller = RdsPoller(radio, changed, interval=0.01)
+    poller.start()
+    poller.resume()
+    try:
+        assert event.wait(10)
+    finally:
+        poller.stop()
+    assert got[-1] == ('KGSR', 'Now playing on 94.7')
+
+
+def test_pollNeverWaitsForTheRadio():
+    radio = tunedRadio(947)
+    poller = RdsPoller(radio, lambda ps, radioText: None)
+    held = threading.Event()
+    done = threading.Event()
+    def tune():
+        with radio.lock:
+            held.set()
+            done.wait(5)
+    t = threading.Thread(target=tune)
+    t.start()
+    try:
+        assert held.wait(5)
+        started = time.monotonic()
+        assert not poller.pollOnce()
+        assert time.monotonic() - started < 0.5
+        assert poller.polls == 0
+    finally:
+        done.set()
+        t.join(5)
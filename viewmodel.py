@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# viewmodel.py keeps what the screen shows in one place and only
+# redraws the widgets that changed.
+#
+# acr.py used to call StringVar.set and configure(image=...) every time
+# something might have changed, even when it had not. Each call makes
+# tkinter lay out and redraw the widget, which is slow on the PiTFT
+# framebuffer, and a button press could redraw the same widget three
+# times.
+#
+# ViewModel holds the shown value for each name (the mode, play state,
+# alarm, song text, time, ...). Widgets bind a function to a name, and
+# set() changes the value:
+#
+#    view = ViewModel(radioGUI)
+#    view.bind("mode", lambda mode: modeButton.configure(image=modeImages[mode]))
+#    view.set("mode", "fm")
+#
+#    - setting a name to the value it already has does nothing
+#    - changes are applied together, at most once a frame (FPS times a
+#      second), by a tkinter after job
+#    - a name changed twice before the frame is drawn is only drawn once,
+#      with its last value
+#
+# stats() counts the sets, the frames drawn, the widget updates and the
+# redraws that were skipped
+#
+#########################
+
+import time
+
+
+FPS = 30
+
+
+class ViewModel:
+    def __init__(self, widget, fps=FPS, log=None):
+        self.widget = widget
+        self.frame = 1.0 / fps
+        self.log = log
+
+        # name -> value on the screen, or that will be after the next frame
+        self.values = {}
+        # name -> [function]
+        self.bindings = {}
+        # names changed since the last frame, in the order they changed
+        self.dirty = []
+        self.job = None
+        self.lastFlush = 0.0
+
+        self.sets = 0
+        self.flushes = 0
+        self.updates = 0
+        # sets that did not change anything
+        self.unchanged = 0
+        # changes replaced by a newer change before they were drawn
+        self.superseded = 0
+
+    def printMsg(self, s):
+        if self.log is not None:
+            self.log(s)
+
+    # fn(value) is called in the tkinter main loop whenever name changes
+    def bind(self, name, fn):
+        self.bindings.setdefault(name, []).append(fn)
+        if name in self.values:
+            self.markDirty(name)
+
+    def get(self, name, default=None):
+        return self.values.get(name, default)
+
+    def set(self, name, value):
+        self.sets += 1
+        if name in self.values and self.values[name] == value:
+            self.unchanged += 1
+            return
+        self.values[name] = value
+        if name in self.dirty:
+            self.superseded += 1
+            return
+        self.markDirty(name)
+
+    def update(self, **values):
+        for name, value in values.items():
+            self.set(name, value)
+
+    def markDirty(self, name):
+        if name not in self.dirty:
+            self.dirty.append(name)
+        if self.job is None:
+            wait = max(self.lastFlush + self.frame - time.monotonic(), 0)
+            self.job = self.widget.after(int(wait * 1000), self.flush)
+
+    # draw every change since the last frame, can also be called to
+    # draw them right away
+    def flush(self):
+        if self.job is not None:
+            self.widget.after_cancel(self.job)
+        self.job = None
+        self.lastFlush = time.monotonic()
+        dirty = self.dirty
+        self.dirty = []
+        if dirty:
+            self.flushes += 1
+        for name in dirty:
+            value = self.values[name]
+            for fn in self.bindings.get(name, ()):
+                self.updates += 1
+                try:
+                    fn(value)
+                except Exception as ex:
+                    self.printMsg("redrawing " + name + " failed: " + str(ex))
+
+    def stats(self):
+        return {
+            'sets': self.sets,
+            'flushes': self.flushes,
+            'updates': self.updates,
+            'skipped': self.unchanged + self.superseded,
+        }
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+#########################
+#
+# watchdog.py finds out what is blocking the tkinter main loop.
+#
+# While a callback runs nothing else happens in the main loop: the
+# clock stops and the buttons do not respond. A callback that waits
+# for I2C, mpd or a file freezes the whole screen, and nothing said
+# which one it was.
+#
+# Watchdog has two parts:
+#    - a heartbeat, an after job in the main loop every interval
+#      seconds that records when it ran
+#    - a sampler thread, that wakes up when the next heartbeat is
+#      threshold seconds late. While the heartbeat stays late it reads
+#      the main thread's stack with sys._current_frames() every
+#      sampleInterval seconds
+# When the heartbeat comes back the stall is logged with how long it
+# lasted, the callback tkinter was running (the handler) and the line
+# it was waiting in most of the time:
+#
+#    watchdog = Watchdog(radioGUI, log=printMsg)
+#    watchdog.start()
+#    ...
+#    for line in watchdog.report():
+#        printMsg(line)
+#
+# report() ranks the handlers by the total time they blocked the main
+# loop. Watchdog must be created on the thread that runs mainloop()
+#
+#########################
+
+import collections
+import os
+import sys
+import threading
+import time
+import traceback
+import tkinter
+
+
+TKINTER_DIR = os.path.dirname(tkinter.__file__)
+
+# files whose functions only pass a callback on, replay.py records
+# every press, the handler is the first frame below them
+WRAPPER_FILES = ('replay.py',)
+
+
+# "function (file:line)"
+def frameText(f):
+    return f.name + " (" + os.path.basename(f.filename) + ":" + str(f.lineno) + ")"
+
+
+# the callback tkinter called and the line the stack is in now
+def blockedIn(frame):
+    stack = traceback.extract_stack(frame)
+    handler = None
+    for i in range(len(stack) - 1):
+        # the frame just inside tkinter's code is the callback
+        if stack[i].filename.startswith(TKINTER_DIR) and not stack[i + 1].filename.startswith(TKINTER_DIR):
+            j = i + 1
+            while j < len(stack) - 1 and os.path.basename(stack[j].filename) in WRAPPER_FILES:
+                j += 1
+            handler = stack[j]
+    if handler is None and stack:
+        # not in a callback, e.g. still starting up
+        handler = stack[0]
+    if not stack:
+        return "unknown", "unknown"
+    # without the line, so a handler is one offender wherever it waits
+    return handler.name + " (" + os.path.basename(handler.filename) + ")", frameText(stack[-1])
+
+
+class Offender:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        # where it was waiting -> samples
+        self.lines = collections.Counter()
+
+
+class Watchdog:
+    def __init__(self, widget, interval=0.5, threshold=0.5, sampleInterval=0.1, log=None):
+        self.widget = widget
+        self.interval = interval
+        self.threshold = threshold
+        self.sampleInterval = sampleInterval
+        self.log = log
+
+        self.mainThread = threading.get_ident()
+        self.lastBeat = time.monotonic()
+        self.job = None
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = None
+
+        # handler -> Offender
+        self.offenders = {}
+        self.stalls = 0
+
+    def printMsg(self, s):
+        if self.log is not None:
+            self.log(s)
+
+    def start(self):
+        self.lastBeat = time.monotonic()
+        self.job = self.widget.after(int(self.interval * 1000), self.beat)
+        self.thread = threading.Thread(target=self.run, name='watchdog')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        if self.job is not None:
+            try:
+                self.widget.after_cancel(self.job)
+            except tkinter.TclError:
+                pass
+            self.job = None
+        if self.thread is not None:
+            self.thread.join(1)
+
+    def beat(self):
+        self.lastBeat = time.monotonic()
+        self.job = self.widget.after(int(self.interval * 1000), self.beat)
+
+    def sample(self):
+        frame = sys._current_frames().get(self.mainThread)
+        if frame is None:
+            return None
+        return blockedIn(frame)
+
+    # beat is the heartbeat from before the stall, samples are
+    # (handler, line)
+    def record(self, beat, samples):
+        blocked = self.lastBeat - beat - self.interval
+        if not samples or blocked < self.threshold:
+            return
+        self.stalls += 1
+        handlers = collections.Counter(h for h, line in samples)
+        handler = handlers.most_common(1)[0][0]
+        lines = collections.Counter(line for h, line in samples if h == handler)
+        o = self.offenders.get(handler)
+        if o is None:
+            o = Offender()
+            self.offenders[handler] = o
+        o.count += 1
+        o.total += blocked
+        o.max = max(o.max, blocked)
+        o.lines.update(lines)
+        self.printMsg("main loop blocked " + str(round(blocked, 2)) + "s by " + handler + ", waiting in " + lines.most_common(1)[0][0])
+
+    def run(self):
+        with self.condition:
+            while not self.stopped:
+                beat = self.lastBeat
+                # sleep until the heartbeat is threshold late
+                late = beat + self.interval + self.threshold - time.monotonic()
+                if late > 0:
+                    self.condition.wait(late)
+                    continue
+
+                samples = []
+                while not self.stopped and self.lastBeat == beat:
+                    s = self.sample()
+                    if s is not None:
+                        samples.append(s)
+                    self.condition.wait(self.sampleInterval)
+                if not self.stopped:
+                    self.record(beat, samples)
+
+    # worst first, one line each
+    def report(self, top=10):
+        ranked = sorted(self.offenders.items(), key=lambda item: -item[1].total)[:top]
+        lines = []
+        for handler, o in ranked:
+            line = handler + ": blocked " + str(o.count) + " times, " + str(round(o.total, 2)) + "s in all, " + str(round(o.max, 2)) + "s at most"
+            if o.lines:
+                line += ", mostly in " + o.lines.most_common(1)[0][0]
+            lines.append(line)
+        return lines